@@ -1,8 +1,8 @@
 from .menu_handlers import main_menu_keyboard, back_to_main_menu_keyboard, summary_menu_keyboard, my_profile_menu_keyboard, upgrade_to_pro_menu_keyboard
 from .expense_handlers import (
     start_expense_logging, enter_expense_details, select_category, add_custom_category, cancel,
-    CHOOSING_LOG_TYPE, ENTER_EXPENSE_DETAILS, SELECT_CATEGORY, ADD_CUSTOM_CATEGORY, UPLOAD_RECEIPT,
-    prompt_manual_entry, start_ocr_logging, upload_receipt
+    CHOOSING_LOG_TYPE, ENTER_EXPENSE_DETAILS, SELECT_CATEGORY, ADD_CUSTOM_CATEGORY, UPLOAD_RECEIPT, BULK_ENTRY, CONFIRM_BULK,
+    prompt_manual_entry, start_ocr_logging, upload_receipt, prompt_bulk_entry, enter_bulk_expenses, confirm_bulk_expenses
 )
 from .income_handlers import (
     start_income_logging, enter_income_details, cancel_income,
@@ -12,7 +12,7 @@ from .subscription_handlers import (
     check_subscription_status, upgrade_confirm, cancel_subscription_op, verify_payment_handler
 )
 from .summary_handlers import (
-    generate_today_summary, generate_weekly_summary, generate_monthly_summary
+    generate_today_summary, generate_weekly_summary, generate_monthly_summary, generate_spending_heatmap
 )
 from .budget_handlers import (
     start_set_budget, choose_budget_period, enter_budget_amount, choose_budget_category, cancel_budget_op,
@@ -35,10 +35,14 @@ from .misc_handlers import (
     change_currency_handler,
     set_currency_handler,
     CHANGE_CURRENCY,
-    features_handler, help_handler, export_logs_handler
+    features_handler, help_handler
 )
 from .transaction_handlers import (
     transaction_history_handler, show_next_transactions, show_prev_transactions,
     VIEW_TRANSACTIONS, CLEAR_HISTORY_MENU, CONFIRM_CLEAR_HISTORY, # Add new states
     clear_history_menu_handler, execute_clear_history, cancel_clear_history # Add new handlers
 )
+from .search_handlers import search_command, search_page_callback
+from .export_handlers import export_logs_handler, export_format_handler, export_range_handler
+from .import_handlers import start_import, receive_import_file, AWAIT_IMPORT_FILE
+from .identity_handlers import resolve_identity, get_identity, refresh_identity, IDENTITY_HANDLER_GROUP
@@ -1,8 +1,11 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters
-from models import SessionLocal
-from services import BudgetService, ExpenseService, ProfileService, UserService, UserService
-from .menu_handlers import back_to_main_menu_keyboard
+from models import SessionLocal, WriteSessionLocal
+from services import BudgetService
+from .menu_handlers import back_to_main_menu_keyboard, budget_category_keyboard
+from services.category_cache import category_cache
+from .identity_handlers import get_identity
+from utils.scratch_store import scratch_set, scratch_get, scratch_clear
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,14 +13,11 @@ logger = logging.getLogger(__name__)
 # States for budget setting conversation
 CHOOSE_BUDGET_PERIOD, ENTER_BUDGET_AMOUNT, CHOOSE_BUDGET_CATEGORY = range(3)
 
+BUDGET_DRAFT_EXPIRED_MESSAGE = "This budget setup has expired. Please start setting your budget again."
+
 async def start_set_budget(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the budget setting conversation."""
-    db_session = SessionLocal()
-    profile_service = ProfileService(db_session)
-    user_service = UserService(db_session)
-
-    user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
+    user, current_profile = get_identity(update, context)
     
     if not user:
         message = "It looks like you haven't started yet. Please use the /start command to begin!"
@@ -26,11 +26,8 @@ async def start_set_budget(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             await update.callback_query.edit_message_text(message)
         else:
             await update.message.reply_text(message)
-        db_session.close()
         return ConversationHandler.END
 
-    current_profile = profile_service.get_current_profile(user_telegram_id)
-
     if not current_profile:
         message = "You need to select a profile first. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'."
         if update.callback_query:
@@ -38,7 +35,6 @@ async def start_set_budget(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             await update.callback_query.edit_message_text(message, reply_markup=back_to_main_menu_keyboard())
         else:
             await update.message.reply_text(message, reply_markup=back_to_main_menu_keyboard())
-        db_session.close()
         return ConversationHandler.END
 
     query = update.callback_query
@@ -63,7 +59,6 @@ async def start_set_budget(update: Update, context: ContextTypes.DEFAULT_TYPE) -
                 [InlineKeyboardButton("Cancel", callback_data="cancel")]
             ])
         )
-    db_session.close()
     return CHOOSE_BUDGET_PERIOD
 
 async def choose_budget_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -72,7 +67,7 @@ async def choose_budget_period(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     period = query.data.split('_')[-1]
-    context.user_data['budget_period'] = period
+    scratch_set(context.user_data, 'budget_draft', {"period": period})
     
     await query.edit_message_text(
         f"You selected a {period} budget. Please enter the budget amount (e.g., 50000).",
@@ -93,16 +88,15 @@ async def enter_budget_amount(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return ENTER_BUDGET_AMOUNT
     
-    context.user_data['budget_amount'] = amount
+    draft = scratch_get(context.user_data, 'budget_draft')
+    if draft is None:
+        await update.message.reply_text(BUDGET_DRAFT_EXPIRED_MESSAGE, reply_markup=back_to_main_menu_keyboard())
+        return ConversationHandler.END
+    draft['amount'] = amount
 
     db_session = SessionLocal()
-    expense_service = ExpenseService(db_session)
-    profile_service = ProfileService(db_session)
-    user_service = UserService(db_session) # Also get user service here
 
-    user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
-    current_profile = profile_service.get_current_profile(user_telegram_id)
+    user, current_profile = get_identity(update, context)
     
     if not user or not current_profile:
         await update.message.reply_text(
@@ -112,19 +106,11 @@ async def enter_budget_amount(update: Update, context: ContextTypes.DEFAULT_TYPE
         db_session.close()
         return ConversationHandler.END
 
-    categories = expense_service.get_categories(current_profile.id)
+    reply_markup = budget_category_keyboard(db_session, current_profile.id)
     db_session.close()
 
-    keyboard = []
-    for category in categories:
-        keyboard.append([InlineKeyboardButton(category.name, callback_data=f"budget_category_{category.id}")])
-    keyboard.append([InlineKeyboardButton("Overall Budget", callback_data="budget_category_none")]) # For overall budget
-    keyboard.append([InlineKeyboardButton("Cancel", callback_data="cancel")])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
-        f"You set a {context.user_data['budget_period']} budget of ₦{amount:,.2f}.\n"
+        f"You set a {draft['period']} budget of ₦{amount:,.2f}.\n"
         "Would you like to apply this to a specific category, or make it an overall budget?",
         reply_markup=reply_markup
     )
@@ -138,13 +124,8 @@ async def choose_budget_category(update: Update, context: ContextTypes.DEFAULT_T
     category_id = None
     category_name = "Overall"
 
-    db_session = SessionLocal()
-    expense_service = ExpenseService(db_session)
-    profile_service = ProfileService(db_session)
-    user_service = UserService(db_session) # Also get user service here
-    user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
-    current_profile = profile_service.get_current_profile(user_telegram_id)
+    db_session = WriteSessionLocal()
+    user, current_profile = get_identity(update, context)
 
     if not user or not current_profile:
         await query.edit_message_text(
@@ -156,7 +137,7 @@ async def choose_budget_category(update: Update, context: ContextTypes.DEFAULT_T
 
     if query.data != "budget_category_none":
         category_id = int(query.data.split('_')[-1])
-        category = expense_service.get_category_by_id(category_id)
+        category = category_cache.find(db_session, current_profile.id, category_id)
         if category:
             category_name = category.name
         else:
@@ -166,16 +147,21 @@ async def choose_budget_category(update: Update, context: ContextTypes.DEFAULT_T
 
     budget_service = BudgetService(db_session)
     
-    period = context.user_data['budget_period']
-    amount = context.user_data['budget_amount']
+    draft = scratch_get(context.user_data, 'budget_draft')
+    if draft is None or 'amount' not in draft:
+        await query.edit_message_text(BUDGET_DRAFT_EXPIRED_MESSAGE, reply_markup=back_to_main_menu_keyboard())
+        db_session.close()
+        return ConversationHandler.END
+    period, amount = draft['period'], draft['amount']
 
     budget = budget_service.set_budget(current_profile.id, amount, period, category_id)
 
     await query.edit_message_text(
-        f"Successfully set a {period} budget of ₦{amount:,.2f} for '{category_name}'.",
+        f"Successfully set a {period} budget of ₦{amount:,.2f} for '{category_name}'. It renews automatically every period.",
         reply_markup=back_to_main_menu_keyboard()
     )
     db_session.close()
+    scratch_clear(context.user_data, 'budget_draft')
     return ConversationHandler.END
 
 async def cancel_budget_op(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -186,4 +172,5 @@ async def cancel_budget_op(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await query.edit_message_text("Budget setting cancelled. Returning to main menu.", reply_markup=back_to_main_menu_keyboard())
     else:
         await update.message.reply_text("Budget setting cancelled. Returning to main menu.", reply_markup=back_to_main_menu_keyboard())
+    scratch_clear(context.user_data, 'budget_draft')
     return ConversationHandler.END
@@ -1,9 +1,14 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from models import SessionLocal
-from services import ExpenseService, UserService, SubscriptionService, ProfileService, OCRService
+from models import WriteSessionLocal
+from services import ExpenseService, SubscriptionService, OCRService
+from services.expense_service import FREE_MONTHLY_EXPENSE_LIMIT, BULK_EXPENSE_MAX_LINES
 from utils.misc_utils import get_currency_symbol # Import get_currency_symbol
-from .menu_handlers import back_to_main_menu_keyboard
+from utils.scratch_store import scratch_set, scratch_get, scratch_clear
+from .menu_handlers import back_to_main_menu_keyboard, expense_category_keyboard
+from services.category_cache import category_cache
+from .identity_handlers import get_identity
+from jobs.budget_alert_jobs import queue_budget_alerts
 import logging
 import io
 import json
@@ -15,22 +20,35 @@ from telegram.error import BadRequest
 logger = logging.getLogger(__name__)
 
 # States for expense logging conversation
-CHOOSING_LOG_TYPE, ENTER_EXPENSE_DETAILS, SELECT_CATEGORY, ADD_CUSTOM_CATEGORY, UPLOAD_RECEIPT = range(5)
+CHOOSING_LOG_TYPE, ENTER_EXPENSE_DETAILS, SELECT_CATEGORY, ADD_CUSTOM_CATEGORY, UPLOAD_RECEIPT, BULK_ENTRY, CONFIRM_BULK = range(7)
+
+EXPENSE_DRAFT_EXPIRED_MESSAGE = "This expense entry has expired. Please start logging it again."
+
+def _conversation_session(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Returns the conversation's DB session, opening a new one if it is missing.
+    The session is never persisted, so a conversation restored after a restart needs a fresh one.
+    It is a write session: the profile and categories come from the caches as snapshots, and the only
+    objects read after a commit are the ones the write itself returned.
+    """
+    db_session = context.user_data.get('db_session')
+    if db_session is None:
+        db_session = WriteSessionLocal()
+        context.user_data['db_session'] = db_session
+    return db_session
 
 async def start_expense_logging(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the expense logging conversation by asking for the log type."""
     logger.info("start_expense_logging entered.")
     
     # Create a new session for this conversation and store it in context
-    db_session = SessionLocal()
+    db_session = WriteSessionLocal()
     context.user_data['db_session'] = db_session
 
-    user_service = UserService(db_session)
     expense_service = ExpenseService(db_session)
-    profile_service = ProfileService(db_session)
     
     user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
+    user, current_profile = get_identity(update, context)
     
     if not user:
         message = "It looks like you haven't started yet. Please use the /start command to begin!"
@@ -43,7 +61,6 @@ async def start_expense_logging(update: Update, context: ContextTypes.DEFAULT_TY
         logger.info(f"start_expense_logging returning ConversationHandler.END for user {user_telegram_id} (no user)")
         return ConversationHandler.END
 
-    current_profile = profile_service.get_current_profile(user.telegram_id)
     if not current_profile:
         message = "You need to select a profile first. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'."
         if update.callback_query:
@@ -55,11 +72,11 @@ async def start_expense_logging(update: Update, context: ContextTypes.DEFAULT_TY
         logger.info(f"start_expense_logging returning ConversationHandler.END for user {user_telegram_id} (no profile)")
         return ConversationHandler.END
 
-    if not expense_service.can_log_expense(user):
+    if not expense_service.can_log_expense(user, current_profile.id):
         monthly_count = expense_service.get_monthly_expense_count(current_profile.id)
         reset_date = expense_service.get_monthly_limit_reset_date()
         message = (
-            f"You have reached your monthly limit of 150 expenses for this profile ({monthly_count} logged).\n"
+            f"You have reached your monthly limit of {FREE_MONTHLY_EXPENSE_LIMIT} expenses for this profile ({monthly_count} logged).\n"
             f"Please upgrade to Pro for unlimited expense logging or wait until "
             f"<b>{reset_date.strftime('%b %d, %Y')}</b> when your limit resets."
         )
@@ -81,6 +98,7 @@ async def start_expense_logging(update: Update, context: ContextTypes.DEFAULT_TY
     keyboard = [
         [InlineKeyboardButton("✍️ Type it Out", callback_data="log_manual")],
         [InlineKeyboardButton("📷 Scan Receipt (OCR)", callback_data="log_ocr")],
+        [InlineKeyboardButton("📋 Add Several at Once", callback_data="log_bulk")],
         [InlineKeyboardButton("❌ Cancel", callback_data="cancel")],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -106,20 +124,117 @@ async def prompt_manual_entry(update: Update, context: ContextTypes.DEFAULT_TYPE
     logger.info("prompt_manual_entry returning ENTER_EXPENSE_DETAILS")
     return ENTER_EXPENSE_DETAILS
 
+async def prompt_bulk_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Prompts the user to paste several expenses, one per line."""
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(
+        f"Send up to {BULK_EXPENSE_MAX_LINES} expenses in one message, one per line. "
+        "Add #Category at the end of a line to file it under that category, e.g.:\n\n"
+        "2500 for lunch #Food\n"
+        "paid 8000 for fuel #Transport\n"
+        "1200 for airtime",
+        reply_markup=back_to_main_menu_keyboard()
+    )
+    return BULK_ENTRY
+
+async def enter_bulk_expenses(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Parses a multi-line message and shows everything for one confirmation."""
+    db_session = _conversation_session(context)
+    expense_service = ExpenseService(db_session)
+    user, current_profile = get_identity(update, context)
+
+    if not user or not current_profile:
+        await update.message.reply_text(
+            "You need to select a profile first. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'.",
+            reply_markup=back_to_main_menu_keyboard()
+        )
+        db_session.close()
+        return ConversationHandler.END
+
+    entries, rejected = expense_service.parse_bulk_expense_message(update.message.text)
+    if not entries:
+        await update.message.reply_text(
+            "I couldn't understand any of those lines. Use one 'amount for description' per line and try again.",
+            reply_markup=back_to_main_menu_keyboard()
+        )
+        return BULK_ENTRY
+
+    if not user.is_pro:
+        remaining = FREE_MONTHLY_EXPENSE_LIMIT - expense_service.get_monthly_expense_count(current_profile.id)
+        if len(entries) > remaining:
+            await update.message.reply_text(
+                f"That's {len(entries)} expenses, but you can only log {max(remaining, 0)} more this month on the Free plan. "
+                "Please send fewer lines or upgrade to Pro.",
+                reply_markup=back_to_main_menu_keyboard()
+            )
+            return BULK_ENTRY
+
+    scratch_set(context.user_data, 'bulk_expense_draft', {"profile_id": current_profile.id, "currency": current_profile.currency, "entries": entries})
+
+    currency_symbol = get_currency_symbol(current_profile.currency)
+    lines = [
+        f"{index}. {currency_symbol}{entry['amount']:,} - {entry['description']}" + (f" [{entry['category']}]" if entry['category'] else "")
+        for index, entry in enumerate(entries, start=1)
+    ]
+    total = sum(entry['amount'] for entry in entries)
+    message_text = f"Please confirm these {len(entries)} expenses (total {currency_symbol}{total:,.2f}):\n\n" + "\n".join(lines)
+    if rejected:
+        message_text += f"\n\nSkipped {len(rejected)} line(s) I couldn't read:\n" + "\n".join(rejected[:10])
+
+    keyboard = [
+        [InlineKeyboardButton("✅ Save All", callback_data="confirm_bulk")],
+        [InlineKeyboardButton("❌ Cancel", callback_data="cancel")],
+    ]
+    await update.message.reply_text(message_text, reply_markup=InlineKeyboardMarkup(keyboard))
+    return CONFIRM_BULK
+
+async def confirm_bulk_expenses(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Saves every confirmed bulk expense in one transaction."""
+    query = update.callback_query
+    await query.answer()
+
+    draft = scratch_get(context.user_data, 'bulk_expense_draft')
+    db_session = _conversation_session(context)
+    if draft is None:
+        await query.edit_message_text(EXPENSE_DRAFT_EXPIRED_MESSAGE, reply_markup=back_to_main_menu_keyboard())
+        db_session.close()
+        return ConversationHandler.END
+
+    expense_service = ExpenseService(db_session)
+    user, _ = get_identity(update, context)
+    if not user or not user.is_pro:
+        # Checked again: other expenses may have been logged while this draft waited for confirmation
+        remaining = FREE_MONTHLY_EXPENSE_LIMIT - expense_service.get_monthly_expense_count(draft['profile_id'])
+        if len(draft['entries']) > remaining:
+            await query.edit_message_text(
+                f"You can only log {max(remaining, 0)} more expenses this month on the Free plan, so these "
+                f"{len(draft['entries'])} were not saved. Please send fewer lines or upgrade to Pro.",
+                reply_markup=back_to_main_menu_keyboard()
+            )
+            db_session.close()
+            scratch_clear(context.user_data, 'bulk_expense_draft')
+            return ConversationHandler.END
+
+    saved = expense_service.add_expenses_bulk(draft['profile_id'], draft['entries'])
+    await query.edit_message_text(f"✅ Saved {saved} expenses.", reply_markup=back_to_main_menu_keyboard())
+    queue_budget_alerts(context.application, update.effective_chat.id, expense_service.budget_alerts, draft.get('currency'))
+    db_session.close()
+    scratch_clear(context.user_data, 'bulk_expense_draft')
+    return ConversationHandler.END
+
 async def start_ocr_logging(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Prompts the user to upload a receipt for OCR."""
     logger.info(f"start_ocr_logging entered for user {update.effective_user.id}")
     query = update.callback_query
     await query.answer()
     
-    db_session = context.user_data['db_session'] # Retrieve session
-    user_service = UserService(db_session)
-    user = user_service.get_user(update.effective_user.id)
+    user, _ = get_identity(update, context)
 
     if not user or not user.is_pro:
         await query.edit_message_text("OCR receipt logging is a Pro feature. Please upgrade your plan.", reply_markup=back_to_main_menu_keyboard())
-        db_session.close()
-        logger.info(f"start_ocr_logging returning ConversationHandler.END for user {user.telegram_id} (not Pro)")
+        _conversation_session(context).close()
+        logger.info(f"start_ocr_logging returning ConversationHandler.END for user {update.effective_user.id} (not Pro)")
         return ConversationHandler.END
 
     await query.edit_message_text("Please upload a receipt image for OCR processing.", reply_markup=back_to_main_menu_keyboard())
@@ -130,12 +245,11 @@ async def enter_expense_details(update: Update, context: ContextTypes.DEFAULT_TY
     """Parses manually entered expense details and asks for category."""
     logger.info(f"enter_expense_details entered for user {update.effective_user.id} with text: {update.message.text}")
     text = update.message.text
-    db_session = context.user_data['db_session'] # Retrieve session
+    db_session = _conversation_session(context) # Retrieve session
     expense_service = ExpenseService(db_session)
-    profile_service = ProfileService(db_session)
     
     user_telegram_id = update.effective_user.id
-    current_profile = profile_service.get_current_profile(user_telegram_id)
+    _, current_profile = get_identity(update, context)
 
     amount, description = expense_service.parse_expense_message(text)
     logger.info(f"Parsed amount: {amount}, description: {description}")
@@ -148,16 +262,13 @@ async def enter_expense_details(update: Update, context: ContextTypes.DEFAULT_TY
         logger.info(f"enter_expense_details returning ENTER_EXPENSE_DETAILS (retry) for user {user_telegram_id} (parse failed)")
         return ENTER_EXPENSE_DETAILS
 
-    context.user_data['expense_amount'] = amount
-    context.user_data['expense_description'] = description
-    context.user_data['expense_date'] = None # Manual entry uses current date by default in service
+    # Manual entry uses current date by default in service
+    scratch_set(context.user_data, 'expense_draft', {
+        "amount": amount, "description": description, "date": None,
+        "profile_id": current_profile.id, "currency": current_profile.currency # Saves re-resolving the profile when the expense is written
+    })
 
-    categories = expense_service.get_categories(current_profile.id)
-    keyboard = []
-    for category in categories:
-        keyboard.append([InlineKeyboardButton(category.name, callback_data=f"category_{category.id}")])
-    keyboard.append([InlineKeyboardButton("Add Custom Category", callback_data="add_custom_category")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = expense_category_keyboard(db_session, current_profile.id)
     
     currency_symbol = get_currency_symbol(current_profile.currency)
 
@@ -192,16 +303,14 @@ async def upload_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             f"Failed to process image: {ocr_result_text}. Please try again or log manually.",
             reply_markup=back_to_main_menu_keyboard()
         )
-        context.user_data['db_session'].close()
+        _conversation_session(context).close()
         return ConversationHandler.END
     
     # Use the existing expense parser on the OCR text
-    db_session = context.user_data['db_session']
+    db_session = _conversation_session(context)
     expense_service = ExpenseService(db_session)
     
-    profile_service = ProfileService(db_session) # Fetch profile service
-    user_telegram_id = update.effective_user.id
-    current_profile = profile_service.get_current_profile(user_telegram_id) # Get current profile
+    _, current_profile = get_identity(update, context) # Get current profile
 
     amount, description = expense_service.parse_expense_message(ocr_result_text)
     
@@ -213,22 +322,16 @@ async def upload_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             reply_markup=back_to_main_menu_keyboard(),
             parse_mode='Markdown'
         )
-        context.user_data['db_session'].close()
+        _conversation_session(context).close()
         return ConversationHandler.END
 
-    context.user_data['expense_amount'] = amount
-    context.user_data['expense_description'] = description
-    context.user_data['expense_date'] = None # OCR doesn't provide a date with this prompt
+    # OCR doesn't provide a date with this prompt
+    scratch_set(context.user_data, 'expense_draft', {
+        "amount": amount, "description": description, "date": None,
+        "profile_id": current_profile.id, "currency": current_profile.currency # Saves re-resolving the profile when the expense is written
+    })
 
-    
-    categories = expense_service.get_categories(current_profile.id)
-    
-    keyboard = []
-    for category in categories:
-        keyboard.append([InlineKeyboardButton(category.name, callback_data=f"category_{category.id}")])
-    keyboard.append([InlineKeyboardButton("Add Custom Category", callback_data="add_custom_category")])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = expense_category_keyboard(db_session, current_profile.id)
     
     currency_symbol = get_currency_symbol(current_profile.currency) # Get currency symbol
 
@@ -246,12 +349,8 @@ async def select_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     await query.answer()
 
-    db_session = context.user_data['db_session'] # Retrieve session
+    db_session = _conversation_session(context) # Retrieve session
     expense_service = ExpenseService(db_session)
-    profile_service = ProfileService(db_session)
-    
-    user_telegram_id = update.effective_user.id
-    current_profile = profile_service.get_current_profile(user_telegram_id)
 
     if query.data == "add_custom_category":
         await query.edit_message_text(
@@ -263,33 +362,37 @@ async def select_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     elif query.data.startswith("category_"):
         category_id = int(query.data.split('_')[1])
         
-        category = expense_service.get_category_by_id(category_id)
+        draft = scratch_get(context.user_data, 'expense_draft')
+        if draft is None:
+            await query.edit_message_text(EXPENSE_DRAFT_EXPIRED_MESSAGE, reply_markup=back_to_main_menu_keyboard())
+            db_session.close()
+            return ConversationHandler.END
+
+        category = category_cache.find(db_session, draft["profile_id"], category_id)
         
         if not category:
             await query.edit_message_text("Selected category not found. Please try again.", reply_markup=back_to_main_menu_keyboard())
             logger.info("select_category returning SELECT_CATEGORY (category not found)")
             return SELECT_CATEGORY
 
-        context.user_data['expense_category_id'] = category_id
-        
-        amount = context.user_data['expense_amount']
-        description = context.user_data['expense_description']
-        expense_date = context.user_data.get('expense_date')
+        amount, description, expense_date = draft["amount"], draft["description"], draft["date"]
 
         expense_service.add_expense(
-            profile_id=current_profile.id,
+            profile_id=draft["profile_id"],
             amount=amount,
             description=description,
             category_id=category_id,
             date=expense_date
         )
         
-        currency_symbol = get_currency_symbol(current_profile.currency) # Get currency symbol
+        currency_symbol = get_currency_symbol(draft["currency"]) # Get currency symbol
         await query.edit_message_text(
             f"Expense of {currency_symbol}{amount:,} for {description} under '{category.name}' saved successfully!",
             reply_markup=back_to_main_menu_keyboard()
         )
+        queue_budget_alerts(context.application, update.effective_chat.id, expense_service.budget_alerts, draft["currency"])
         db_session.close() # Close session on conversation end
+        scratch_clear(context.user_data, 'expense_draft')
         logger.info("select_category returning ConversationHandler.END (expense saved)")
         return ConversationHandler.END
     
@@ -301,13 +404,18 @@ async def add_custom_category(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Adds a new custom category and saves the expense."""
     logger.info(f"add_custom_category entered for user {update.effective_user.id} with text: {update.message.text}")
     category_name = update.message.text.strip()
-    db_session = context.user_data['db_session'] # Retrieve session
+    db_session = _conversation_session(context) # Retrieve session
+
+    draft = scratch_get(context.user_data, 'expense_draft')
+    if draft is None:
+        await update.message.reply_text(EXPENSE_DRAFT_EXPIRED_MESSAGE, reply_markup=back_to_main_menu_keyboard())
+        db_session.close()
+        return ConversationHandler.END
+    amount, description, expense_date = draft["amount"], draft["description"], draft["date"]
     expense_service = ExpenseService(db_session)
-    profile_service = ProfileService(db_session)
     user_telegram_id = update.effective_user.id
-    current_profile = profile_service.get_current_profile(user_telegram_id)
 
-    result = expense_service.add_custom_category(current_profile.id, category_name)
+    result = expense_service.add_custom_category(draft["profile_id"], category_name)
 
     if isinstance(result, str): # expense_service returned an error or limit message
         message_to_user = result
@@ -331,26 +439,22 @@ async def add_custom_category(update: Update, context: ContextTypes.DEFAULT_TYPE
     # If not a string, it means a new Category object was returned
     new_category = result
     
-    context.user_data['expense_category_id'] = new_category.id
-
-    amount = context.user_data['expense_amount']
-    description = context.user_data['expense_description']
-    expense_date = context.user_data.get('expense_date')
-    
     expense_service.add_expense(
-        profile_id=current_profile.id,
+        profile_id=draft["profile_id"],
         amount=amount,
         description=description,
         category_id=new_category.id,
         date=expense_date
     )
-    currency_symbol = get_currency_symbol(current_profile.currency) # Get currency symbol
+    currency_symbol = get_currency_symbol(draft["currency"]) # Get currency symbol
 
     await update.message.reply_text(
         f"Custom category '{new_category.name}' added and expense of {currency_symbol}{amount:,} for {description} saved successfully!",
         reply_markup=back_to_main_menu_keyboard()
     )
+    queue_budget_alerts(context.application, update.effective_chat.id, expense_service.budget_alerts, draft["currency"])
     db_session.close() # Close session on conversation end
+    scratch_clear(context.user_data, 'expense_draft')
     logger.info("add_custom_category returning ConversationHandler.END (custom category added, expense saved)")
     return ConversationHandler.END
 
@@ -394,6 +498,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         context.user_data['db_session'].close()
         logger.info(f"DB session closed during cancel for user {update.effective_user.id}")
         context.user_data['db_session'] = None # Clear it
+    scratch_clear(context.user_data) # Drop whatever the cancelled flow left behind
 
     logger.info(f"cancel handler returning ConversationHandler.END for user {update.effective_user.id}")
     return ConversationHandler.END
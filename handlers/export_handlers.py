@@ -0,0 +1,141 @@
+import logging
+import datetime
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, ConversationHandler
+from services.report_service import EXPORT_FORMATS
+from jobs.export_jobs import ExportJob, export_job_manager
+from .menu_handlers import back_to_main_menu_keyboard
+from .identity_handlers import get_identity
+from utils.datetime_utils import WAT
+from utils.scratch_store import scratch_set, scratch_get, scratch_clear
+
+logger = logging.getLogger(__name__)
+
+EXPORT_RANGES = {
+    "all": "All Time",
+    "this_month": "This Month",
+    "last_month": "Last Month",
+    "this_quarter": "This Quarter",
+    "last_quarter": "Last Quarter",
+    "this_year": "This Year",
+}
+
+def _add_months(date_wat: datetime.datetime, months: int) -> datetime.datetime:
+    month_index = date_wat.month - 1 + months
+    return date_wat.replace(year=date_wat.year + month_index // 12, month=month_index % 12 + 1)
+
+def export_range_bounds_utc(range_key: str, now: datetime.datetime = None):
+    """Returns (start_utc, end_utc) for an export range; (None, None) means all time."""
+    if range_key == "all":
+        return None, None
+    now_wat = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(WAT)
+    month_start = now_wat.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    quarter_start = month_start.replace(month=3 * ((month_start.month - 1) // 3) + 1)
+
+    if range_key == "this_month":
+        start, end = month_start, _add_months(month_start, 1)
+    elif range_key == "last_month":
+        start, end = _add_months(month_start, -1), month_start
+    elif range_key == "this_quarter":
+        start, end = quarter_start, _add_months(quarter_start, 3)
+    elif range_key == "last_quarter":
+        start, end = _add_months(quarter_start, -3), quarter_start
+    elif range_key == "this_year":
+        start, end = month_start.replace(month=1), month_start.replace(year=month_start.year + 1, month=1)
+    else:
+        raise ValueError(f"Unknown export range: {range_key}")
+    return start.astimezone(datetime.timezone.utc), end.astimezone(datetime.timezone.utc)
+
+async def export_logs_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Checks Pro access and asks which format to export in."""
+    query = update.callback_query
+    await query.answer()
+
+    user, current_profile = get_identity(update, context)
+
+    if not user:
+        message = "It looks like you haven't started yet. Please use the /start command to begin!"
+        if update.callback_query:
+            await query.edit_message_text(message)
+        else: # Should not happen from callback query
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=message)
+        return ConversationHandler.END
+
+    if not current_profile:
+        await query.edit_message_text(
+            "You need to select a profile first to export logs. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'.",
+            reply_markup=back_to_main_menu_keyboard()
+        )
+        return ConversationHandler.END
+
+    if not user.is_pro:
+        await query.edit_message_text(
+            "Exporting logs is a Pro feature. Please upgrade to Pro to use this functionality.",
+            reply_markup=back_to_main_menu_keyboard()
+        )
+        return ConversationHandler.END
+
+    scratch_set(context.user_data, 'export_request', {"profile_id": current_profile.id, "profile_name": current_profile.name})
+
+    keyboard = [[InlineKeyboardButton(label, callback_data=f"export_fmt_{fmt}")] for fmt, label in EXPORT_FORMATS.items()]
+    keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="main_menu")])
+    await query.edit_message_text("📤 Which format would you like your export in?", reply_markup=InlineKeyboardMarkup(keyboard))
+    return ConversationHandler.END
+
+async def export_format_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stores the chosen export format and asks for the date range."""
+    query = update.callback_query
+    await query.answer()
+
+    export_request = scratch_get(context.user_data, 'export_request')
+    fmt = query.data.replace("export_fmt_", "")
+    if export_request is None or fmt not in EXPORT_FORMATS:
+        await query.edit_message_text("This export request has expired. Please choose 'Export Logs' again.", reply_markup=back_to_main_menu_keyboard())
+        return
+    export_request['format'] = fmt
+
+    keyboard = [[InlineKeyboardButton(label, callback_data=f"export_range_{range_key}")] for range_key, label in EXPORT_RANGES.items()]
+    keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="main_menu")])
+    await query.edit_message_text(
+        f"📤 {EXPORT_FORMATS[fmt]} export. Which period should it cover?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def export_range_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Starts a background export job for the chosen range; progress is shown by editing this message."""
+    query = update.callback_query
+    await query.answer()
+
+    export_request = scratch_get(context.user_data, 'export_request')
+    range_key = query.data.replace("export_range_", "")
+    if export_request is None or 'format' not in export_request or range_key not in EXPORT_RANGES:
+        await query.edit_message_text("This export request has expired. Please choose 'Export Logs' again.", reply_markup=back_to_main_menu_keyboard())
+        return
+
+    user_telegram_id = update.effective_user.id
+    active_jobs = export_job_manager.active_jobs_for(user_telegram_id)
+    if len(active_jobs) >= export_job_manager.max_per_user:
+        running = ", ".join(active_jobs)
+        await query.edit_message_text(
+            f"You already have an export in progress ({running}). Please wait for it to finish before starting another.",
+            reply_markup=back_to_main_menu_keyboard()
+        )
+        return
+    scratch_clear(context.user_data, 'export_request')
+
+    fmt = export_request['format']
+    start_date, end_date = export_range_bounds_utc(range_key)
+    job = ExportJob(
+        user_id=user_telegram_id,
+        chat_id=update.effective_chat.id,
+        message_id=query.message.message_id,
+        profile_id=export_request['profile_id'],
+        profile_name=export_request['profile_name'],
+        fmt=fmt,
+        label=EXPORT_RANGES[range_key],
+        start_date=start_date,
+        end_date=end_date
+    )
+    await query.edit_message_text(f"⏳ Export {job.job_id} queued: {EXPORT_FORMATS[fmt]}, {EXPORT_RANGES[range_key].lower()}. I'll update this message as it runs.")
+    if export_job_manager.submit(context.application, job) is None:
+        await query.edit_message_text("You already have an export in progress. Please wait for it to finish.", reply_markup=back_to_main_menu_keyboard())
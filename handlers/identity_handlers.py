@@ -0,0 +1,41 @@
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes
+from models import SessionLocal
+from services.identity_service import IdentityService, invalidate_identity
+from services.cache_generations import cache_generation_watch
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_HANDLER_GROUP = -1 # Runs before every other handler group
+
+def _load_identity(telegram_id: int):
+    db_session = SessionLocal()
+    try:
+        cache_generation_watch.check(db_session) # Picks up caches other processes invalidated, before reading from them
+        return IdentityService(db_session).resolve(telegram_id)
+    finally:
+        db_session.close()
+
+async def resolve_identity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Pre-handler: resolves the update's user and current profile (cached across updates) and attaches them to context.identity."""
+    if update.effective_user is None:
+        return
+    context.identity = _load_identity(update.effective_user.id)
+
+def get_identity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Returns (user, current_profile) snapshots for the update's sender, either of which may be None.
+    Falls back to a fresh lookup if the pre-handler did not run for this context.
+    """
+    identity = getattr(context, "identity", None)
+    if identity is None or identity.telegram_id != update.effective_user.id:
+        identity = _load_identity(update.effective_user.id)
+        context.identity = identity
+    return identity.user, identity.profile
+
+def refresh_identity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Re-resolves the identity after a handler changed the user or their current profile in this update."""
+    invalidate_identity(update.effective_user.id)
+    context.identity = _load_identity(update.effective_user.id)
+    return context.identity.user, context.identity.profile
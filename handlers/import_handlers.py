@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import tempfile
+from telegram import Update
+from telegram.ext import ContextTypes, ConversationHandler
+from services.import_service import import_csv_file, IMPORT_MAX_FILE_BYTES
+from .menu_handlers import back_to_main_menu_keyboard
+from .identity_handlers import get_identity
+from utils.scratch_store import scratch_set, scratch_get, scratch_clear
+
+logger = logging.getLogger(__name__)
+
+# States for the CSV import conversation
+AWAIT_IMPORT_FILE = 0
+
+IMPORT_SPOOL_MAX_BYTES = 5 * 1024 * 1024 # Downloads larger than this spill from memory to a temp file
+
+async def start_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Checks Pro access and asks for the CSV file."""
+    query = update.callback_query
+    if query:
+        await query.answer()
+
+    user, current_profile = get_identity(update, context)
+
+    if not user or not current_profile:
+        message = "You need to select a profile first. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'."
+    elif not user.is_pro:
+        message = "Importing transactions is a Pro feature. Please upgrade to Pro to use this functionality."
+    else:
+        message = None
+
+    if message:
+        if query:
+            await query.edit_message_text(message, reply_markup=back_to_main_menu_keyboard())
+        else:
+            await update.message.reply_text(message, reply_markup=back_to_main_menu_keyboard())
+        return ConversationHandler.END
+
+    scratch_set(context.user_data, 'import_request', {"profile_id": current_profile.id, "profile_name": current_profile.name, "is_pro": user.is_pro})
+    prompt = (
+        f"📥 Send a CSV file to import into '{current_profile.name}'.\n\n"
+        "It needs a Date column and an Amount column (or Debit/Credit columns, as in most bank statements). "
+        "Description, Category and Type (Expense/Income) columns are used when present, so files exported "
+        "from this bot can be imported as they are."
+    )
+    if query:
+        await query.edit_message_text(prompt, reply_markup=back_to_main_menu_keyboard())
+    else:
+        await update.message.reply_text(prompt, reply_markup=back_to_main_menu_keyboard())
+    return AWAIT_IMPORT_FILE
+
+async def receive_import_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Downloads the CSV and imports it on a worker thread."""
+    import_request = scratch_get(context.user_data, 'import_request')
+    if import_request is None:
+        await update.message.reply_text("This import has expired. Please start it again.", reply_markup=back_to_main_menu_keyboard())
+        return ConversationHandler.END
+
+    document = update.message.document
+    if not (document.file_name or "").lower().endswith(".csv") and document.mime_type not in ("text/csv", "text/plain", "application/vnd.ms-excel"):
+        await update.message.reply_text("Please send a .csv file.", reply_markup=back_to_main_menu_keyboard())
+        return AWAIT_IMPORT_FILE
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_BYTES:
+        await update.message.reply_text("That file is too large. Please split it into files under 20 MB.", reply_markup=back_to_main_menu_keyboard())
+        return AWAIT_IMPORT_FILE
+
+    status_message = await update.message.reply_text("⏳ Importing your transactions...")
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_BYTES, mode="w+b") as download:
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_memory(out=download)
+        download.seek(0)
+        try:
+            result = await asyncio.to_thread(import_csv_file, import_request['profile_id'], download, import_request['is_pro'])
+        except ValueError as e: # Includes UnicodeDecodeError for non-UTF-8 files
+            await status_message.edit_text(
+                f"Could not import that file: {e}\n\nNo transactions were saved. Fix the file and start the import again.",
+                reply_markup=back_to_main_menu_keyboard()
+            )
+            scratch_clear(context.user_data, 'import_request')
+            return ConversationHandler.END
+        except Exception as e:
+            logger.error(f"Import failed for profile {import_request['profile_id']}: {e}")
+            await status_message.edit_text(
+                "Sorry, the import failed. No transactions were saved, so it is safe to start the import again.",
+                reply_markup=back_to_main_menu_keyboard()
+            )
+            scratch_clear(context.user_data, 'import_request')
+            return ConversationHandler.END
+
+    summary = (
+        f"✅ Import into '{import_request['profile_name']}' finished.\n\n"
+        f"Accepted: {result.accepted:,} ({result.expenses:,} expenses, {result.incomes:,} incomes)\n"
+        f"Rejected: {result.rejected:,}\n"
+    )
+    if result.categories_created:
+        summary += f"New categories created: {result.categories_created}\n"
+    if result.errors:
+        summary += "\nFirst problems found:\n" + "\n".join(result.errors)
+    await status_message.edit_text(summary, reply_markup=back_to_main_menu_keyboard())
+    scratch_clear(context.user_data, 'import_request')
+    return ConversationHandler.END
@@ -1,5 +1,6 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from services.subscription_service import MONTHLY_PRO_PRICE, YEARLY_PRO_PRICE, YEARLY_SAVINGS_NAIRA, YEARLY_SAVINGS_PERCENT
+from services.category_cache import category_cache
 
 def main_menu_keyboard():
     keyboard = [
@@ -10,6 +11,7 @@ def main_menu_keyboard():
         [InlineKeyboardButton("👤 My Profile", callback_data="my_profile")],
         [InlineKeyboardButton("🎯 Set Budget", callback_data="start_set_budget")],
         [InlineKeyboardButton("📤 Export Logs (Pro)", callback_data="export_logs")],
+        [InlineKeyboardButton("📥 Import CSV (Pro)", callback_data="import_logs")],
         [InlineKeyboardButton("✨ Features", callback_data="features")],
         [InlineKeyboardButton("🚀 Upgrade to Pro", callback_data="upgrade_to_pro")],
         [InlineKeyboardButton("🤝 Refer a Friend", callback_data="refer_a_friend")],
@@ -42,6 +44,7 @@ def summary_menu_keyboard():
         [InlineKeyboardButton("☀️ Today", callback_data="summary_today")],
         [InlineKeyboardButton("🗓️ This Week", callback_data="summary_this_week")],
         [InlineKeyboardButton("📅 This Month", callback_data="summary_this_month")],
+        [InlineKeyboardButton("🕒 Spending Heatmap", callback_data="summary_heatmap")],
         [InlineKeyboardButton("🔙 Back to Main Menu", callback_data="main_menu")],
         [InlineKeyboardButton("❌ Cancel", callback_data="cancel")],
     ]
@@ -53,3 +56,22 @@ def back_to_main_menu_keyboard():
         [InlineKeyboardButton("❌ Cancel", callback_data="cancel")],
     ]
     return InlineKeyboardMarkup(keyboard)
+
+def _build_expense_category_keyboard(categories):
+    keyboard = [[InlineKeyboardButton(category.name, callback_data=f"category_{category.id}")] for category in categories]
+    keyboard.append([InlineKeyboardButton("Add Custom Category", callback_data="add_custom_category")])
+    return InlineKeyboardMarkup(keyboard)
+
+def _build_budget_category_keyboard(categories):
+    keyboard = [[InlineKeyboardButton(category.name, callback_data=f"budget_category_{category.id}")] for category in categories]
+    keyboard.append([InlineKeyboardButton("Overall Budget", callback_data="budget_category_none")]) # For overall budget
+    keyboard.append([InlineKeyboardButton("Cancel", callback_data="cancel")])
+    return InlineKeyboardMarkup(keyboard)
+
+def expense_category_keyboard(db_session, profile_id: int):
+    """Category picker for logging an expense; cached per profile."""
+    return category_cache.get_keyboard(db_session, profile_id, "expense", _build_expense_category_keyboard)
+
+def budget_category_keyboard(db_session, profile_id: int):
+    """Category picker for setting a budget; cached per profile."""
+    return category_cache.get_keyboard(db_session, profile_id, "budget", _build_budget_category_keyboard)
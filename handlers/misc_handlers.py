@@ -1,8 +1,10 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters
 from models import SessionLocal
-from services import ProfileService, UserService, ReportService, ReferralService, MONTHLY_PRO_PRICE, YEARLY_PRO_PRICE, YEARLY_SAVINGS_NAIRA, YEARLY_SAVINGS_PERCENT
+from services import ProfileService, UserService, MONTHLY_PRO_PRICE, YEARLY_PRO_PRICE, YEARLY_SAVINGS_NAIRA, YEARLY_SAVINGS_PERCENT
 from .menu_handlers import back_to_main_menu_keyboard, main_menu_keyboard # Import main_menu_keyboard
+from .identity_handlers import get_identity
+from services.identity_service import invalidate_identity
 import logging #for logs
 import io
 import datetime
@@ -70,7 +72,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     
     welcome_message = f"Hi {telegram_user.mention_html()}! Welcome to Smart Expense Tracker Bot.\n\n"
 
-    current_profile = profile_service.get_current_profile(user.telegram_id)
+    current_profile = profile_service.get_profile_by_id(user.current_profile_id) if user.current_profile_id else None
     if current_profile:
         welcome_message += f"<b>Current Profile:</b> {current_profile.name} ({current_profile.profile_type})\n\n"
 
@@ -167,11 +169,8 @@ async def set_currency_and_create_profile(update: Update, context: ContextTypes.
     
     db_session = SessionLocal()
     profile_service = ProfileService(db_session)
-    user_service = UserService(db_session)
-    referral_service = ReferralService(db_session)
 
     user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
 
     new_profile = profile_service.create_profile(user_telegram_id, profile_name, profile_type, currency=currency, application=context.application)
     
@@ -263,7 +262,8 @@ async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         
         "<b>Expense Logging:</b>\n"
         "  - Click '💸 Log Expense' then type: 'paid [amount] for [description]' (e.g., 'paid 5000 for fuel') or '[amount] for [description]' (e.g., '5000 for fuel').\n"
-        "  - To log from a receipt (Pro feature), simply upload a photo of your receipt.\n\n"
+        "  - To log from a receipt (Pro feature), simply upload a photo of your receipt.\n"
+        "  - Choose '📋 Add Several at Once' to paste many expenses, one per line, optionally ending with #Category.\n\n"
         
         "<b>Income Logging:</b>\n"
         "  - Click '💰 Log Income' then type: '[amount] from [source]' (e.g., '10000 from salary') or 'earned [amount] from [source]' (e.g., 'earned 5000 from freelance').\n\n"
@@ -275,11 +275,17 @@ async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         "  - Click '👤 My Profile' to '👀 View / Switch Profile' or '➕ Create New Profile'. Free users can have 1 profile, Pro users unlimited.\n"
         "  - You can also '💱 Change Currency' for your current profile from the 'My Profile' menu.\n\n"
         
+        "<b>Search:</b>\n"
+        "  - Type '/search [text]' to find transactions, e.g. '/search fuel from:2024-03-01 to:2024-03-31'. Filter with cat:, type:, min: and max:.\n\n"
+        
         "<b>Budgeting:</b>\n"
         "  - Click '🎯 Set Budget' to create daily, weekly, or monthly budgets for specific categories or overall spending.\n\n"
         
         "<b>Export Logs (Pro):</b>\n"
-        "  - Pro users can '📤 Export Logs (CSV)' to get a detailed CSV file of all transactions.\n\n"
+        "  - Pro users can '📤 Export Logs' as CSV, Excel or Parquet for all time or a chosen month, quarter or year.\n\n"
+        
+        "<b>Import (Pro):</b>\n"
+        "  - '📥 Import CSV' (or /import) loads transactions from a CSV file, such as a bank statement or a previous export.\n\n"
         
         "<b>Referral Program:</b>\n"
         "  - Click '🤝 Refer a Friend' to get your unique referral link. Earn Pro days when friends upgrade!\n\n"
@@ -295,60 +301,6 @@ async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     await query.edit_message_text(help_message, parse_mode='HTML', reply_markup=back_to_main_menu_keyboard())
     return ConversationHandler.END
 
-async def export_logs_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Generates and sends a CSV file of all logs for Pro users."""
-    query = update.callback_query
-    await query.answer("Generating export file...")
-
-    db_session = SessionLocal()
-    user_service = UserService(db_session)
-    profile_service = ProfileService(db_session)
-    report_service = ReportService(db_session)
-
-    user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
-    
-    if not user:
-        message = "It looks like you haven't started yet. Please use the /start command to begin!"
-        if update.callback_query:
-            await query.edit_message_text(message)
-        else: # Should not happen from callback query
-            await context.bot.send_message(chat_id=update.effective_chat.id, text=message)
-        db_session.close()
-        return ConversationHandler.END
-
-    current_profile = profile_service.get_current_profile(user.telegram_id)
-
-    if not current_profile:
-        await query.edit_message_text(
-            "You need to select a profile first to export logs. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'.",
-            reply_markup=back_to_main_menu_keyboard()
-        )
-        db_session.close()
-        return ConversationHandler.END
-
-    if not user.is_pro:
-        await query.edit_message_text(
-            "Exporting logs is a Pro feature. Please upgrade to Pro to use this functionality.",
-            reply_markup=back_to_main_menu_keyboard()
-        )
-        db_session.close()
-        return ConversationHandler.END
-    
-    csv_data_io = report_service.generate_csv_report(current_profile.id)
-    csv_file_name = f"expense_income_report_{current_profile.name}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
-
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=InputFile(csv_data_io, filename=csv_file_name),
-        caption=f"Your expense and income report for profile '{current_profile.name}' is ready!",
-        reply_markup=back_to_main_menu_keyboard()
-    )
-    
-    db_session.close()
-    return ConversationHandler.END
-
-
 # States for currency change
 CHANGE_CURRENCY = range(1)
 
@@ -381,14 +333,15 @@ async def set_currency_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     
     db_session = SessionLocal()
     profile_service = ProfileService(db_session)
-    user_telegram_id = update.effective_user.id
+    _, profile_snapshot = get_identity(update, context)
     
-    current_profile = profile_service.get_current_profile(user_telegram_id)
+    current_profile = profile_service.get_profile_by_id(profile_snapshot.id) if profile_snapshot else None
     
     if current_profile:
         current_profile.currency = new_currency
         db_session.add(current_profile)
         db_session.commit()
+        invalidate_identity(update.effective_user.id)
         await query.edit_message_text(
             f"Currency for profile '{current_profile.name}' has been updated to {new_currency}.",
             reply_markup=back_to_main_menu_keyboard()
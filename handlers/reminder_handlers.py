@@ -3,6 +3,7 @@ from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filt
 from models import SessionLocal
 from services import ReminderService, UserService
 from .menu_handlers import back_to_main_menu_keyboard
+from .identity_handlers import get_identity
 import logging
 import datetime
 
@@ -16,9 +17,7 @@ async def manage_reminders_menu(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
 
-    db_session = SessionLocal()
-    user_service = UserService(db_session)
-    user = user_service.get_user(update.effective_user.id)
+    user, _ = get_identity(update, context)
     
     status = "ON" if user.daily_reminders_enabled else "OFF"
     time_str = user.reminder_time.strftime("%I:%M %p") if user.reminder_time else "Not Set"
@@ -37,7 +36,6 @@ async def manage_reminders_menu(update: Update, context: ContextTypes.DEFAULT_TY
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
-    db_session.close()
     return MANAGE_REMINDER_MENU # Keep conversation alive
 
 async def toggle_daily_reminders_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
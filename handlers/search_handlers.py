@@ -0,0 +1,159 @@
+import re
+import html
+import logging
+import datetime
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from models import SessionLocal
+from services import TransactionHistoryService
+from services.transaction_history_service import history_cursor
+from .menu_handlers import back_to_main_menu_keyboard
+from .identity_handlers import get_identity
+from utils.datetime_utils import to_wat, wat_day_bounds_utc
+from utils.misc_utils import get_currency_symbol
+from utils.scratch_store import scratch_set, scratch_get
+
+logger = logging.getLogger(__name__)
+
+SEARCH_RESULTS_PER_PAGE = 10
+SEARCH_FILTER_PATTERN = re.compile(r"(\w+):(\"[^\"]*\"|\S+)") # key:value or key:"quoted value"
+
+SEARCH_USAGE = (
+    "<b>🔎 Search your transactions</b>\n\n"
+    "Usage: <code>/search [text] [filters]</code>\n\n"
+    "Filters:\n"
+    "  <code>cat:Transport</code> - expense category\n"
+    "  <code>type:expense</code> or <code>type:income</code>\n"
+    "  <code>min:1000</code> / <code>max:5000</code> - amount range\n"
+    "  <code>from:2024-03-01</code> / <code>to:2024-03-31</code> - date range (inclusive)\n\n"
+    "Example: <code>/search fuel from:2024-03-01 to:2024-03-31</code>"
+)
+
+def parse_search_query(query_text: str):
+    """
+    Parses '/search' arguments into TransactionHistoryService filters.
+    Returns (filters, error); error is a user-facing message when the query is invalid.
+    """
+    filters = {}
+    try:
+        for key, value in SEARCH_FILTER_PATTERN.findall(query_text):
+            value = value.strip('"')
+            key = key.lower()
+            if key in ("cat", "category"):
+                filters["category"] = value
+            elif key == "type":
+                if value.lower() not in ("expense", "income"):
+                    return None, "type must be 'expense' or 'income'."
+                filters["type"] = value.lower()
+            elif key == "min":
+                filters["min_amount"] = float(value.replace(',', ''))
+            elif key == "max":
+                filters["max_amount"] = float(value.replace(',', ''))
+            elif key == "from":
+                start_utc, _ = wat_day_bounds_utc(datetime.datetime.strptime(value, "%Y-%m-%d"))
+                filters["start_date"] = start_utc.isoformat()
+            elif key == "to":
+                _, end_utc = wat_day_bounds_utc(datetime.datetime.strptime(value, "%Y-%m-%d"))
+                filters["end_date"] = end_utc.isoformat()
+            else:
+                return None, f"Unknown filter '{key}'."
+    except ValueError:
+        return None, "Amounts must be numbers and dates must look like 2024-03-31."
+
+    text = SEARCH_FILTER_PATTERN.sub("", query_text).strip()
+    if text:
+        filters["text"] = text
+    return filters, None
+
+async def send_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE, search: dict, cursor: list = None, older: bool = True):
+    """Runs the stored search from the cursor and shows one page of results."""
+    db_session = SessionLocal()
+    try:
+        results, has_more = TransactionHistoryService(db_session).search(
+            search['profile_id'], search['filters'], cursor=cursor, older=older, page_size=SEARCH_RESULTS_PER_PAGE
+        )
+    finally:
+        db_session.close()
+
+    if not results:
+        message_text = "No transactions match your search." if search['page'] == 0 else "No more matching transactions."
+        keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data="main_menu")]]
+    else:
+        search['first'] = history_cursor(results[0])
+        search['last'] = history_cursor(results[-1])
+        if not older and not has_more:
+            search['page'] = 0
+
+        currency_symbol = get_currency_symbol(search.get('currency', 'NGN'))
+        message_text = "<b>🔎 Search Results:</b>\n\n"
+        for t in results:
+            type_emoji = "🔴" if t['type'] == "Expense" else "🟢"
+            category = f" [{html.escape(str(t['category']))}]" if t['type'] == "Expense" else ""
+            message_text += (
+                f"{type_emoji} {currency_symbol}{t['amount']:,} ({html.escape(str(t['description']))}{category} - {to_wat(t['date']).strftime('%b %d %Y, %H:%M')})\n"
+            )
+        message_text += f"\nPage {search['page'] + 1}"
+
+        pagination_buttons = []
+        if search['page'] > 0:
+            pagination_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data="search_prev"))
+        if has_more or not older:
+            pagination_buttons.append(InlineKeyboardButton("➡️ Next", callback_data="search_next"))
+        keyboard = [pagination_buttons] if pagination_buttons else []
+        keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="main_menu")])
+
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    query = update.callback_query
+    if query:
+        await query.edit_message_text(message_text, parse_mode='HTML', reply_markup=reply_markup)
+    else:
+        await update.message.reply_html(message_text, reply_markup=reply_markup)
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles /search [text] [filters]."""
+    query_text = " ".join(context.args) if context.args else ""
+    if not query_text:
+        await update.message.reply_html(SEARCH_USAGE, reply_markup=back_to_main_menu_keyboard())
+        return
+
+    filters, error = parse_search_query(query_text)
+    if error:
+        await update.message.reply_html(f"{html.escape(error)}\n\n{SEARCH_USAGE}", reply_markup=back_to_main_menu_keyboard())
+        return
+
+    _, current_profile = get_identity(update, context)
+    if not current_profile:
+        await update.message.reply_text(
+            "You need to select a profile first. Go to '👤 My Profile' -> '👀 View / Switch Profile' or '➕ Create New Profile'.",
+            reply_markup=back_to_main_menu_keyboard()
+        )
+        return
+
+    # Only the filters and page cursors are kept between pages
+    search = {
+        "profile_id": current_profile.id,
+        "currency": current_profile.currency,
+        "filters": filters,
+        "page": 0,
+        "first": None,
+        "last": None
+    }
+    scratch_set(context.user_data, 'transaction_search', search)
+    await send_search_page(update, context, search)
+
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles the Next/Previous buttons under search results."""
+    query = update.callback_query
+    await query.answer()
+
+    search = scratch_get(context.user_data, 'transaction_search')
+    if search is None:
+        await query.edit_message_text("This search has expired. Please run /search again.", reply_markup=back_to_main_menu_keyboard())
+        return
+
+    if query.data == "search_next":
+        search['page'] += 1
+        await send_search_page(update, context, search, cursor=search['last'], older=True)
+    else:
+        search['page'] = max(search['page'] - 1, 0)
+        await send_search_page(update, context, search, cursor=search['first'], older=False)
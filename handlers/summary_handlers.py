@@ -1,27 +1,71 @@
 from telegram import Update, InputFile
 from telegram.ext import ContextTypes, ConversationHandler
-from models import SessionLocal
-from services import SummaryService, UserService, ProfileService, MONTHLY_PRO_PRICE, YEARLY_PRO_PRICE, YEARLY_SAVINGS_NAIRA, YEARLY_SAVINGS_PERCENT
+from services import MONTHLY_PRO_PRICE, YEARLY_PRO_PRICE, YEARLY_SAVINGS_NAIRA, YEARLY_SAVINGS_PERCENT
 from visuals import VisualsService
 from utils.misc_utils import get_currency_symbol # Import get_currency_symbol
 from .menu_handlers import back_to_main_menu_keyboard
+from .identity_handlers import get_identity
+from services.summary_cache import summary_cache
+from services.summary_service import SummaryService
+from services.insight_service import mark_insights_seen
+from models import SessionLocal
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _render_spending_heatmap(visuals_service: VisualsService, profile_id: int, currency_symbol: str):
+    """Runs the weekday by hour aggregation on its own session and renders it. Meant for asyncio.to_thread."""
+    db_session = SessionLocal()
+    try:
+        grid = SummaryService(db_session).get_weekday_hour_grid(profile_id)
+    finally:
+        db_session.close()
+    chart = visuals_service.generate_heatmap(grid, title="When Your Money Leaves (All Time)", currency_symbol=currency_symbol)
+    return grid, chart
+
+def _format_comparison(comparison: dict, currency_symbol: str, previous_label: str) -> str:
+    """Summary lines for a period comparison: the overall change and the biggest category movers."""
+    if not comparison or not (comparison["current_total"] or comparison["previous_total"]):
+        return ""
+    delta, percent_change = comparison["delta"], comparison["percent_change"]
+    if percent_change is None:
+        headline = f"🆕 Nothing was spent by this point {previous_label}."
+    elif delta > 0:
+        headline = f"📈 Up {percent_change:.0f}% ({currency_symbol}{delta:,.2f}) on the same point {previous_label}."
+    elif delta < 0:
+        headline = f"📉 Down {abs(percent_change):.0f}% ({currency_symbol}{abs(delta):,.2f}) on the same point {previous_label}."
+    else:
+        headline = f"➖ Level with the same point {previous_label}."
+    text = f"<b>Compared to {previous_label}:</b>\n{headline}\n"
+    for item in [item for item in comparison["categories"] if item["delta"]][:3]:
+        sign = "+" if item["delta"] > 0 else "−"
+        text += f"- {item['category']}: {sign}{currency_symbol}{abs(item['delta']):,.2f}\n"
+    return text + "\n"
+
+async def _consume_anomalies(summary_data: dict, profile_id: int, currency_symbol: str) -> str:
+    """Formats unseen spending anomalies and marks them seen so the next summary doesn't repeat them."""
+    anomalies = summary_data.get('anomalies') or []
+    if not anomalies:
+        return ""
+    text = "<b>Unusual Spending:</b>\n"
+    for anomaly in anomalies:
+        text += (
+            f"- ⚠️ {currency_symbol}{anomaly['amount']:,.2f} on {anomaly['category_name']} on {anomaly['day']:%a %d %b}, "
+            f"against a usual {currency_symbol}{anomaly['baseline_mean']:,.2f} a day\n"
+        )
+    await asyncio.to_thread(mark_insights_seen, profile_id, [anomaly['id'] for anomaly in anomalies])
+    summary_cache.invalidate(profile_id) # The cached summary still lists them
+    return text + "\n"
+
 async def generate_today_summary(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Generates and sends today's expense and income summary to the user."""
     query = update.callback_query
     await query.answer("Generating today's summary...")
 
-    db_session = SessionLocal()
-    summary_service = SummaryService(db_session)
-    user_service = UserService(db_session)
-    profile_service = ProfileService(db_session)
     visuals_service = VisualsService()
 
-    user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
+    user, current_profile = get_identity(update, context)
     
     if not user:
         message = "It looks like you haven't started yet. Please use the /start command to begin!"
@@ -29,22 +73,18 @@ async def generate_today_summary(update: Update, context: ContextTypes.DEFAULT_T
             await query.edit_message_text(message)
         else: # Should not happen from callback query
             await context.bot.send_message(chat_id=update.effective_chat.id, text=message)
-        db_session.close()
         return ConversationHandler.END
 
-    current_profile = profile_service.get_current_profile(user_telegram_id)
-    
     if not current_profile:
         await query.edit_message_text(
             "You need to select a profile first. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'.",
             reply_markup=back_to_main_menu_keyboard()
         )
-        db_session.close()
         return ConversationHandler.END
     
     currency_symbol = get_currency_symbol(current_profile.currency)
 
-    summary_data = summary_service.get_daily_summary(current_profile.id)
+    summary_data = await summary_cache.get_summary(current_profile.id, "daily")
 
     message_text = (
         f"<b>📊 Today's Summary ({current_profile.name}):</b>\n\n"
@@ -59,6 +99,7 @@ async def generate_today_summary(update: Update, context: ContextTypes.DEFAULT_T
         for insight in summary_data["budget_insights"]:
             message_text += f"- {insight}\n"
         message_text += "\n"
+    message_text += await _consume_anomalies(summary_data, current_profile.id, currency_symbol)
 
     if summary_data['expenses_by_category']:
         # Extract overall budget amount if available for the bar chart
@@ -113,7 +154,6 @@ async def generate_today_summary(update: Update, context: ContextTypes.DEFAULT_T
             reply_markup=back_to_main_menu_keyboard()
         )
 
-    db_session.close()
     return ConversationHandler.END
 
 
@@ -122,14 +162,9 @@ async def generate_weekly_summary(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer("Generating this week's summary...")
 
-    db_session = SessionLocal()
-    summary_service = SummaryService(db_session)
-    user_service = UserService(db_session)
-    profile_service = ProfileService(db_session)
     visuals_service = VisualsService()
 
-    user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
+    user, current_profile = get_identity(update, context)
 
     if not user:
         message = "It looks like you haven't started yet. Please use the /start command to begin!"
@@ -137,22 +172,18 @@ async def generate_weekly_summary(update: Update, context: ContextTypes.DEFAULT_
             await query.edit_message_text(message)
         else:
             await context.bot.send_message(chat_id=update.effective_chat.id, text=message)
-        db_session.close()
         return ConversationHandler.END
 
-    current_profile = profile_service.get_current_profile(user_telegram_id)
-
     if not current_profile:
         await query.edit_message_text(
             "You need to select a profile first. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'.",
             reply_markup=back_to_main_menu_keyboard()
         )
-        db_session.close()
         return ConversationHandler.END
     
     currency_symbol = get_currency_symbol(current_profile.currency)
 
-    summary_data = summary_service.get_weekly_summary(current_profile.id)
+    summary_data = await summary_cache.get_summary(current_profile.id, "weekly")
 
     message_text = (
         f"<b>📊 This Week's Summary ({current_profile.name}):</b>\n\n"
@@ -161,12 +192,14 @@ async def generate_weekly_summary(update: Update, context: ContextTypes.DEFAULT_
         f"💰 Total Income: {currency_symbol}{summary_data['total_income']:,}\n"
         f"📈 Remaining Balance: {currency_symbol}{summary_data['balance']:,}\n\n"
     )
+    message_text += _format_comparison(summary_data.get('comparison'), currency_symbol, "last week")
 
     if summary_data["budget_insights"]:
         message_text += "<b>Budget Insights:</b>\n"
         for insight in summary_data["budget_insights"]:
             message_text += f"- {insight}\n"
         message_text += "\n"
+    message_text += await _consume_anomalies(summary_data, current_profile.id, currency_symbol)
 
     if summary_data['expenses_by_category']:
         # Extract overall budget amount if available for the bar chart
@@ -221,6 +254,24 @@ async def generate_weekly_summary(update: Update, context: ContextTypes.DEFAULT_
             caption="Top categories this week (Bar Chart):",
             reply_markup=back_to_main_menu_keyboard()
         )
+
+        trend = summary_data.get('daily_series')
+        if trend is not None:
+            # Rendered on a worker thread so the event loop keeps serving other chats
+            trend_chart_data = await asyncio.to_thread(
+                visuals_service.generate_trend_chart,
+                trend['dates'], trend['amounts'],
+                title=f"Daily Spending, Last {len(trend['dates'])} Days",
+                currency_symbol=currency_symbol
+            )
+            if not user.is_pro:
+                trend_chart_data = visuals_service.blur_image(trend_chart_data)
+            await context.bot.send_photo(
+                chat_id=update.effective_chat.id,
+                photo=InputFile(trend_chart_data),
+                caption=f"Your spending trend over the last {len(trend['dates'])} days:",
+                reply_markup=back_to_main_menu_keyboard()
+            )
     else:
         await query.edit_message_text(
             message_text + "\n\nNo expense data for this week to generate charts.",
@@ -228,7 +279,6 @@ async def generate_weekly_summary(update: Update, context: ContextTypes.DEFAULT_
             reply_markup=back_to_main_menu_keyboard()
         )
 
-    db_session.close()
     return ConversationHandler.END
 
 
@@ -237,14 +287,9 @@ async def generate_monthly_summary(update: Update, context: ContextTypes.DEFAULT
     query = update.callback_query
     await query.answer("Generating this month's summary...")
 
-    db_session = SessionLocal()
-    summary_service = SummaryService(db_session)
-    user_service = UserService(db_session)
-    profile_service = ProfileService(db_session)
     visuals_service = VisualsService()
 
-    user_telegram_id = update.effective_user.id
-    user = user_service.get_user(user_telegram_id)
+    user, current_profile = get_identity(update, context)
 
     if not user:
         message = "It looks like you haven't started yet. Please use the /start command to begin!"
@@ -252,22 +297,18 @@ async def generate_monthly_summary(update: Update, context: ContextTypes.DEFAULT
             await query.edit_message_text(message)
         else:
             await context.bot.send_message(chat_id=update.effective_chat.id, text=message)
-        db_session.close()
         return ConversationHandler.END
 
-    current_profile = profile_service.get_current_profile(user_telegram_id)
-
     if not current_profile:
         await query.edit_message_text(
             "You need to select a profile first. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'.",
             reply_markup=back_to_main_menu_keyboard()
         )
-        db_session.close()
         return ConversationHandler.END
     
     currency_symbol = get_currency_symbol(current_profile.currency)
 
-    summary_data = summary_service.get_monthly_summary(current_profile.id)
+    summary_data = await summary_cache.get_summary(current_profile.id, "monthly")
 
     message_text = (
         f"<b>📊 This Month's Summary ({current_profile.name}):</b>\n\n"
@@ -276,12 +317,14 @@ async def generate_monthly_summary(update: Update, context: ContextTypes.DEFAULT
         f"💰 Total Income: {currency_symbol}{summary_data['total_income']:,}\n"
         f"📈 Remaining Balance: {currency_symbol}{summary_data['balance']:,}\n\n"
     )
+    message_text += _format_comparison(summary_data.get('comparison'), currency_symbol, "last month")
 
     if summary_data["budget_insights"]:
         message_text += "<b>Budget Insights:</b>\n"
         for insight in summary_data["budget_insights"]:
             message_text += f"- {insight}\n"
         message_text += "\n"
+    message_text += await _consume_anomalies(summary_data, current_profile.id, currency_symbol)
 
     if summary_data['expenses_by_category']:
         # Extract overall budget amount if available for the bar chart
@@ -341,6 +384,24 @@ async def generate_monthly_summary(update: Update, context: ContextTypes.DEFAULT
             caption="Top categories this month (Bar Chart):",
             reply_markup=back_to_main_menu_keyboard()
         )
+
+        trend = summary_data.get('daily_series')
+        if trend is not None:
+            # Rendered on a worker thread so the event loop keeps serving other chats
+            trend_chart_data = await asyncio.to_thread(
+                visuals_service.generate_trend_chart,
+                trend['dates'], trend['amounts'],
+                title=f"Daily Spending, Last {len(trend['dates'])} Days",
+                currency_symbol=currency_symbol
+            )
+            if not user.is_pro:
+                trend_chart_data = visuals_service.blur_image(trend_chart_data)
+            await context.bot.send_photo(
+                chat_id=update.effective_chat.id,
+                photo=InputFile(trend_chart_data),
+                caption=f"Your spending trend over the last {len(trend['dates'])} days:",
+                reply_markup=back_to_main_menu_keyboard()
+            )
     else:
         await query.edit_message_text(
             message_text + "\n\nNo expense data for this month to generate charts.",
@@ -348,5 +409,50 @@ async def generate_monthly_summary(update: Update, context: ContextTypes.DEFAULT
             reply_markup=back_to_main_menu_keyboard()
         )
 
-    db_session.close()
+    return ConversationHandler.END
+
+async def generate_spending_heatmap(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Sends a day-of-week by hour heatmap of the current profile's spending."""
+    query = update.callback_query
+    await query.answer("Building your spending heatmap...")
+
+    user, current_profile = get_identity(update, context)
+
+    if not user:
+        await query.edit_message_text("It looks like you haven't started yet. Please use the /start command to begin!")
+        return ConversationHandler.END
+
+    if not current_profile:
+        await query.edit_message_text(
+            "You need to select a profile first. Go to 'My Profile' -> 'View / Switch Profile' or 'Create New Profile'.",
+            reply_markup=back_to_main_menu_keyboard()
+        )
+        return ConversationHandler.END
+
+    currency_symbol = get_currency_symbol(current_profile.currency)
+    # Query and rendering both run on a worker thread so the event loop keeps serving other chats
+    grid, chart_data = await asyncio.to_thread(_render_spending_heatmap, VisualsService(), current_profile.id, currency_symbol)
+
+    if not grid.any():
+        await query.edit_message_text("No expense data yet to build a heatmap.", reply_markup=back_to_main_menu_keyboard())
+        return ConversationHandler.END
+
+    weekday, hour = divmod(int(grid.argmax()), 24)
+    day_name = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")[weekday]
+    message_text = (
+        f"<b>🕒 Spending Heatmap ({current_profile.name}):</b>\n\n"
+        f"Your busiest spending hour is <b>{day_name} {hour:02d}:00–{(hour + 1) % 24:02d}:00</b> "
+        f"({currency_symbol}{grid.max():,.2f} in total)."
+    )
+    if not user.is_pro:
+        chart_data = VisualsService().blur_image(chart_data)
+        message_text += "\n\n<i>Your spending patterns are blurred. Upgrade to Pro to see detailed charts!</i>"
+
+    await query.edit_message_text(message_text, parse_mode='HTML', reply_markup=back_to_main_menu_keyboard())
+    await context.bot.send_photo(
+        chat_id=update.effective_chat.id,
+        photo=InputFile(chart_data),
+        caption="Darker cells are the days and hours you spend the most:",
+        reply_markup=back_to_main_menu_keyboard()
+    )
     return ConversationHandler.END
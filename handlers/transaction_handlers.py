@@ -1,32 +1,30 @@
+import html
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from models import SessionLocal
-from services import ExpenseService, IncomeService, ProfileService
+from services import ExpenseService, IncomeService, TransactionHistoryService
+from services.transaction_history_service import HISTORY_PAGE_SIZE, history_cursor
 from .menu_handlers import back_to_main_menu_keyboard
+from .identity_handlers import get_identity
 import datetime
 from utils.datetime_utils import to_wat, wat_day_bounds_utc, wat_week_bounds_utc, wat_month_bounds_utc # Import new utilities
 from utils.misc_utils import get_currency_symbol # Import get_currency_symbol
+from utils.scratch_store import scratch_set, scratch_get, scratch_clear
 from datetime import timezone # Import timezone for UTC
 
 # States for transaction history pagination and clearing
 VIEW_TRANSACTIONS, CLEAR_HISTORY_MENU, CONFIRM_CLEAR_HISTORY = range(3)
 
-TRANSACTIONS_PER_PAGE = 5
+TRANSACTIONS_PER_PAGE = HISTORY_PAGE_SIZE
 
 async def transaction_history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Displays the last N transactions and provides pagination buttons."""
+    """Displays the newest transactions and provides pagination buttons."""
     query = update.callback_query
     if query:
         await query.answer()
 
-    db_session = SessionLocal()
-    profile_service = ProfileService(db_session)
-    expense_service = ExpenseService(db_session)
-    income_service = IncomeService(db_session)
-
-    user_telegram_id = update.effective_user.id
-    current_profile = profile_service.get_current_profile(user_telegram_id)
+    _, current_profile = get_identity(update, context)
 
     if not current_profile:
         message = "You need to select a profile first. Go to '👤 My Profile' -> '👀 View / Switch Profile' or '➕ Create New Profile'."
@@ -34,91 +32,83 @@ async def transaction_history_handler(update: Update, context: ContextTypes.DEFA
             await query.edit_message_text(message, reply_markup=back_to_main_menu_keyboard())
         else:
             await update.message.reply_text(message, reply_markup=back_to_main_menu_keyboard())
-        db_session.close()
         return ConversationHandler.END
 
-    all_transactions = []
-    expenses = expense_service.get_expenses_by_profile(current_profile.id)
-    incomes = income_service.get_incomes_by_profile(current_profile.id)
-
-    for exp in expenses:
-        all_transactions.append({
-            "type": "Expense",
-            "date": exp.date,
-            "amount": exp.amount,
-            "description": exp.description,
-            "category": exp.category.name if exp.category else "N/A"
-        })
-    for inc in incomes:
-        all_transactions.append({
-            "type": "Income",
-            "date": inc.date,
-            "amount": inc.amount,
-            "description": inc.source,
-            "category": "N/A"
-        })
-
-    # Sort transactions by date, newest first
-    all_transactions.sort(key=lambda x: x['date'], reverse=True)
-    context.user_data['all_transactions'] = all_transactions
-    context.user_data['current_transaction_page'] = 0
-    context.user_data['current_profile_currency'] = current_profile.currency # Store currency
-
-    return await send_transactions_page(update, context)
-
-async def send_transactions_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Sends the current page of transactions."""
-    all_transactions = context.user_data['all_transactions']
-    current_page = context.user_data['current_transaction_page']
-    currency_code = context.user_data.get('current_profile_currency', 'NGN') # Default to NGN
-    currency_symbol = get_currency_symbol(currency_code)
-
-    start_index = current_page * TRANSACTIONS_PER_PAGE
-    end_index = start_index + TRANSACTIONS_PER_PAGE
-    transactions_on_page = all_transactions[start_index:end_index]
-
-    if not transactions_on_page and current_page == 0:
+    # Only the keyset cursors are kept between pages, never the rows themselves
+    scratch_set(context.user_data, 'transaction_history', {
+        "profile_id": current_profile.id,
+        "currency": current_profile.currency,
+        "page": 0,
+        "first": None, # Cursor of the newest row on the current page
+        "last": None # Cursor of the oldest row on the current page
+    })
+    return await send_transactions_page(update, context, cursor=None, older=True)
+
+async def send_transactions_page(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor: list = None, older: bool = True) -> int:
+    """Fetches and sends the page after (older) or before (newer) the given cursor."""
+    history = scratch_get(context.user_data, 'transaction_history')
+    query = update.callback_query
+    if history is None:
+        message_text = "This history view has expired. Please open Transaction History again."
+        if query:
+            await query.edit_message_text(message_text, reply_markup=back_to_main_menu_keyboard())
+        else:
+            await update.message.reply_text(message_text, reply_markup=back_to_main_menu_keyboard())
+        return ConversationHandler.END
+
+    db_session = SessionLocal()
+    try:
+        transactions_on_page, has_more = TransactionHistoryService(db_session).get_page(
+            history['profile_id'], cursor=cursor, older=older, page_size=TRANSACTIONS_PER_PAGE
+        )
+        if not transactions_on_page and cursor is not None:
+            # The neighbouring page vanished (e.g. history was cleared); start again from the newest rows
+            history['page'] = 0
+            transactions_on_page, has_more = TransactionHistoryService(db_session).get_page(
+                history['profile_id'], page_size=TRANSACTIONS_PER_PAGE
+            )
+            older = True
+    finally:
+        db_session.close()
+
+    currency_symbol = get_currency_symbol(history.get('currency', 'NGN')) # Default to NGN
+
+    if not transactions_on_page:
         message_text = "You have no transactions yet for this profile."
         keyboard_buttons = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data="main_menu")]]
         reply_markup = InlineKeyboardMarkup(keyboard_buttons)
-    elif not transactions_on_page:
-        context.user_data['current_transaction_page'] -= 1 # Go back to previous page if empty
-        return await send_transactions_page(update, context) # Resend previous page
     else:
+        history['first'] = history_cursor(transactions_on_page[0])
+        history['last'] = history_cursor(transactions_on_page[-1])
+        if not older and not has_more:
+            history['page'] = 0 # Paged back to the newest rows
+
         message_text = "<b>📊 Transaction History:</b>\n\n"
         for t in transactions_on_page:
             amount_str = f"{currency_symbol}{t['amount']:,}"
             type_emoji = "🔴" if t['type'] == "Expense" else "🟢"
-            
-            # --- START LOGGING ---
-            logging.info(f"Before to_wat - Transaction Type: {t['type']}, Date: {t['date']}, TZInfo: {t['date'].tzinfo}, Type: {type(t['date'])}")
-            # --- END LOGGING ---
 
             # Convert to WAT for display
             wat_date = to_wat(t['date'])
-            
-            # --- START LOGGING ---
-            logging.info(f"After to_wat - Transaction Type: {t['type']}, Date: {wat_date}, TZInfo: {wat_date.tzinfo}, Type: {type(wat_date)}")
-            # --- END LOGGING ---
 
             message_text += (
-                f"{type_emoji} {amount_str} ({t['description']} - {wat_date.strftime('%b %d, %H:%M %Z%z')})\n"
+                f"{type_emoji} {amount_str} ({html.escape(str(t['description']))} - {wat_date.strftime('%b %d, %H:%M %Z%z')})\n"
             )
-        
-        message_text += f"\nPage {current_page + 1} of {((len(all_transactions) - 1) // TRANSACTIONS_PER_PAGE) + 1}"
+
+        message_text += f"\nPage {history['page'] + 1}"
 
         keyboard_buttons = []
-        if current_page > 0:
+        if history['page'] > 0:
             keyboard_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data="prev_transactions"))
-        if end_index < len(all_transactions):
+        if has_more or not older:
             keyboard_buttons.append(InlineKeyboardButton("➡️ Next", callback_data="next_transactions"))
-        
+
         # Add Clear History button
         bottom_buttons = [
             InlineKeyboardButton("🧹 Clear History", callback_data="clear_history_menu"),
             InlineKeyboardButton("🔙 Back to Main Menu", callback_data="main_menu")
         ]
-        
+
         # Ensure keyboard_buttons is always a list of lists before appending
         if keyboard_buttons:
             keyboard = [keyboard_buttons]
@@ -128,27 +118,34 @@ async def send_transactions_page(update: Update, context: ContextTypes.DEFAULT_T
         keyboard.append(bottom_buttons) # Add clear history and back button
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-    query = update.callback_query
     if query:
         await query.edit_message_text(message_text, parse_mode='HTML', reply_markup=reply_markup)
     else:
         await update.message.reply_html(message_text, reply_markup=reply_markup)
-    
+
     return VIEW_TRANSACTIONS
 
 async def show_next_transactions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Moves to the next page of transactions."""
+    """Moves to the next (older) page of transactions."""
     query = update.callback_query
     await query.answer()
-    context.user_data['current_transaction_page'] += 1
-    return await send_transactions_page(update, context)
+    history = scratch_get(context.user_data, 'transaction_history')
+    cursor = None
+    if history is not None:
+        history['page'] += 1
+        cursor = history['last']
+    return await send_transactions_page(update, context, cursor=cursor, older=True)
 
 async def show_prev_transactions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Moves to the previous page of transactions."""
+    """Moves to the previous (newer) page of transactions."""
     query = update.callback_query
     await query.answer()
-    context.user_data['current_transaction_page'] -= 1
-    return await send_transactions_page(update, context)
+    history = scratch_get(context.user_data, 'transaction_history')
+    cursor = None
+    if history is not None:
+        history['page'] = max(history['page'] - 1, 0)
+        cursor = history['first']
+    return await send_transactions_page(update, context, cursor=cursor, older=False)
 
 async def clear_history_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Displays options for clearing transaction history."""
@@ -177,10 +174,9 @@ async def execute_clear_history(update: Update, context: ContextTypes.DEFAULT_TY
     db_session = SessionLocal()
     expense_service = ExpenseService(db_session)
     income_service = IncomeService(db_session)
-    profile_service = ProfileService(db_session)
 
     user_telegram_id = update.effective_user.id
-    current_profile = profile_service.get_current_profile(user_telegram_id)
+    _, current_profile = get_identity(update, context)
     profile_id = current_profile.id if current_profile else None
 
     if not profile_id:
@@ -224,6 +220,7 @@ async def execute_clear_history(update: Update, context: ContextTypes.DEFAULT_TY
     await query.edit_message_text(message_text, reply_markup=back_to_main_menu_keyboard(), parse_mode='HTML')
     
     db_session.close()
+    scratch_clear(context.user_data, 'transaction_history')
     return ConversationHandler.END
 
 async def cancel_clear_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -231,4 +228,5 @@ async def cancel_clear_history(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     await query.edit_message_text("Clear history operation cancelled. Returning to main menu.", reply_markup=back_to_main_menu_keyboard())
+    scratch_clear(context.user_data, 'transaction_history')
     return ConversationHandler.END
@@ -1,2 +1,7 @@
 from .summary_jobs import send_weekly_summaries_job, send_monthly_summaries_job
-from .subscription_jobs import send_expiry_reminders_job, send_downgrade_notifications_job
\ No newline at end of file
+from .subscription_jobs import send_expiry_reminders_job, send_downgrade_notifications_job
+from .job_locks import single_run_job, try_acquire_job_lock, purge_job_runs_job
+from .scratch_jobs import sweep_scratch_store_job, SCRATCH_SWEEP_INTERVAL
+from .export_jobs import ExportJobManager, export_job_manager
+from .budget_alert_jobs import send_budget_alerts_job, queue_budget_alerts
+from .insight_jobs import detect_spending_anomalies_job
@@ -0,0 +1,36 @@
+import logging
+from telegram.ext import Application, ContextTypes
+from utils.misc_utils import get_currency_symbol
+
+logger = logging.getLogger(__name__)
+
+def format_budget_alert(alert: dict, currency: str) -> str:
+    symbol = get_currency_symbol(currency)
+    budget_name = f"{alert['period']} {alert['category_name']}"
+    spent, budget_amount = alert["spent_amount"], alert["budget_amount"]
+    if alert["threshold"] >= 100:
+        return (f"🔴 You've used all of your {budget_name} budget: "
+                f"<b>{symbol}{spent:,.2f}</b> spent of {symbol}{budget_amount:,.2f}.")
+    return (f"🟠 You've used {alert['threshold']}% of your {budget_name} budget: "
+            f"<b>{symbol}{spent:,.2f}</b> spent of {symbol}{budget_amount:,.2f}.")
+
+async def send_budget_alerts_job(context: ContextTypes.DEFAULT_TYPE):
+    """Sends the budget alerts queued by queue_budget_alerts as one message."""
+    data = context.job.data
+    text = "\n".join(format_budget_alert(alert, data["currency"]) for alert in data["alerts"])
+    try:
+        await context.bot.send_message(chat_id=data["chat_id"], text=text, parse_mode="HTML")
+    except Exception as e:
+        logger.error(f"Failed to send budget alerts to chat {data['chat_id']}: {e}")
+
+def queue_budget_alerts(application: Application, chat_id: int, alerts: list, currency: str = "NGN"):
+    """Hands budget alerts to the job queue so the handler's reply is not held up by sending them."""
+    if not alerts:
+        return
+    application.job_queue.run_once(
+        send_budget_alerts_job,
+        when=0,
+        data={"chat_id": chat_id, "alerts": list(alerts), "currency": currency or "NGN"},
+        chat_id=chat_id,
+        name=f"budget_alerts_{chat_id}"
+    )
@@ -0,0 +1,170 @@
+import os
+import uuid
+import time
+import asyncio
+import logging
+import datetime
+import threading
+from datetime import timezone
+from sqlalchemy import delete
+from telegram import InputFile
+from telegram.error import BadRequest
+from telegram.ext import Application
+from models import SessionLocal, ExportRun
+from services.report_service import generate_report_file
+from handlers.menu_handlers import back_to_main_menu_keyboard
+from jobs.job_locks import WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_EXPORTS_PER_USER = int(os.getenv("MAX_CONCURRENT_EXPORTS_PER_USER", "1"))
+EXPORT_PROGRESS_INTERVAL = 2.0 # Seconds between progress message edits; keeps us well under Telegram's edit limits
+EXPORT_RUN_TIMEOUT_SECONDS = 30 * 60 # An export_runs row this old is taken to belong to a process that died mid-export
+
+class ExportJob:
+    def __init__(self, user_id: int, chat_id: int, message_id: int, profile_id: int, profile_name: str, fmt: str, label: str, start_date=None, end_date=None):
+        self.job_id = uuid.uuid4().hex[:8]
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id # The message edited with progress
+        self.profile_id = profile_id
+        self.profile_name = profile_name
+        self.fmt = fmt
+        self.label = label
+        self.start_date = start_date
+        self.end_date = end_date
+        self.rows_written = 0
+        self.total_rows = None
+        self.created_at = time.monotonic()
+
+    def update_progress(self, rows_written: int, total_rows: int):
+        """Called from the export thread; plain attribute writes are safe to read from the event loop."""
+        self.rows_written = rows_written
+        self.total_rows = total_rows
+
+    def progress_text(self) -> str:
+        if self.total_rows is None:
+            return f"⏳ Export {self.job_id}: counting your transactions..."
+        percent = 100 if not self.total_rows else int(self.rows_written * 100 / self.total_rows)
+        return f"⏳ Export {self.job_id} ({self.label}): {percent}% - {self.rows_written:,} of {self.total_rows:,} rows written"
+
+class ExportJobManager:
+    """
+    Runs exports in the background: the file is built on a worker thread while the event loop
+    edits a progress message, then the document is delivered. Running jobs are recorded in the
+    export_runs table, so the per-user limit holds across uvicorn workers and worker processes.
+    """
+    def __init__(self, max_per_user: int = MAX_CONCURRENT_EXPORTS_PER_USER):
+        self.max_per_user = max_per_user
+        self._jobs = {} # job_id -> ExportJob, for the jobs running in this process
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def _active_runs(self, db_session, user_id: int) -> list:
+        cutoff = datetime.datetime.now(timezone.utc) - datetime.timedelta(seconds=EXPORT_RUN_TIMEOUT_SECONDS)
+        db_session.execute(delete(ExportRun).where(ExportRun.started_at < cutoff))
+        return db_session.query(ExportRun.job_id).filter(ExportRun.user_id == user_id).order_by(ExportRun.id).all()
+
+    def active_jobs_for(self, user_id: int) -> list:
+        """Returns the ids of the user's running exports, in any process."""
+        db_session = SessionLocal()
+        try:
+            job_ids = [row.job_id for row in self._active_runs(db_session, user_id)]
+            db_session.commit()
+            return job_ids
+        finally:
+            db_session.close()
+
+    def _claim(self, job: ExportJob) -> bool:
+        """Records the run, then keeps it only if it is within the user's first max_per_user runs."""
+        db_session = SessionLocal()
+        try:
+            db_session.add(ExportRun(job_id=job.job_id, user_id=job.user_id, worker_id=WORKER_ID))
+            db_session.commit()
+            job_ids = [row.job_id for row in self._active_runs(db_session, job.user_id)]
+            db_session.commit()
+        finally:
+            db_session.close()
+        if job.job_id in job_ids[:self.max_per_user]:
+            return True
+        self._release(job)
+        return False
+
+    def _release(self, job: ExportJob):
+        db_session = SessionLocal()
+        try:
+            db_session.execute(delete(ExportRun).where(ExportRun.job_id == job.job_id))
+            db_session.commit()
+        finally:
+            db_session.close()
+
+    def submit(self, application: Application, job: ExportJob):
+        """Starts the job, or returns None if the user already has the maximum number of exports running."""
+        if not self._claim(job):
+            return None
+        with self._lock:
+            self._jobs[job.job_id] = job
+        application.create_task(self._run(application, job), name=f"export-{job.job_id}")
+        logger.info(f"Export job {job.job_id} started for user {job.user_id} ({job.fmt}, {job.label}).")
+        return job
+
+    async def _edit_progress(self, application: Application, job: ExportJob, text: str):
+        try:
+            await application.bot.edit_message_text(chat_id=job.chat_id, message_id=job.message_id, text=text)
+        except BadRequest as e:
+            logger.debug(f"Could not update progress for export {job.job_id}: {e}")
+
+    async def _run(self, application: Application, job: ExportJob):
+        report_file = None
+        try:
+            build = asyncio.ensure_future(asyncio.to_thread(
+                generate_report_file, job.profile_id, job.fmt, job.start_date, job.end_date,
+                progress_callback=job.update_progress
+            ))
+            last_text = None
+            while not build.done():
+                await asyncio.wait({build}, timeout=EXPORT_PROGRESS_INTERVAL)
+                text = job.progress_text()
+                if text != last_text and not build.done():
+                    await self._edit_progress(application, job, text)
+                    last_text = text
+            report_file = build.result()
+
+            await self._edit_progress(application, job, f"✅ Export {job.job_id} ready: {job.rows_written:,} rows. Sending the file...")
+            file_name = f"expense_income_report_{job.profile_name}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.{job.fmt}"
+            await application.bot.send_document(
+                chat_id=job.chat_id,
+                document=InputFile(report_file, filename=file_name),
+                caption=f"Your {job.label.lower()} report for profile '{job.profile_name}' is ready!",
+                reply_markup=back_to_main_menu_keyboard()
+            )
+            self.completed += 1
+            logger.info(f"Export job {job.job_id} delivered {job.rows_written} rows in {time.monotonic() - job.created_at:.1f}s.")
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Export job {job.job_id} failed: {e}")
+            try:
+                await application.bot.send_message(
+                    chat_id=job.chat_id,
+                    text=f"Sorry, export {job.job_id} could not be generated. Please try again later.",
+                    reply_markup=back_to_main_menu_keyboard()
+                )
+            except Exception as notify_error:
+                logger.error(f"Could not notify user {job.user_id} about failed export {job.job_id}: {notify_error}")
+        finally:
+            if report_file is not None:
+                report_file.close()
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+            try:
+                await asyncio.to_thread(self._release, job)
+            except Exception as e:
+                logger.error(f"Could not clear the run record of export {job.job_id}: {e}") # Expires after EXPORT_RUN_TIMEOUT_SECONDS
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            running = len(self._jobs)
+        return {"running": running, "completed": self.completed, "failed": self.failed}
+
+export_job_manager = ExportJobManager()
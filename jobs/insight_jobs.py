@@ -0,0 +1,12 @@
+import asyncio
+import logging
+from telegram.ext import ContextTypes
+from services.insight_service import detect_spending_anomalies
+
+logger = logging.getLogger(__name__)
+
+async def detect_spending_anomalies_job(context: ContextTypes.DEFAULT_TYPE):
+    """Nightly: flags yesterday's unusual category spending for every profile; the next summary shows it."""
+    logger.info("Running spending anomaly detection job...")
+    stored = await asyncio.to_thread(detect_spending_anomalies) # Set-based DB work and NumPy stay off the event loop
+    logger.info(f"Spending anomaly detection stored {stored} insight(s).")
@@ -0,0 +1,143 @@
+import os
+import zlib
+import socket
+import logging
+import datetime
+import functools
+import threading
+from datetime import timezone
+from sqlalchemy import text, update, delete
+from telegram.ext import ContextTypes
+from models import SessionLocal, JobRun, dialect_insert
+from models.base import engine
+
+logger = logging.getLogger(__name__)
+
+JOB_LOCK_NAMESPACE = 72613 # First key of the two-key advisory lock, reserved for scheduled jobs
+JOB_RUN_RETENTION_DAYS = 30
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+# Stand-in for advisory locks on databases without them (SQLite in local runs and tests)
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+def _advisory_key(job_name: str) -> int:
+    return zlib.crc32(job_name.encode("utf-8")) & 0x7FFFFFFF
+
+def _local_lock(job_name: str) -> threading.Lock:
+    with _local_locks_guard:
+        return _local_locks.setdefault(job_name, threading.Lock())
+
+class JobLock:
+    """Holds a job's lock for one run. Release it when the run is done."""
+    def __init__(self, job_name: str, slot: int, connection=None, local_lock: threading.Lock = None):
+        self.job_name = job_name
+        self.slot = slot
+        self._connection = connection
+        self._local_lock = local_lock
+
+    def release(self):
+        db_session = SessionLocal()
+        try:
+            db_session.execute(
+                update(JobRun)
+                .where(JobRun.job_name == self.job_name, JobRun.slot == self.slot)
+                .values(finished_at=datetime.datetime.now(timezone.utc))
+            )
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Failed to record completion of job '{self.job_name}': {e}")
+        finally:
+            db_session.close()
+
+        if self._connection is not None:
+            self._connection.execute(text("SELECT pg_advisory_unlock(:namespace, :key)"), {"namespace": JOB_LOCK_NAMESPACE, "key": _advisory_key(self.job_name)})
+            self._connection.close()
+        if self._local_lock is not None:
+            self._local_lock.release()
+
+def _claim_slot(job_name: str, slot: int) -> bool:
+    """Records the run for this slot. Returns False if another worker already ran the job in this slot."""
+    db_session = SessionLocal()
+    try:
+        result = db_session.execute(
+            dialect_insert(JobRun, db_session.get_bind())
+            .values(job_name=job_name, slot=slot, worker_id=WORKER_ID, started_at=datetime.datetime.now(timezone.utc))
+            .on_conflict_do_nothing(index_elements=["job_name", "slot"])
+        )
+        db_session.commit()
+        return result.rowcount == 1
+    finally:
+        db_session.close()
+
+def try_acquire_job_lock(job_name: str, slot_seconds: int):
+    """
+    Returns a JobLock if this worker should run job_name now, otherwise None.
+    The advisory lock keeps two workers from running the job at the same time, and the
+    (job_name, slot) row keeps it from running twice in the same scheduling window.
+    """
+    slot = int(datetime.datetime.now(timezone.utc).timestamp()) // slot_seconds
+    connection = None
+    local_lock = None
+
+    if engine.dialect.name == "postgresql":
+        connection = engine.connect()
+        acquired = connection.execute(
+            text("SELECT pg_try_advisory_lock(:namespace, :key)"),
+            {"namespace": JOB_LOCK_NAMESPACE, "key": _advisory_key(job_name)}
+        ).scalar()
+        connection.commit()
+        if not acquired:
+            connection.close()
+            return None
+    else:
+        local_lock = _local_lock(job_name)
+        if not local_lock.acquire(blocking=False):
+            return None
+
+    try:
+        claimed = _claim_slot(job_name, slot)
+    except Exception:
+        claimed = False
+        logger.exception(f"Failed to claim run slot for job '{job_name}'.")
+
+    if not claimed:
+        if connection is not None:
+            connection.execute(text("SELECT pg_advisory_unlock(:namespace, :key)"), {"namespace": JOB_LOCK_NAMESPACE, "key": _advisory_key(job_name)})
+            connection.close()
+        if local_lock is not None:
+            local_lock.release()
+        return None
+
+    return JobLock(job_name, slot, connection=connection, local_lock=local_lock)
+
+def single_run_job(job_name: str, slot_seconds: int):
+    """
+    Wraps a job-queue callback so that, across all workers, it runs at most once per slot_seconds window.
+    Every uvicorn worker can register the same jobs; only the one that wins the lock runs each window.
+    """
+    def decorator(job_callback):
+        @functools.wraps(job_callback)
+        async def wrapper(context: ContextTypes.DEFAULT_TYPE):
+            job_lock = try_acquire_job_lock(job_name, slot_seconds)
+            if job_lock is None:
+                logger.info(f"Skipping job '{job_name}': another worker holds it for this window.")
+                return
+            try:
+                await job_callback(context)
+            finally:
+                job_lock.release()
+        return wrapper
+    return decorator
+
+async def purge_job_runs_job(context: ContextTypes.DEFAULT_TYPE):
+    """Deletes old job run records."""
+    cutoff = datetime.datetime.now(timezone.utc) - datetime.timedelta(days=JOB_RUN_RETENTION_DAYS)
+    db_session = SessionLocal()
+    try:
+        purged = db_session.execute(delete(JobRun).where(JobRun.started_at < cutoff)).rowcount
+        db_session.commit()
+        logger.info(f"Purged {purged} job run record(s).")
+    finally:
+        db_session.close()
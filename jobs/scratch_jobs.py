@@ -0,0 +1,17 @@
+import logging
+from telegram.ext import ContextTypes
+from utils.scratch_store import sweep_scratch_store
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_SWEEP_INTERVAL = 600 # Seconds between sweeps of expired scratch entries
+
+async def sweep_scratch_store_job(context: ContextTypes.DEFAULT_TYPE):
+    """Evicts expired per-user scratch entries. Runs in every process since each holds its own user_data."""
+    application = context.application
+    evicted_by_user = sweep_scratch_store(application.user_data)
+    if evicted_by_user:
+        # The sweep edits user_data outside any handler, so PTB would not persist these users on its own
+        application.mark_data_for_update_persistence(user_ids=list(evicted_by_user))
+        evicted = sum(evicted_by_user.values())
+        logger.info(f"Evicted {evicted} expired scratch entr{'y' if evicted == 1 else 'ies'}.")
@@ -1,23 +1,32 @@
 import os
+import hmac
+import asyncio
 import logging
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, ContextTypes, CallbackQueryHandler,
-    ConversationHandler, MessageHandler, filters
+    ConversationHandler, MessageHandler, TypeHandler, filters
 )
-from models import create_all_tables, SessionLocal, add_default_categories, User
-from services import UserService, ReminderService, ReferralService, ProfileService
-from jobs import send_weekly_summaries_job, send_monthly_summaries_job, send_downgrade_notifications_job, send_expiry_reminders_job
+from models import create_all_tables, ensure_indexes, ensure_columns, SessionLocal, add_default_categories, User
+from persistence import SQLAlchemyPersistence
+from services import UserService, ReminderService, ReferralService, ProfileService, UpdateQueueService, update_deduplicator, backfill_usage_counters, recompute_budget_totals, backfill_budget_definitions
+from jobs import send_weekly_summaries_job, send_monthly_summaries_job, send_downgrade_notifications_job, send_expiry_reminders_job, single_run_job, purge_job_runs_job, sweep_scratch_store_job, SCRATCH_SWEEP_INTERVAL, export_job_manager, detect_spending_anomalies_job
+from utils.scratch_store import get_scratch_stats
+from services.identity_service import identity_cache
+from services.category_cache import category_cache
+from services.summary_cache import summary_cache
+from services.history_cache import history_cache
+from services.cache_generations import cache_generation_watch
 from handlers import (
     main_menu_keyboard, back_to_main_menu_keyboard, summary_menu_keyboard, my_profile_menu_keyboard, upgrade_to_pro_menu_keyboard,
     start_expense_logging, enter_expense_details, select_category, add_custom_category, cancel,
-    CHOOSING_LOG_TYPE, ENTER_EXPENSE_DETAILS, SELECT_CATEGORY, ADD_CUSTOM_CATEGORY, UPLOAD_RECEIPT,
-    prompt_manual_entry, start_ocr_logging, upload_receipt,
+    CHOOSING_LOG_TYPE, ENTER_EXPENSE_DETAILS, SELECT_CATEGORY, ADD_CUSTOM_CATEGORY, UPLOAD_RECEIPT, BULK_ENTRY, CONFIRM_BULK,
+    prompt_manual_entry, start_ocr_logging, upload_receipt, prompt_bulk_entry, enter_bulk_expenses, confirm_bulk_expenses,
     start_income_logging, enter_income_details, cancel_income,
     ENTER_INCOME_DETAILS,
     check_subscription_status, upgrade_confirm,
-    generate_today_summary, generate_weekly_summary, generate_monthly_summary,
+    generate_today_summary, generate_weekly_summary, generate_monthly_summary, generate_spending_heatmap,
     start_set_budget, choose_budget_period, enter_budget_amount, choose_budget_category, cancel_budget_op,
     CHOOSE_BUDGET_PERIOD, ENTER_BUDGET_AMOUNT, CHOOSE_BUDGET_CATEGORY,
     toggle_daily_reminders_handler, manage_reminders_menu, prompt_for_reminder_time, set_reminder_time, # Import reminder handlers
@@ -30,6 +39,10 @@ from handlers import (
     transaction_history_handler, show_next_transactions, show_prev_transactions,
     VIEW_TRANSACTIONS, CLEAR_HISTORY_MENU, CONFIRM_CLEAR_HISTORY, # Add new states
     clear_history_menu_handler, execute_clear_history, cancel_clear_history, # Add new handlers
+    search_command, search_page_callback,
+    export_format_handler, export_range_handler,
+    start_import, receive_import_file, AWAIT_IMPORT_FILE,
+    resolve_identity, IDENTITY_HANDLER_GROUP,
     set_currency_and_create_profile, change_currency_handler, set_currency_handler, # Import currency handlers
     SET_REMINDER_TIME, MANAGE_REMINDER_MENU, CHANGE_CURRENCY # Import new reminder state and currency change state
 )
@@ -40,6 +53,7 @@ import json
 
 # FastAPI imports
 from fastapi import FastAPI, Request, BackgroundTasks, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
 
 # Load environment variables from .env file
@@ -55,6 +69,16 @@ logger = logging.getLogger(__name__)
 # Timezone for user-facing messages
 AFRICA_LAGOS_TZ = ZoneInfo("Africa/Lagos")
 
+# 'inline' processes updates in this process; 'queue' only appends them to the update queue for worker.py
+UPDATE_INGRESS_MODE = os.getenv("UPDATE_INGRESS_MODE", "inline").lower()
+
+# Keep conversation state and user_data in the database so restarts don't drop in-flight conversations.
+# On by default only in queue mode, where each chat is handled by one worker process; several inline uvicorn
+# workers would each write their own copy of a user's data and the last writer would win on bot_state.
+PERSISTENCE_ENABLED = os.getenv("PERSISTENCE_ENABLED", "true" if UPDATE_INGRESS_MODE == "queue" else "false").lower() == "true"
+
+DAY_SECONDS = 24 * 60 * 60 # Run-lock window for daily, weekly and monthly jobs (all fire at most once per UTC day)
+
 # --- FastAPI App Initialization ---
 app = FastAPI()
 
@@ -93,6 +117,11 @@ async def send_reminders_job(context: ContextTypes.DEFAULT_TYPE):
     db_session.close()
 
 
+async def purge_processed_updates_job(context: ContextTypes.DEFAULT_TYPE):
+    """Removes update ids outside Telegram's redelivery window from the shared dedup table."""
+    purged = update_deduplicator.purge_shared_table()
+    logger.info(f"Purged {purged} processed update id(s) from the dedup table.")
+
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
@@ -127,6 +156,9 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
     elif query.data == "summary_this_month":
         await generate_monthly_summary(update, context)
         return
+    elif query.data == "summary_heatmap":
+        await generate_spending_heatmap(update, context)
+        return
     elif query.data == "view_switch_profile":
         await switch_profile_handler(update, context)
         return
@@ -146,7 +178,7 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
         await transaction_history_handler(update, context)
         return
     elif query.data.startswith("verify_payment_"):
-        await verify_payment_handler(update, context, application=ptb_application)
+        await verify_payment_handler(update, context, application=context.application)
         return
     elif query.data.startswith("switch_profile_"):
         db_session = SessionLocal()
@@ -178,24 +210,26 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
             if query.message.reply_markup:
                 await query.edit_message_reply_markup(reply_markup=None)
 
-# --- FastAPI Lifecycle Events ---
-@app.on_event("startup")
-async def startup_event():
-    logger.info("FastAPI app starting up. Initializing Telegram bot...")
-    global ptb_application
-
-    telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not telegram_bot_token:
-        logger.error("TELEGRAM_BOT_TOKEN not found in environment variables.")
-        raise ValueError("TELEGRAM_BOT_TOKEN is not set.")
-
-    ptb_application = Application.builder().token(telegram_bot_token).build()
-    await ptb_application.initialize() # Initialize the application
-
+def build_ptb_application(telegram_bot_token: str, processes_updates: bool = True) -> Application:
+    """
+    Builds the PTB Application with all handlers registered. Shared by the webhook app and worker.py.
+    With processes_updates=False (the webhook in queue mode) the Application only sends messages and
+    runs scheduled jobs, so it gets no persistence: the workers own bot_state and per-user data.
+    """
+    persistent = PERSISTENCE_ENABLED and processes_updates
+    builder = Application.builder().token(telegram_bot_token)
+    if persistent:
+        builder = builder.persistence(SQLAlchemyPersistence())
+    application = builder.build()
 
     # --- Register handlers ---
+    # Resolve the user and current profile once per update, before any other handler runs
+    application.add_handler(TypeHandler(Update, resolve_identity), group=IDENTITY_HANDLER_GROUP)
+
     # Unified Expense and OCR Conversation Handler
     expense_conv_handler = ConversationHandler(
+        name="expense_logging",
+        persistent=persistent,
         entry_points=[
             CallbackQueryHandler(start_expense_logging, pattern="^log_expense$"),
             CommandHandler("logexpense", start_expense_logging)
@@ -203,18 +237,23 @@ async def startup_event():
         states={
             CHOOSING_LOG_TYPE: [
                 CallbackQueryHandler(prompt_manual_entry, pattern="^log_manual$"),
-                CallbackQueryHandler(start_ocr_logging, pattern="^log_ocr$")
+                CallbackQueryHandler(start_ocr_logging, pattern="^log_ocr$"),
+                CallbackQueryHandler(prompt_bulk_entry, pattern="^log_bulk$")
             ],
             ENTER_EXPENSE_DETAILS: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_expense_details)],
             UPLOAD_RECEIPT: [MessageHandler(filters.PHOTO, upload_receipt)],
             SELECT_CATEGORY: [CallbackQueryHandler(select_category, pattern="^category_.*$|^add_custom_category$")],
             ADD_CUSTOM_CATEGORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_custom_category)],
+            BULK_ENTRY: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_bulk_expenses)],
+            CONFIRM_BULK: [CallbackQueryHandler(confirm_bulk_expenses, pattern="^confirm_bulk$")],
         },
         fallbacks=[CallbackQueryHandler(cancel, pattern="^cancel$"), CommandHandler("cancel", cancel)],
     )
 
-    ptb_application.add_handler(expense_conv_handler)
-    ptb_application.add_handler(ConversationHandler(
+    application.add_handler(expense_conv_handler)
+    application.add_handler(ConversationHandler(
+        name="profile_creation",
+        persistent=persistent,
         entry_points=[CommandHandler("start", start), CallbackQueryHandler(start_create_profile, pattern="^create_new_profile$")],
         states={
             CREATE_PROFILE_TYPE: [CallbackQueryHandler(create_profile_type, pattern="^profile_type_.*$")],
@@ -223,7 +262,9 @@ async def startup_event():
         },
         fallbacks=[CallbackQueryHandler(cancel, pattern="^cancel$"), CommandHandler("cancel", cancel)],
     ))
-    ptb_application.add_handler(ConversationHandler(
+    application.add_handler(ConversationHandler(
+        name="transaction_history",
+        persistent=persistent,
         entry_points=[CallbackQueryHandler(transaction_history_handler, pattern="^transaction_history$")],
         states={
             VIEW_TRANSACTIONS: [
@@ -239,12 +280,16 @@ async def startup_event():
         },
         fallbacks=[CallbackQueryHandler(cancel, pattern="^cancel$"), CommandHandler("cancel", cancel)],
     ))
-    ptb_application.add_handler(ConversationHandler(
+    application.add_handler(ConversationHandler(
+        name="income_logging",
+        persistent=persistent,
         entry_points=[CallbackQueryHandler(start_income_logging, pattern="^log_income$")],
         states={ENTER_INCOME_DETAILS: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_income_details)]},
         fallbacks=[CallbackQueryHandler(cancel_income, pattern="^cancel$"), CommandHandler("cancel", cancel_income)],
     ))
-    ptb_application.add_handler(ConversationHandler(
+    application.add_handler(ConversationHandler(
+        name="budget_setting",
+        persistent=persistent,
         entry_points=[CallbackQueryHandler(start_set_budget, pattern="^start_set_budget$")],
         states={
             CHOOSE_BUDGET_PERIOD: [CallbackQueryHandler(choose_budget_period, pattern="^budget_period_.*$")],
@@ -254,7 +299,9 @@ async def startup_event():
         fallbacks=[CallbackQueryHandler(cancel_budget_op, pattern="^cancel$"), CommandHandler("cancel", cancel_budget_op)],
     ))
     
-    ptb_application.add_handler(ConversationHandler(
+    application.add_handler(ConversationHandler(
+        name="currency_change",
+        persistent=persistent,
         entry_points=[CallbackQueryHandler(change_currency_handler, pattern="^change_currency$")],
         states={
             CHANGE_CURRENCY: [CallbackQueryHandler(set_currency_handler, pattern="^set_currency_.*$")],
@@ -262,7 +309,9 @@ async def startup_event():
         fallbacks=[CallbackQueryHandler(cancel, pattern="^cancel$"), CommandHandler("cancel", cancel)],
     ))
     
-    ptb_application.add_handler(ConversationHandler(
+    application.add_handler(ConversationHandler(
+        name="reminder_settings",
+        persistent=persistent,
         entry_points=[CallbackQueryHandler(manage_reminders_menu, pattern="^manage_reminders$")],
         states={
             MANAGE_REMINDER_MENU: [
@@ -275,28 +324,79 @@ async def startup_event():
         fallbacks=[CallbackQueryHandler(cancel, pattern="^cancel$"), CommandHandler("cancel", cancel)],
     ))
     
-    ptb_application.add_handler(CommandHandler("start", start)) # Moved here from conv handler entry points
-    ptb_application.add_handler(CallbackQueryHandler(check_subscription_status, pattern="^check_subscription$"))
-    ptb_application.add_handler(CallbackQueryHandler(upgrade_confirm, pattern="^upgrade_monthly$|^upgrade_yearly$"))
-    ptb_application.add_handler(CallbackQueryHandler(generate_referral_link_handler, pattern="^refer_a_friend$"))
-    ptb_application.add_handler(CallbackQueryHandler(verify_payment_handler, pattern="^verify_payment$"))
-    ptb_application.add_handler(CallbackQueryHandler(switch_profile_handler, pattern="^view_switch_profile$"))
-    ptb_application.add_handler(CallbackQueryHandler(button_callback_handler))
+    application.add_handler(ConversationHandler(
+        name="csv_import",
+        persistent=persistent,
+        entry_points=[
+            CallbackQueryHandler(start_import, pattern="^import_logs$"),
+            CommandHandler("import", start_import)
+        ],
+        states={
+            AWAIT_IMPORT_FILE: [MessageHandler(filters.Document.ALL, receive_import_file)],
+        },
+        fallbacks=[CallbackQueryHandler(cancel, pattern="^cancel$"), CommandHandler("cancel", cancel)],
+    ))
 
-    # --- Job Queue Setup ---
-    job_queue = ptb_application.job_queue
-    job_queue.run_repeating(send_reminders_job, interval=300, first=10) # Run every 5 minutes
-    job_queue.run_daily(send_weekly_summaries_job, time=datetime.time(hour=21, minute=0, tzinfo=AFRICA_LAGOS_TZ), days=(6,))
-    job_queue.run_monthly(send_monthly_summaries_job, when=datetime.time(hour=22, minute=0, tzinfo=AFRICA_LAGOS_TZ), day=-1)
-    job_queue.run_daily(send_downgrade_notifications_job, time=datetime.time(hour=23, minute=0, tzinfo=AFRICA_LAGOS_TZ))
-    job_queue.run_daily(send_expiry_reminders_job, time=datetime.time(hour=9, minute=0, tzinfo=AFRICA_LAGOS_TZ))
+    application.add_handler(CommandHandler("start", start)) # Moved here from conv handler entry points
+    application.add_handler(CallbackQueryHandler(check_subscription_status, pattern="^check_subscription$"))
+    application.add_handler(CallbackQueryHandler(upgrade_confirm, pattern="^upgrade_monthly$|^upgrade_yearly$"))
+    application.add_handler(CallbackQueryHandler(generate_referral_link_handler, pattern="^refer_a_friend$"))
+    application.add_handler(CallbackQueryHandler(verify_payment_handler, pattern="^verify_payment$"))
+    application.add_handler(CallbackQueryHandler(switch_profile_handler, pattern="^view_switch_profile$"))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CallbackQueryHandler(search_page_callback, pattern="^search_next$|^search_prev$"))
+    application.add_handler(CallbackQueryHandler(export_format_handler, pattern="^export_fmt_"))
+    application.add_handler(CallbackQueryHandler(export_range_handler, pattern="^export_range_"))
+    application.add_handler(CallbackQueryHandler(button_callback_handler))
 
-    # --- Database Initialization ---
+    # Scratch entries live in this process's user_data, so every process that handles updates sweeps its own
+    if processes_updates:
+        application.job_queue.run_repeating(sweep_scratch_store_job, interval=SCRATCH_SWEEP_INTERVAL, first=SCRATCH_SWEEP_INTERVAL)
+
+    return application
+
+def prepare_database():
+    """Creates and migrates the schema and runs the startup backfills. Shared by the webhook app and worker.py."""
     create_all_tables()
+    ensure_columns()
+    ensure_indexes()
+    backfill_usage_counters() # Seeds quota counters that don't exist yet; existing ones are left alone
+    backfill_budget_definitions() # Turns budgets set before recurring definitions into definitions
+    recompute_budget_totals() # Running budget totals may lag if expenses were written outside the services
     db_session = SessionLocal()
     add_default_categories(db_session)
     db_session.close()
 
+# --- FastAPI Lifecycle Events ---
+@app.on_event("startup")
+async def startup_event():
+    logger.info("FastAPI app starting up. Initializing Telegram bot...")
+    global ptb_application
+
+    telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not telegram_bot_token:
+        logger.error("TELEGRAM_BOT_TOKEN not found in environment variables.")
+        raise ValueError("TELEGRAM_BOT_TOKEN is not set.")
+
+    # --- Database Initialization ---
+    # Before initialize(): with persistence on, initialize() loads the bot_state table
+    prepare_database()
+
+    ptb_application = build_ptb_application(telegram_bot_token, processes_updates=UPDATE_INGRESS_MODE != "queue")
+    await ptb_application.initialize() # Initialize the application
+
+    # --- Job Queue Setup ---
+    # Every uvicorn worker registers the jobs; single_run_job makes sure each window runs on one worker only
+    job_queue = ptb_application.job_queue
+    job_queue.run_repeating(single_run_job("send_reminders", slot_seconds=300)(send_reminders_job), interval=300, first=10) # Run every 5 minutes
+    job_queue.run_daily(single_run_job("weekly_summaries", slot_seconds=DAY_SECONDS)(send_weekly_summaries_job), time=datetime.time(hour=21, minute=0, tzinfo=AFRICA_LAGOS_TZ), days=(6,))
+    job_queue.run_monthly(single_run_job("monthly_summaries", slot_seconds=DAY_SECONDS)(send_monthly_summaries_job), when=datetime.time(hour=22, minute=0, tzinfo=AFRICA_LAGOS_TZ), day=-1)
+    job_queue.run_daily(single_run_job("downgrade_notifications", slot_seconds=DAY_SECONDS)(send_downgrade_notifications_job), time=datetime.time(hour=23, minute=0, tzinfo=AFRICA_LAGOS_TZ))
+    job_queue.run_daily(single_run_job("expiry_reminders", slot_seconds=DAY_SECONDS)(send_expiry_reminders_job), time=datetime.time(hour=9, minute=0, tzinfo=AFRICA_LAGOS_TZ))
+    job_queue.run_daily(single_run_job("purge_processed_updates", slot_seconds=DAY_SECONDS)(purge_processed_updates_job), time=datetime.time(hour=3, minute=0, tzinfo=AFRICA_LAGOS_TZ))
+    job_queue.run_daily(single_run_job("purge_job_runs", slot_seconds=DAY_SECONDS)(purge_job_runs_job), time=datetime.time(hour=3, minute=30, tzinfo=AFRICA_LAGOS_TZ))
+    job_queue.run_daily(single_run_job("spending_anomalies", slot_seconds=DAY_SECONDS)(detect_spending_anomalies_job), time=datetime.time(hour=2, minute=0, tzinfo=AFRICA_LAGOS_TZ))
+
     # --- Set Webhook ---
     webhook_url = os.getenv("WEBHOOK_URL") + "/webhook" # Assuming /webhook endpoint
     webhook_secret = os.getenv("WEBHOOK_SECRET") # Optional but recommended
@@ -321,9 +421,19 @@ async def shutdown_event():
         await ptb_application.stop()
         await ptb_application.updater.stop() # Ensure updater is stopped
         await ptb_application.bot.delete_webhook()
+        await ptb_application.shutdown() # Flushes buffered persistence writes
         logger.info("PTB Application stopped and webhook deleted.")
 
 # --- Webhook Endpoint ---
+def enqueue_telegram_update(update_json: dict):
+    """Durably appends an update to the update queue; worker.py processes it."""
+    db_session = SessionLocal()
+    try:
+        if not UpdateQueueService(db_session).enqueue(update_json):
+            update_deduplicator.record_duplicate(update_json.get('update_id')) # Already queued; Telegram redelivered it
+    finally:
+        db_session.close()
+
 async def process_telegram_update(update_json: dict):
     """Processes a Telegram Update object in the background."""
     global ptb_application
@@ -331,8 +441,18 @@ async def process_telegram_update(update_json: dict):
         logger.error("PTB Application not initialized.")
         return
 
-    update = Update.de_json(update_json, ptb_application.bot)
-    await ptb_application.process_update(update)
+    # Telegram retries deliveries after slow responses; never run the same update twice
+    update_id = update_json["update_id"]
+    if not await asyncio.to_thread(update_deduplicator.begin, update_id):
+        return
+
+    try:
+        update = Update.de_json(update_json, ptb_application.bot)
+        await ptb_application.process_update(update)
+    except Exception:
+        update_deduplicator.release(update_id) # Not processed, so a redelivery may run it
+        raise
+    await asyncio.to_thread(update_deduplicator.mark_processed, update_id)
 
 @app.post("/webhook")
 async def webhook_receiver(request: Request, background_tasks: BackgroundTasks):
@@ -345,6 +465,11 @@ async def webhook_receiver(request: Request, background_tasks: BackgroundTasks):
         if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != webhook_secret:
             raise HTTPException(status_code=403, detail="Invalid webhook secret token")
 
+    if UPDATE_INGRESS_MODE == "queue":
+        # Only return 200 once the update is committed, so Telegram redelivers it if we crash before that
+        await run_in_threadpool(enqueue_telegram_update, update_json)
+        return Response(status_code=200)
+
     # Immediately return 200 OK
     background_tasks.add_task(process_telegram_update, update_json)
     return Response(status_code=200)
@@ -353,4 +478,25 @@ async def webhook_receiver(request: Request, background_tasks: BackgroundTasks):
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics(request: Request):
+    # Internal counters only; without a configured token the endpoint stays closed
+    metrics_token = os.getenv("METRICS_TOKEN") or os.getenv("WEBHOOK_SECRET")
+    if not metrics_token:
+        raise HTTPException(status_code=404)
+    if not hmac.compare_digest(request.headers.get("X-Metrics-Token", ""), metrics_token):
+        raise HTTPException(status_code=403, detail="Invalid metrics token")
+    return {
+        "update_dedup": update_deduplicator.get_stats(),
+        "persistence": ptb_application.persistence.get_stats() if ptb_application and ptb_application.persistence else None,
+        "scratch_store": get_scratch_stats(),
+        "export_jobs": export_job_manager.get_stats(),
+        "identity_cache": identity_cache.get_stats(),
+        "category_cache": category_cache.get_stats(),
+        "summary_cache": summary_cache.get_stats(),
+        "history_cache": history_cache.get_stats(),
+        "cache_generations": cache_generation_watch.get_stats(),
+    }
+
 # To run this FastAPI app: uvicorn main_webhook:app --host 0.0.0.0 --port 8000
+# With UPDATE_INGRESS_MODE=queue, also run the update workers: python worker.py --processes 4
@@ -1,8 +1,17 @@
-from .base import Base, SessionLocal, create_all_tables
+from .base import Base, SessionLocal, WriteSessionLocal, create_all_tables, ensure_indexes, ensure_columns, dialect_insert
 from .user import User
 from .expense import Expense, Category, add_default_categories
 from .income import Income
-from .budget import Budget
+from .budget import Budget, BudgetDefinition
 from .referral import Referral
 from .profile import Profile
-from .payment import Payment
\ No newline at end of file
+from .payment import Payment
+from .update_queue import QueuedUpdate
+from .processed_update import ProcessedUpdate
+from .job_run import JobRun
+from .bot_state import BotState
+from .usage_counter import UsageCounter
+from .insight import Insight
+from .cache_generation import CacheGeneration
+from .partition_lease import PartitionLease
+from .export_run import ExportRun
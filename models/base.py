@@ -1,7 +1,8 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
 from dotenv import load_dotenv
 
 # Load environment variables (for local development or environments like Render)
@@ -20,5 +21,52 @@ engine = create_engine(DATABASE_URL, pool_pre_ping=True) # pool_pre_ping helps w
 # Create a SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# For handlers that write a row and read back what INSERT/UPDATE ... RETURNING gave them: commit leaves objects
+# loaded, so no refresh SELECT follows. Only use it where nothing read before a commit is relied on to be fresh after it.
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
 def create_all_tables():
+    if engine.dialect.name == "postgresql":
+        # The trigram indexes on descriptions need pg_trgm
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
     Base.metadata.create_all(engine)
+
+def ensure_indexes():
+    """create_all only indexes new tables; this adds indexes declared later to tables that already exist."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def ensure_columns():
+    """
+    create_all only creates missing tables; this adds columns declared later to tables that already exist.
+    New columns on existing tables must be nullable or have a server_default so existing rows stay valid.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                connection.execute(text(ddl))
+
+def dialect_insert(model, bind=None):
+    """
+    Returns an INSERT construct for the engine's dialect so callers can use ON CONFLICT.
+    Postgres is the production database; SQLite is the local stand-in.
+    """
+    dialect_name = (bind or engine).dialect.name
+    if dialect_name == "postgresql":
+        return postgresql.insert(model)
+    if dialect_name == "sqlite":
+        return sqlite.insert(model)
+    raise NotImplementedError(f"ON CONFLICT inserts are not supported for dialect '{dialect_name}'.")
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Text, DateTime
+from models.base import Base
+import datetime
+from datetime import timezone
+
+class BotState(Base):
+    __tablename__ = "bot_state"
+
+    namespace = Column(String, primary_key=True) # 'user_data', 'chat_data', 'bot_data' or 'conversation:<name>'
+    key = Column(String, primary_key=True) # user/chat id, or the JSON-encoded conversation key
+    data = Column(Text, nullable=False) # JSON-encoded value
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<BotState(namespace='{self.namespace}', key='{self.key}')>"
@@ -1,19 +1,47 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Index
 from sqlalchemy.orm import relationship
 from models.base import Base
 import datetime
 
+class BudgetDefinition(Base):
+    """A recurring budget. Its concrete periods are Budget rows, created the first time a window is needed."""
+    __tablename__ = "budget_definitions"
+    __table_args__ = (
+        Index("ix_budget_definitions_profile_period", "profile_id", "period"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True) # Null for overall budget
+    amount = Column(Float, nullable=False) # Applies to periods materialized from now on; past periods keep theirs
+    period = Column(String, nullable=False) # 'daily', 'weekly', 'monthly'
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+    profile = relationship("Profile", back_populates="budget_definitions")
+    category = relationship("Category")
+    periods = relationship("Budget", back_populates="definition")
+
+    def __repr__(self):
+        return f"<BudgetDefinition(profile_id={self.profile_id}, category_id={self.category_id}, amount={self.amount}, period='{self.period}')>"
+
 class Budget(Base):
     __tablename__ = "budgets"
+    __table_args__ = (
+        Index("ix_budgets_definition_start", "definition_id", "start_date", unique=True), # One row per definition and window
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    definition_id = Column(Integer, ForeignKey("budget_definitions.id", ondelete="CASCADE"), nullable=True) # Null only for rows left over from before definitions
     profile_id = Column(Integer, ForeignKey("profiles.id"), nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True) # Null for overall budget
     amount = Column(Float, nullable=False)
     period = Column(String, nullable=False) # 'daily', 'weekly', 'monthly'
     start_date = Column(DateTime, nullable=False)
     end_date = Column(DateTime, nullable=False)
+    spent_amount = Column(Float, nullable=False, default=0, server_default="0") # Running total of expenses in this window, kept by add_expense
+    alert_level = Column(Integer, nullable=False, default=0, server_default="0") # Highest alert threshold (percent) already sent for this window
 
+    definition = relationship("BudgetDefinition", back_populates="periods")
     profile = relationship("Profile", back_populates="budgets")
     category = relationship("Category")
 
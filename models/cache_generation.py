@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String
+from models.base import Base
+
+class CacheGeneration(Base):
+    __tablename__ = "cache_generations"
+
+    name = Column(String, primary_key=True) # Process-local cache the generation belongs to, e.g. 'identity'
+    generation = Column(Integer, nullable=False, default=0) # Bumped by writes other processes may have cached
+
+    def __repr__(self):
+        return f"<CacheGeneration(name='{self.name}', generation={self.generation})>"
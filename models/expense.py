@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Index
 from sqlalchemy.orm import relationship
 from models.base import Base, SessionLocal
 import datetime
@@ -11,6 +11,11 @@ class Expense(Base):
 
     __tablename__ = "expenses"
 
+    __table_args__ = (
+        Index("ix_expenses_profile_date_id", "profile_id", "date", "id"), # Keyset history and date-range queries
+        Index("ix_expenses_description_trgm", "description", postgresql_using="gin", postgresql_ops={"description": "gin_trgm_ops"}), # Substring search
+    )
+
 
 
     id = Column(Integer, primary_key=True, index=True)
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime
+from models.base import Base
+import datetime
+from datetime import timezone
+
+class ExportRun(Base):
+    __tablename__ = "export_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, unique=True, nullable=False)
+    user_id = Column(BigInteger, nullable=False, index=True) # telegram_id of the user who asked for the export
+    worker_id = Column(String, nullable=True)
+    started_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(timezone.utc), nullable=False)
+
+    def __repr__(self):
+        return f"<ExportRun(job_id='{self.job_id}', user_id={self.user_id}, worker_id='{self.worker_id}')>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Index
 from sqlalchemy.orm import relationship
 from models.base import Base
 import datetime
@@ -9,6 +9,10 @@ AFRICA_LAGOS_TZ = ZoneInfo("Africa/Lagos")
 
 class Income(Base):
     __tablename__ = "incomes"
+    __table_args__ = (
+        Index("ix_incomes_profile_date_id", "profile_id", "date", "id"), # Keyset history and date-range queries
+        Index("ix_incomes_source_trgm", "source", postgresql_using="gin", postgresql_ops={"source": "gin_trgm_ops"}), # Substring search
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     profile_id = Column(Integer, ForeignKey("profiles.id"), nullable=False)
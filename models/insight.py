@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Date, DateTime, Index, text
+from sqlalchemy.orm import relationship
+from models.base import Base
+import datetime
+from datetime import timezone
+
+class Insight(Base):
+    __tablename__ = "insights"
+    __table_args__ = (
+        Index("uq_insights_profile_kind_category_day", "profile_id", "kind", "category_id", "day", unique=True), # Reruns don't duplicate
+        # NULLs are distinct in the index above, so uncategorized insights need their own
+        Index(
+            "uq_insights_profile_kind_uncategorized_day", "profile_id", "kind", "day", unique=True,
+            postgresql_where=text("category_id IS NULL"), sqlite_where=text("category_id IS NULL")
+        ),
+        Index("ix_insights_profile_unseen", "profile_id", "seen_at"), # Unseen insights for the next summary
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False) # 'category_spike'
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True) # Null for uncategorized spending
+    day = Column(Date, nullable=False) # WAT day the insight is about
+    amount = Column(Float, nullable=False) # Spent that day
+    baseline_mean = Column(Float, nullable=False) # Daily mean over the baseline window
+    baseline_std = Column(Float, nullable=False)
+    z_score = Column(Float, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(timezone.utc))
+    seen_at = Column(DateTime(timezone=True), nullable=True) # Set once shown in a summary
+
+    category = relationship("Category")
+
+    def __repr__(self):
+        return f"<Insight(profile_id={self.profile_id}, kind='{self.kind}', category_id={self.category_id}, day={self.day}, z={self.z_score:.1f})>"
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, UniqueConstraint
+from models.base import Base
+import datetime
+from datetime import timezone
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String, nullable=False)
+    slot = Column(BigInteger, nullable=False) # Scheduling window the run belongs to (epoch seconds // slot length)
+    worker_id = Column(String, nullable=True)
+    started_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(timezone.utc), index=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (UniqueConstraint("job_name", "slot", name="uq_job_runs_job_slot"),)
+
+    def __repr__(self):
+        return f"<JobRun(job_name='{self.job_name}', slot={self.slot}, worker_id='{self.worker_id}')>"
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from models.base import Base
+
+class PartitionLease(Base):
+    __tablename__ = "partition_leases"
+
+    partition_index = Column(Integer, primary_key=True) # Chats where abs(chat_id) % partition_count == partition_index
+    partition_count = Column(Integer, nullable=False)
+    worker_id = Column(String, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False) # Renewed by the owner; free to take once passed
+
+    def __repr__(self):
+        return f"<PartitionLease(partition={self.partition_index}/{self.partition_count}, worker_id='{self.worker_id}')>"
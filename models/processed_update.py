@@ -0,0 +1,13 @@
+from sqlalchemy import Column, BigInteger, DateTime
+from models.base import Base
+import datetime
+from datetime import timezone
+
+class ProcessedUpdate(Base):
+    __tablename__ = "processed_updates"
+
+    update_id = Column(BigInteger, primary_key=True) # Telegram update_id seen by any process
+    processed_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(timezone.utc), index=True)
+
+    def __repr__(self):
+        return f"<ProcessedUpdate(update_id={self.update_id}, processed_at={self.processed_at})>"
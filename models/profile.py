@@ -15,6 +15,7 @@ class Profile(Base):
     expenses = relationship("Expense", back_populates="profile")
     incomes = relationship("Income", back_populates="profile")
     budgets = relationship("Budget", back_populates="profile")
+    budget_definitions = relationship("BudgetDefinition", back_populates="profile")
     categories = relationship("Category", back_populates="profile")
 
     def __repr__(self):
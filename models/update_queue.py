@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, BigInteger, Index
+from models.base import Base
+import datetime
+from datetime import timezone
+
+class QueuedUpdate(Base):
+    __tablename__ = "update_queue"
+
+    id = Column(Integer, primary_key=True, index=True)
+    update_id = Column(BigInteger, unique=True, nullable=False) # Telegram update_id; unique so redeliveries are ignored
+    chat_id = Column(BigInteger, nullable=True) # Updates for the same chat are processed in order
+    payload = Column(Text, nullable=False) # Raw update JSON as received on /webhook
+    status = Column(String, default="pending", nullable=False) # 'pending', 'processing', 'done', 'failed'
+    attempts = Column(Integer, default=0, nullable=False)
+    worker_id = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(timezone.utc))
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_update_queue_status_id", "status", "id"),
+        Index("ix_update_queue_chat_status", "chat_id", "status"),
+    )
+
+    def __repr__(self):
+        return f"<QueuedUpdate(update_id={self.update_id}, chat_id={self.chat_id}, status='{self.status}', attempts={self.attempts})>"
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, ForeignKey
+from models.base import Base
+
+class UsageCounter(Base):
+    __tablename__ = "usage_counters"
+
+    # The composite primary key makes every quota check a single index lookup
+    profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), primary_key=True)
+    metric = Column(String, primary_key=True) # 'expenses' or 'custom_categories'
+    period = Column(String, primary_key=True) # WAT month as 'YYYY-MM', or 'all' for lifetime counters
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UsageCounter(profile_id={self.profile_id}, metric='{self.metric}', period='{self.period}', count={self.count})>"
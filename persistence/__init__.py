@@ -0,0 +1 @@
+from .sqlalchemy_persistence import SQLAlchemyPersistence
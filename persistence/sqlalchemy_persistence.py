@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import datetime
+from datetime import timezone
+from sqlalchemy import delete
+from telegram.ext import BasePersistence, PersistenceInput
+from models import SessionLocal, BotState, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "10")) # Seconds between batched writes
+PERSISTENCE_MAX_PENDING = 500 # Flush early once this many rows are waiting
+
+def _to_plain(data: dict) -> dict:
+    """
+    Keeps only JSON-serializable values. Live objects such as the expense flow's
+    'db_session' stay in memory and are never written to the database.
+    """
+    plain = {}
+    for key, value in data.items():
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            logger.debug(f"Not persisting non-serializable value for key '{key}'.")
+            continue
+        plain[key] = value
+    return plain
+
+class SQLAlchemyPersistence(BasePersistence):
+    """
+    Stores user_data, chat_data, bot_data and ConversationHandler states in the bot_state table.
+    Writes are buffered and flushed as one batch every PERSISTENCE_FLUSH_INTERVAL seconds
+    (or once PERSISTENCE_MAX_PENDING rows are waiting) and on shutdown.
+    """
+    def __init__(self, session_factory=SessionLocal, flush_interval: float = PERSISTENCE_FLUSH_INTERVAL, max_pending: int = PERSISTENCE_MAX_PENDING):
+        # PTB calls update_bot_data every update_interval, which is what drives the interval flush
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=flush_interval)
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {} # (namespace, key) -> JSON string, or None to delete the row
+        self._last_flush = time.monotonic()
+        self._flush_lock = asyncio.Lock()
+        self._discarding = False
+        self.rows_written = 0
+        self.flushes = 0
+
+    # --- Loading ---
+    def _load_namespace(self, namespace: str) -> dict:
+        db_session = self.session_factory()
+        try:
+            rows = db_session.query(BotState.key, BotState.data).filter(BotState.namespace == namespace).all()
+            return {row.key: json.loads(row.data) for row in rows}
+        finally:
+            db_session.close()
+
+    async def get_user_data(self) -> dict:
+        return {int(key): value for key, value in self._load_namespace("user_data").items()}
+
+    async def get_chat_data(self) -> dict:
+        return {int(key): value for key, value in self._load_namespace("chat_data").items()}
+
+    async def get_bot_data(self) -> dict:
+        return self._load_namespace("bot_data").get("bot", {})
+
+    async def get_callback_data(self):
+        return None # Arbitrary callback data is not used by this bot
+
+    async def get_conversations(self, name: str) -> dict:
+        return {tuple(json.loads(key)): state for key, state in self._load_namespace(f"conversation:{name}").items()}
+
+    # --- Buffered writes ---
+    async def _buffer(self, namespace: str, key: str, value):
+        if self._discarding:
+            return
+        self._pending[(namespace, key)] = None if value is None else json.dumps(value)
+        await self._maybe_flush()
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._buffer("user_data", str(user_id), _to_plain(data))
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._buffer("chat_data", str(chat_id), _to_plain(data))
+
+    async def update_bot_data(self, data: dict) -> None:
+        await self._buffer("bot_data", "bot", _to_plain(data))
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        await self._buffer(f"conversation:{name}", json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._buffer("user_data", str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._buffer("chat_data", str(chat_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass # A chat is only handled by the worker holding its partition lease (see worker.py), so memory is authoritative
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    def discard_writes(self):
+        """
+        Drops buffered changes and ignores any later ones. worker.py calls this after losing its partition
+        lease, when another worker may already own these chats and their bot_state rows.
+        """
+        self._discarding = True
+        self._pending.clear()
+
+    async def _maybe_flush(self):
+        if len(self._pending) >= self.max_pending or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    def _write_batch(self, batch: dict):
+        db_session = self.session_factory()
+        try:
+            now = datetime.datetime.now(timezone.utc)
+            upserts = [
+                {"namespace": namespace, "key": key, "data": data, "updated_at": now}
+                for (namespace, key), data in batch.items() if data is not None
+            ]
+            deletes = [(namespace, key) for (namespace, key), data in batch.items() if data is None]
+
+            if upserts:
+                stmt = dialect_insert(BotState, db_session.get_bind())
+                db_session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=["namespace", "key"],
+                        set_={"data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at}
+                    ),
+                    upserts
+                )
+            for namespace, key in deletes:
+                db_session.execute(delete(BotState).where(BotState.namespace == namespace, BotState.key == key))
+            db_session.commit()
+        finally:
+            db_session.close()
+
+    async def flush(self) -> None:
+        """Writes every buffered change in one transaction. PTB also calls this on shutdown."""
+        async with self._flush_lock:
+            self._last_flush = time.monotonic()
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} persistence row(s): {e}")
+                # Keep the unwritten changes unless newer values arrived meanwhile
+                for item_key, value in batch.items():
+                    self._pending.setdefault(item_key, value)
+                return
+            self.rows_written += len(batch)
+            self.flushes += 1
+
+    def get_stats(self) -> dict:
+        return {"pending_rows": len(self._pending), "rows_written": self.rows_written, "flushes": self.flushes}
@@ -0,0 +1,75 @@
+"""
+Parse-and-insert throughput of bulk expense entry against the old one-expense-per-round-trip path.
+
+The old path saved each expense with its own add_expense call and commit; the new path writes
+every line with one multi-row INSERT and one commit, which is where the speedup comes from.
+Parsing is not faster: re caches compiled patterns, so compiling per call costs little, and the
+bulk parser also looks for a '#Category' suffix on every line, so it parses fewer lines per second.
+
+    python scripts/bench_bulk_entry.py --lines 10000 --legacy-lines 1000
+"""
+import re
+import random
+import argparse
+from bench_common import use_scratch_database, seed_profile, measure, report, EXPENSE_DESCRIPTIONS
+
+CATEGORIES = ["Food", "Transport", "Utilities", "Shopping", "Other"]
+
+def legacy_parse(message_text: str):
+    """parse_expense_message as it was: re.compile on every call (served from re's pattern cache)."""
+    pattern = re.compile(r"(?:paid\s+)?(\d+(?:[.,]\d{1,2})?)\s+for\s+(.+)", re.IGNORECASE)
+    match = pattern.match(message_text.strip())
+    if match:
+        return float(match.group(1).replace(',', '.')), match.group(2).strip()
+    return None, None
+
+def make_message(lines: int, seed: int = 11) -> str:
+    rng = random.Random(seed)
+    return "\n".join(
+        f"{rng.randrange(100, 20000)} for {rng.choice(EXPENSE_DESCRIPTIONS)} #{rng.choice(CATEGORIES)}"
+        for _ in range(lines)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--legacy-lines", type=int, default=1000, help="Lines for the old path, which commits once per expense")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    use_scratch_database()
+    from models import SessionLocal
+    from services.expense_service import ExpenseService
+
+    db_session = SessionLocal()
+    profile_id = seed_profile(db_session, expenses=0, incomes=0)
+    expense_service = ExpenseService(db_session)
+    category_ids = {category.name: category.id for category in expense_service.get_categories(profile_id)}
+    message = make_message(args.lines)
+    legacy_message = make_message(args.legacy_lines)
+    print(f"{args.lines:,} lines for the bulk path, {args.legacy_lines:,} for the old path.")
+
+    seconds, _ = measure(lambda: [legacy_parse(line) for line in message.splitlines()], repeat=args.repeat)
+    report("parse only, old (no category suffix)", seconds, f"{args.lines / seconds:>12,.0f} lines/s")
+    seconds, (entries, rejected) = measure(
+        lambda: expense_service.parse_bulk_expense_message(message, max_lines=args.lines), repeat=args.repeat
+    )
+    report("parse only, bulk parser (with #Category)", seconds, f"{args.lines / seconds:>12,.0f} lines/s, {len(rejected)} rejected")
+
+    def legacy_save():
+        for line in legacy_message.splitlines():
+            body, category = line.rsplit(" #", 1)
+            amount, description = legacy_parse(body)
+            expense_service.add_expense(profile_id, amount, description, category_ids[category])
+    seconds, _ = measure(legacy_save, repeat=1)
+    report("parse + insert, old (add_expense per line)", seconds, f"{args.legacy_lines / seconds:>12,.0f} lines/s")
+
+    def bulk_save():
+        entries, _ = expense_service.parse_bulk_expense_message(message, max_lines=args.lines)
+        return expense_service.add_expenses_bulk(profile_id, entries)
+    seconds, saved = measure(bulk_save, repeat=args.repeat)
+    report("parse + insert, bulk (one INSERT, one commit)", seconds, f"{saved / seconds:>12,.0f} lines/s")
+    db_session.close()
+
+if __name__ == "__main__":
+    main()
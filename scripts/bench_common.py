@@ -0,0 +1,104 @@
+"""
+Shared setup for the scripts/bench_*.py benchmarks: a throwaway SQLite database, one synthetic
+profile seeded into it, and timing helpers. Numbers are for the SQLite stand-in; Postgres-only
+pieces (the pg_trgm indexes, server-side cursors) are not exercised.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import datetime
+import statistics
+from datetime import timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+EXPENSE_DESCRIPTIONS = [
+    "fuel at total", "lunch at mama put", "groceries", "uber to work", "data bundle", "electricity token",
+    "netflix", "pharmacy", "market run", "bolt ride", "suya", "airtime", "dstv", "gym", "shawarma",
+]
+INCOME_SOURCES = ["salary", "freelance", "refund", "gift", "dividends"]
+INSERT_CHUNK_ROWS = 10000
+
+def use_scratch_database() -> str:
+    """Points the models at a new SQLite file and creates the schema. Call before anything imports models."""
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')}"
+    os.environ["DATABASE_URL"] = database_url
+    from models import create_all_tables
+    create_all_tables()
+    return database_url
+
+def seed_profile(db_session, expenses: int, incomes: int, days: int = 730, seed: int = 7) -> int:
+    """Creates a user and profile with `expenses` expenses and `incomes` incomes spread over the last `days` days."""
+    from sqlalchemy import insert
+    from models import User, Profile, Category, Expense, Income, add_default_categories
+
+    rng = random.Random(seed)
+    user = User(telegram_id=rng.randrange(10 ** 9), first_name="Bench")
+    db_session.add(user)
+    db_session.flush()
+    profile = Profile(user_id=user.telegram_id, name="Bench", profile_type="personal", currency="NGN")
+    db_session.add(profile)
+    db_session.flush()
+    user.current_profile_id = profile.id
+    profile_id = profile.id
+    add_default_categories(db_session) # Commits
+    category_ids = [row.id for row in db_session.query(Category.id).filter(Category.profile_id == None)]
+
+    now = datetime.datetime.now(timezone.utc)
+    def random_date():
+        return now - datetime.timedelta(seconds=rng.randrange(days * 86400))
+
+    for start in range(0, expenses, INSERT_CHUNK_ROWS):
+        db_session.execute(insert(Expense), [
+            {
+                "profile_id": profile_id,
+                "amount": round(rng.uniform(200, 50000), 2),
+                "description": rng.choice(EXPENSE_DESCRIPTIONS),
+                "category_id": rng.choice(category_ids),
+                "date": random_date(),
+            }
+            for _ in range(min(INSERT_CHUNK_ROWS, expenses - start))
+        ])
+    for start in range(0, incomes, INSERT_CHUNK_ROWS):
+        db_session.execute(insert(Income), [
+            {"profile_id": profile_id, "amount": round(rng.uniform(5000, 500000), 2), "source": rng.choice(INCOME_SOURCES), "date": random_date()}
+            for _ in range(min(INSERT_CHUNK_ROWS, incomes - start))
+        ])
+    db_session.commit()
+    return profile_id
+
+def measure(fn, repeat: int = 5):
+    """Runs fn `repeat` times. Returns (median seconds, result of the last run)."""
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+class StatementCounter:
+    """Counts statements sent to the database inside a `with` block."""
+    def __init__(self):
+        from models.base import engine
+        self.engine = engine
+        self.count = 0
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        from sqlalchemy import event
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+def report(label: str, seconds: float, extra: str = ""):
+    print(f"  {label:<48} {seconds * 1000:>10.2f} ms  {extra}")
@@ -0,0 +1,69 @@
+"""
+Export time and file size per format, for the whole history and for one quarter, against the old
+row-at-a-time CSV of the whole history.
+
+    python scripts/bench_export.py --expenses 100000 --incomes 10000
+"""
+import io
+import csv
+import argparse
+import datetime
+import tempfile
+from datetime import timezone
+from bench_common import use_scratch_database, seed_profile, measure, report
+
+def legacy_csv(report_service, profile_id):
+    """The old export: the whole history, one writer.writerow call per row."""
+    from services.report_service import REPORT_COLUMNS
+    from utils.datetime_utils import to_wat
+    output = tempfile.SpooledTemporaryFile(mode="w+b")
+    text_output = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    writer = csv.writer(text_output)
+    writer.writerow(REPORT_COLUMNS)
+    for date, amount, description, category in report_service._expense_rows(profile_id):
+        writer.writerow(["Expense", to_wat(date).strftime("%Y-%m-%d %H:%M:%S %Z%z"), amount, description, category])
+    for date, amount, source, category in report_service._income_rows(profile_id):
+        writer.writerow(["Income", to_wat(date).strftime("%Y-%m-%d %H:%M:%S %Z%z"), amount, source, category])
+    text_output.flush()
+    text_output.detach()
+    return output
+
+def file_size(output) -> int:
+    output.seek(0, io.SEEK_END)
+    size = output.tell()
+    output.close()
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--expenses", type=int, default=100000)
+    parser.add_argument("--incomes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    use_scratch_database()
+    from models import SessionLocal
+    from services.report_service import ReportService, EXPORT_FORMATS
+
+    db_session = SessionLocal()
+    profile_id = seed_profile(db_session, args.expenses, args.incomes)
+    report_service = ReportService(db_session)
+    quarter_end = datetime.datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    quarter_start = quarter_end - datetime.timedelta(days=91)
+    print(f"Profile with {args.expenses:,} expenses and {args.incomes:,} incomes over two years.")
+
+    seconds, output = measure(lambda: legacy_csv(report_service, profile_id), repeat=args.repeat)
+    report("old CSV, whole history, row by row", seconds, f"{file_size(output):>12,} bytes")
+
+    for label, start, end in (("whole history", None, None), ("last quarter", quarter_start, quarter_end)):
+        for fmt in EXPORT_FORMATS:
+            try:
+                seconds, output = measure(lambda: report_service.generate_report(profile_id, fmt, start, end), repeat=args.repeat)
+            except ImportError as e:
+                print(f"  {fmt.upper()}, {label}: skipped ({e})")
+                continue
+            report(f"{fmt.upper()}, {label}", seconds, f"{file_size(output):>12,} bytes")
+    db_session.close()
+
+if __name__ == "__main__":
+    main()
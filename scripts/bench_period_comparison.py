@@ -0,0 +1,53 @@
+"""
+Cost of the week/month comparison in summaries: one SUM(...) FILTER query over both windows,
+against calling the range totals once per window.
+
+    python scripts/bench_period_comparison.py --expenses 50000
+"""
+import argparse
+import datetime
+from datetime import timezone, timedelta
+from bench_common import use_scratch_database, seed_profile, measure, report, StatementCounter
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--expenses", type=int, default=50000)
+    parser.add_argument("--incomes", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    use_scratch_database()
+    from models import SessionLocal
+    from services.summary_service import SummaryService, COMPARISON_PERIODS
+
+    db_session = SessionLocal()
+    profile_id = seed_profile(db_session, args.expenses, args.incomes)
+    summary_service = SummaryService(db_session)
+    summary_service.get_period_comparison(profile_id, "weekly") # Warm the category cache, as a summary would have
+    print(f"Profile with {args.expenses:,} expenses and {args.incomes:,} incomes.")
+
+    for period in COMPARISON_PERIODS:
+        now = datetime.datetime.now(timezone.utc)
+        current_start, _ = COMPARISON_PERIODS[period](now)
+        previous_start, previous_end = COMPARISON_PERIODS[period](current_start - timedelta(seconds=1))
+        previous_cutoff = min(previous_start + (now - current_start), previous_end)
+
+        def both_totals():
+            return (
+                summary_service.get_range_totals(profile_id, current_start, now),
+                summary_service.get_range_totals(profile_id, previous_start, previous_cutoff),
+            )
+
+        with StatementCounter() as statements:
+            seconds, _ = measure(lambda: summary_service.get_range_totals(profile_id, current_start, now), repeat=args.repeat)
+        report(f"{period}: range totals, current window only", seconds, f"{statements.count // args.repeat} statement(s)")
+        with StatementCounter() as statements:
+            seconds, _ = measure(both_totals, repeat=args.repeat)
+        report(f"{period}: range totals called per window", seconds, f"{statements.count // args.repeat} statement(s)")
+        with StatementCounter() as statements:
+            seconds, _ = measure(lambda: summary_service.get_period_comparison(profile_id, period, now), repeat=args.repeat)
+        report(f"{period}: get_period_comparison", seconds, f"{statements.count // args.repeat} statement(s)")
+    db_session.close()
+
+if __name__ == "__main__":
+    main()
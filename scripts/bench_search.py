@@ -0,0 +1,81 @@
+"""
+Latency of /search against browsing history page by page, on one large synthetic profile.
+
+The old way to find "that fuel purchase last March" was paging back through history five rows at a
+time until that month had gone by. The new way is one filtered, keyset-paged search query per page.
+
+    python scripts/bench_search.py --expenses 50000 --incomes 5000
+"""
+import argparse
+import datetime
+from datetime import timezone
+from bench_common import use_scratch_database, seed_profile, measure, report, StatementCounter
+
+def month_a_year_ago():
+    """(start, end) of the calendar month twelve months back, as UTC datetimes."""
+    this_month = datetime.datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    start = (this_month - datetime.timedelta(days=365)).replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+def browse_until(history_service, profile_id, text, start, end):
+    """The old path: page newest-first through the whole history until the month is passed, matching in Python."""
+    from services.transaction_history_service import history_cursor
+    matches, cursor, pages = [], None, 0
+    while True:
+        rows, has_more = history_service.get_page(profile_id, cursor=cursor)
+        pages += 1
+        for row in rows:
+            if start <= row["date"] < end and text in (row["description"] or "").lower():
+                matches.append(row)
+        if not has_more or rows[-1]["date"] < start:
+            return matches, pages
+        cursor = history_cursor(rows[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--expenses", type=int, default=50000)
+    parser.add_argument("--incomes", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_scratch_database()
+    from models import SessionLocal
+    from services.transaction_history_service import TransactionHistoryService, history_cursor
+
+    db_session = SessionLocal()
+    profile_id = seed_profile(db_session, args.expenses, args.incomes)
+    history_service = TransactionHistoryService(db_session)
+    start, end = month_a_year_ago()
+    print(f"Profile with {args.expenses:,} expenses and {args.incomes:,} incomes; looking for 'fuel' in {start:%B %Y}.")
+
+    seconds, (matches, pages) = measure(lambda: browse_until(history_service, profile_id, "fuel", start, end), repeat=1)
+    report("browse history 5 rows at a time", seconds, f"{pages:,} pages, {len(matches)} matches in the month")
+
+    cases = {
+        "search: text + month": {"text": "fuel", "start_date": start.isoformat(), "end_date": end.isoformat()},
+        "search: text only": {"text": "fuel"},
+        "search: category + amount range": {"category": "Transport", "min_amount": 10000, "max_amount": 20000},
+        "search: income type + text": {"type": "income", "text": "salary"},
+        "history: newest page, no filters": {},
+    }
+    for label, filters in cases.items():
+        with StatementCounter() as statements:
+            seconds, (rows, has_more) = measure(lambda: history_service.search(profile_id, filters), repeat=args.repeat)
+        report(label, seconds, f"{len(rows)} rows, {statements.count // args.repeat} statement(s) per page")
+
+    # Paging deeper costs the same as the first page with keyset cursors
+    filters = {"text": "fuel"}
+    rows, _ = history_service.search(profile_id, filters)
+    for _ in range(50):
+        next_rows, has_more = history_service.search(profile_id, filters, cursor=history_cursor(rows[-1]))
+        if not has_more:
+            break
+        rows = next_rows
+    cursor = history_cursor(rows[-1])
+    seconds, _ = measure(lambda: history_service.search(profile_id, filters, cursor=cursor), repeat=args.repeat)
+    report("search: text only, ~50 pages deep", seconds)
+    db_session.close()
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,17 @@ from .ocr_service import OCRService
 from .income_service import IncomeService
 from .subscription_service import SubscriptionService, MONTHLY_PRO_PRICE, YEARLY_PRO_PRICE, YEARLY_SAVINGS_NAIRA, YEARLY_SAVINGS_PERCENT
 from .summary_service import SummaryService
-from .budget_service import BudgetService
+from .budget_service import BudgetService, BUDGET_ALERT_THRESHOLDS, recompute_budget_totals, backfill_budget_definitions
 from .reminder_service import ReminderService
 from .referral_service import ReferralService, BASE_REFERRAL_LINK
 from .profile_service import ProfileService
-from .report_service import ReportService
\ No newline at end of file
+from .report_service import ReportService
+from .transaction_history_service import TransactionHistoryService
+from .update_queue_service import UpdateQueueService
+from .update_dedup_service import UpdateDeduplicator, update_deduplicator
+from .identity_service import IdentityService, Identity
+from .category_cache import CategoryCache, category_cache
+from .summary_cache import SummaryCache, summary_cache
+from .history_cache import HistoryCache, ProfileHistory, history_cache
+from .quota_service import QuotaService, backfill_usage_counters
+from .insight_service import InsightService, detect_spending_anomalies
@@ -1,55 +1,224 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import Budget, Expense, Income, Category
+from sqlalchemy import func, update, select, or_, tuple_, case
+from models import SessionLocal, Budget, BudgetDefinition, Expense, Income, Category, dialect_insert
+from services.summary_cache import summary_cache
+from services.category_cache import category_cache
 from datetime import datetime, timedelta, timezone # Keep datetime, timedelta for general use
 from utils.datetime_utils import wat_day_bounds_utc, wat_week_bounds_utc, wat_month_bounds_utc, to_wat, WAT # Import the new utilities
 
+# period -> function returning the (start_utc, end_utc) window containing a datetime (default now)
+BUDGET_PERIOD_BOUNDS = {
+    "daily": wat_day_bounds_utc,
+    "weekly": wat_week_bounds_utc,
+    "monthly": wat_month_bounds_utc,
+}
+BUDGET_ALERT_THRESHOLDS = (90, 100) # Percent of a budget at which a one-off alert is sent
+
+def budget_window(period: str, at: datetime = None) -> tuple:
+    """The (start_utc, end_utc) window of the given period containing `at`; naive datetimes are taken as UTC."""
+    if period not in BUDGET_PERIOD_BOUNDS:
+        raise ValueError("Invalid period. Must be 'daily', 'weekly' or 'monthly'.")
+    if at is not None and at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return BUDGET_PERIOD_BOUNDS[period](at)
+
+def budget_alert_level(spent: float, amount: float) -> int:
+    """The highest alert threshold reached by spent against amount, or 0."""
+    if amount <= 0:
+        return BUDGET_ALERT_THRESHOLDS[-1] if spent > 0 else 0
+    percentage_spent = spent * 100 / amount
+    return max((threshold for threshold in BUDGET_ALERT_THRESHOLDS if percentage_spent >= threshold), default=0)
+
 class BudgetService:
     def __init__(self, db_session: Session):
         self.db_session = db_session
 
     def set_budget(self, profile_id: int, amount: float, period: str, category_id: int = None):
-        # Determine start and end dates based on period in UTC for DB storage
-        # These functions return (start_utc, end_utc)
-        if period == "daily":
-            start_date_utc, end_date_utc = wat_day_bounds_utc()
-        elif period == "weekly":
-            start_date_utc, end_date_utc = wat_week_bounds_utc()
-        elif period == "monthly":
-            start_date_utc, end_date_utc = wat_month_bounds_utc()
-        else:
-            raise ValueError("Invalid period. Must be 'daily', 'weekly' or 'monthly'.")
-        
-        # Check if a budget for this period and category already exists for the profile
-        existing_budget = self.db_session.query(Budget).filter(
-            Budget.profile_id == profile_id,
-            Budget.period == period,
-            Budget.category_id == category_id,
-            Budget.start_date <= end_date_utc, # Check for overlapping budgets
-            Budget.end_date >= start_date_utc
-        ).first()
+        """
+        Creates or updates the recurring budget for this period and category; it applies to every
+        window from the current one on. Returns the current window's Budget row.
+        """
+        budget_window(period) # Validates the period before anything is written
 
-        if existing_budget:
-            existing_budget.amount = amount
-            existing_budget.start_date = start_date_utc
-            existing_budget.end_date = end_date_utc
-            self.db_session.add(existing_budget)
-            self.db_session.commit()
-            self.db_session.refresh(existing_budget)
-            return existing_budget
+        definition = self.db_session.query(BudgetDefinition).filter(
+            BudgetDefinition.profile_id == profile_id,
+            BudgetDefinition.period == period,
+            BudgetDefinition.category_id == category_id
+        ).first()
+        if definition is None:
+            definition = BudgetDefinition(profile_id=profile_id, category_id=category_id, amount=amount, period=period)
+            self.db_session.add(definition)
+            self.db_session.flush() # Assigns the id the period row refers to
         else:
-            new_budget = Budget(
-                profile_id=profile_id,
-                amount=amount,
-                period=period,
-                category_id=category_id,
-                start_date=start_date_utc,
-                end_date=end_date_utc
-            )
-            self.db_session.add(new_budget)
-            self.db_session.commit()
-            self.db_session.refresh(new_budget)
-            return new_budget
+            definition.amount = amount
+
+        (budget,), _ = self.current_periods([definition])
+        budget.amount = amount
+        # Thresholds already passed count as sent, so setting a budget never triggers an alert by itself
+        budget.alert_level = budget_alert_level(budget.spent_amount, amount)
+        self.db_session.commit()
+        summary_cache.invalidate(profile_id)
+        return budget
+
+    def get_definitions(self, profile_id: int, period: str = None, category_ids=None) -> list:
+        """
+        The profile's recurring budgets. With category_ids, only those that expenses in any of those
+        categories count towards: the overall budget plus the matching category budgets.
+        """
+        query = self.db_session.query(BudgetDefinition).filter(BudgetDefinition.profile_id == profile_id)
+        if period:
+            query = query.filter(BudgetDefinition.period == period)
+        if category_ids is not None:
+            category_ids = [category_id for category_id in category_ids if category_id is not None]
+            query = query.filter(or_(BudgetDefinition.category_id == None, BudgetDefinition.category_id.in_(category_ids)))
+        return query.order_by(BudgetDefinition.id).all()
+
+    def current_periods(self, definitions: list, at: datetime = None):
+        """
+        Returns (budgets, created_ids): each definition's Budget row for the window containing `at`
+        (default now), in order. Missing rows are created with their running total seeded from the
+        expenses already in the window. Rows are found by (definition_id, start_date), which is unique.
+        Does not commit; callers do.
+        """
+        if not definitions:
+            return [], set()
+        windows = {definition.id: budget_window(definition.period, at) for definition in definitions}
+        budgets = self._find_periods(windows)
+        missing = [definition for definition in definitions if definition.id not in budgets]
+        created_ids = set()
+        if missing:
+            rows = []
+            for definition in missing:
+                start_date, end_date = windows[definition.id]
+                rows.append({
+                    "definition_id": definition.id,
+                    "profile_id": definition.profile_id,
+                    "category_id": definition.category_id,
+                    "amount": definition.amount,
+                    "period": definition.period,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "spent_amount": self.get_expenses_for_budget_period(definition.profile_id, start_date, end_date, definition.category_id)
+                })
+            # A concurrent writer may materialize the same window first; its row wins and ours is skipped
+            created_ids = set(self.db_session.scalars(
+                dialect_insert(Budget, self.db_session.get_bind()).values(rows)
+                .on_conflict_do_nothing(index_elements=["definition_id", "start_date"])
+                .returning(Budget.id)
+            ).all())
+            budgets = self._find_periods(windows)
+        return [budgets[definition.id] for definition in definitions], created_ids
+
+    def _find_periods(self, windows: dict) -> dict:
+        """definition_id -> Budget row for the given {definition_id: (start_date, end_date)} windows."""
+        keys = [(definition_id, start_date) for definition_id, (start_date, _) in windows.items()]
+        budgets = self.db_session.query(Budget).filter(tuple_(Budget.definition_id, Budget.start_date).in_(keys)).all()
+        return {budget.definition_id: budget for budget in budgets}
+
+    def record_expense(self, profile_id: int, amount: float, category_id: int, date: datetime) -> list:
+        """Single-expense form of record_expenses."""
+        return self.record_expenses(profile_id, {category_id: amount}, date)
+
+    def record_expenses(self, profile_id: int, category_totals: dict, date: datetime) -> list:
+        """
+        Adds expenses already inserted in this transaction, given as {category_id: total} and all dated
+        `date`, to the running total of each budget they count towards. Periods are resolved once for
+        the whole batch, so a window created here (seeded from a SUM that already includes the batch)
+        is never incremented again. Returns alerts for thresholds crossed for the first time in a window.
+        Does not commit; callers do.
+        """
+        definitions = self.get_definitions(profile_id, category_ids=category_totals.keys())
+        if not definitions:
+            return []
+        budgets, created_ids = self.current_periods(definitions, date)
+
+        batch_total = sum(category_totals.values())
+        increments = {
+            budget.id: batch_total if budget.category_id is None else category_totals.get(budget.category_id, 0)
+            for budget in budgets if budget.id not in created_ids
+        }
+        totals = {budget.id: (budget.spent_amount, budget.alert_level) for budget in budgets}
+        if increments:
+            rows = self.db_session.execute(
+                update(Budget)
+                .where(Budget.id.in_(increments.keys()))
+                .values(spent_amount=Budget.spent_amount + case(increments, value=Budget.id, else_=0))
+                .returning(Budget.id, Budget.spent_amount, Budget.alert_level)
+                .execution_options(synchronize_session=False)
+            ).all()
+            totals.update({row.id: (row.spent_amount, row.alert_level) for row in rows})
+
+        alerts = []
+        for budget in budgets:
+            spent_amount, alert_level = totals[budget.id]
+            level = budget_alert_level(spent_amount, budget.amount)
+            if level <= alert_level:
+                continue
+            # Conditional update: with concurrent writers only one of them raises the level, so each threshold fires once per window
+            raised = self.db_session.execute(
+                update(Budget)
+                .where(Budget.id == budget.id, Budget.alert_level < level)
+                .values(alert_level=level)
+                .returning(Budget.id)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if raised is None:
+                continue
+            category = category_cache.find(self.db_session, profile_id, budget.category_id) if budget.category_id else None
+            alerts.append({
+                "category_name": category.name if category else "Overall",
+                "period": budget.period,
+                "budget_amount": budget.amount,
+                "spent_amount": spent_amount,
+                "threshold": level
+            })
+        return alerts
+
+    def backfill_definitions(self):
+        """
+        Gives budget rows written before recurring definitions existed a definition per profile, period
+        and category (the newest row's amount wins), so those budgets carry on into later windows.
+        Rows that would duplicate a window already claimed are left without one and ignored.
+        """
+        legacy = self.db_session.query(Budget).filter(Budget.definition_id == None).order_by(Budget.id.desc()).all()
+        if not legacy:
+            return
+        profile_ids = {budget.profile_id for budget in legacy}
+        definitions = {
+            (definition.profile_id, definition.period, definition.category_id): definition
+            for definition in self.db_session.query(BudgetDefinition).filter(BudgetDefinition.profile_id.in_(profile_ids))
+        }
+        claimed = set(self.db_session.query(Budget.definition_id, Budget.start_date).filter(
+            Budget.definition_id != None, Budget.profile_id.in_(profile_ids)
+        ).all())
+        for budget in legacy:
+            key = (budget.profile_id, budget.period, budget.category_id)
+            definition = definitions.get(key)
+            if definition is None:
+                definition = BudgetDefinition(profile_id=budget.profile_id, category_id=budget.category_id, amount=budget.amount, period=budget.period)
+                self.db_session.add(definition)
+                self.db_session.flush()
+                definitions[key] = definition
+            if (definition.id, budget.start_date) not in claimed:
+                budget.definition_id = definition.id
+                claimed.add((definition.id, budget.start_date))
+        self.db_session.commit()
+
+    def recompute_spent(self, profile_id: int = None):
+        """
+        Recomputes the running totals of active budgets from their expenses with one correlated UPDATE.
+        Used after deletes and imports, where per-row bookkeeping is not worth it. Does not commit.
+        """
+        spent = select(func.coalesce(func.sum(Expense.amount), 0)).where(
+            Expense.profile_id == Budget.profile_id,
+            Expense.date >= Budget.start_date,
+            Expense.date < Budget.end_date,
+            or_(Budget.category_id == None, Expense.category_id == Budget.category_id)
+        ).scalar_subquery()
+        stmt = update(Budget).where(Budget.end_date > datetime.now(timezone.utc)).values(spent_amount=spent)
+        if profile_id is not None:
+            stmt = stmt.where(Budget.profile_id == profile_id)
+        self.db_session.execute(stmt.execution_options(synchronize_session=False))
 
     def get_budgets(self, profile_id: int, period: str = None):
         query = self.db_session.query(Budget).filter(Budget.profile_id == profile_id)
@@ -76,19 +245,19 @@ class BudgetService:
         return query.scalar() or 0
 
     def get_budget_status(self, profile_id: int, start_date: datetime, end_date: datetime, period: str):
-        budgets = self.db_session.query(Budget).filter(
-            Budget.profile_id == profile_id,
-            Budget.period == period,
-            Budget.start_date <= end_date,
-            Budget.end_date >= start_date
-        ).all()
+        # The profile's definitions for the period, then each one's window row by its unique key; the
+        # stored running total replaces a SUM over the window's expenses
+        budgets, created_ids = self.current_periods(self.get_definitions(profile_id, period=period), start_date)
+        if created_ids:
+            self.db_session.commit()
 
         detailed_budget_statuses = []
 
         for budget in budgets:
-            category_name = budget.category.name if budget.category else "Overall"
-            is_overall_budget = True if budget.category is None else False
-            total_spent = self.get_expenses_for_budget_period(profile_id, start_date, end_date, budget.category_id)
+            category = category_cache.find(self.db_session, profile_id, budget.category_id) if budget.category_id else None
+            category_name = category.name if category else "Overall"
+            is_overall_budget = budget.category_id is None
+            total_spent = budget.spent_amount
             
             budget_amount = budget.amount
             remaining_amount = budget_amount - total_spent
@@ -117,4 +286,20 @@ class BudgetService:
                 "status": status
             })
 
-        return detailed_budget_statuses
\ No newline at end of file
+        return detailed_budget_statuses
+
+def recompute_budget_totals():
+    """Startup pass that brings running totals of active budgets in line with their expenses."""
+    db_session = SessionLocal()
+    try:
+        BudgetService(db_session).recompute_spent()
+        db_session.commit()
+    finally:
+        db_session.close()
+
+def backfill_budget_definitions():
+    db_session = SessionLocal()
+    try:
+        BudgetService(db_session).backfill_definitions()
+    finally:
+        db_session.close()
@@ -0,0 +1,76 @@
+import os
+import time
+import logging
+import threading
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import CacheGeneration, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+CACHE_GENERATION_CHECK_SECONDS = float(os.getenv("CACHE_GENERATION_CHECK_SECONDS", "10")) # How long a bump from another process can go unseen
+
+IDENTITY_CACHE = "identity"
+SUMMARY_CACHE = "summary"
+HISTORY_CACHE = "history"
+CATEGORY_CACHE = "category"
+
+def bump_cache_generations(db_session: Session, *names: str):
+    """
+    Makes every process empty the named caches at its next check. For writes that other processes may
+    have cached: jobs, payment callbacks and rewards written to another user's row. Does not commit,
+    so the bump lands in the same transaction as the write.
+    """
+    for name in names:
+        stmt = dialect_insert(CacheGeneration, db_session.get_bind()).values(name=name, generation=1)
+        db_session.execute(stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"generation": CacheGeneration.generation + 1}
+        ))
+
+def _clear_cache(name: str):
+    # Local imports; the caches import the services that bump generations
+    if name == IDENTITY_CACHE:
+        from services.identity_service import identity_cache
+        identity_cache.clear()
+    elif name == SUMMARY_CACHE:
+        from services.summary_cache import summary_cache
+        summary_cache.clear()
+    elif name == HISTORY_CACHE:
+        from services.history_cache import history_cache
+        history_cache.clear()
+    elif name == CATEGORY_CACHE:
+        from services.category_cache import category_cache
+        category_cache.clear()
+
+class CacheGenerationWatch:
+    """
+    Empties this process's caches when another process bumps their generation. The generations are
+    read at most once per interval, so the check costs one small query every few seconds, not one per update.
+    """
+    def __init__(self, interval: float = CACHE_GENERATION_CHECK_SECONDS):
+        self.interval = interval
+        self._seen = None # name -> generation at the last check; None until the first check
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self.clears = 0
+
+    def check(self, db_session: Session):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.interval:
+                return
+            self._checked_at = now
+        generations = dict(db_session.execute(select(CacheGeneration.name, CacheGeneration.generation)).all())
+        with self._lock:
+            changed = [] if self._seen is None else [name for name, generation in generations.items() if self._seen.get(name) != generation]
+            self._seen = generations
+        for name in changed:
+            _clear_cache(name)
+            self.clears += 1
+            logger.info(f"Cleared the process-local {name} cache after another process bumped its generation.")
+
+    def get_stats(self) -> dict:
+        return {"interval_seconds": self.interval, "clears": self.clears}
+
+cache_generation_watch = CacheGenerationWatch()
@@ -0,0 +1,70 @@
+import os
+import threading
+from types import SimpleNamespace
+from sqlalchemy.orm import Session
+from models import Category
+from utils.cache import TTLCache
+
+CATEGORY_CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", "5000")) # Profiles kept per process
+CATEGORY_CACHE_TTL_SECONDS = int(os.getenv("CATEGORY_CACHE_TTL_SECONDS", "1800")) # Safety net; writes invalidate explicitly
+
+def _category(row):
+    return SimpleNamespace(id=row.id, name=row.name, profile_id=row.profile_id)
+
+class CategoryCache:
+    """
+    Default categories are loaded once per process (they never change at runtime); each profile's
+    custom categories and the keyboards built from them are cached per profile until invalidated.
+    Entries are read-only snapshots shared across sessions.
+    """
+    def __init__(self, maxsize: int = CATEGORY_CACHE_SIZE, ttl: float = CATEGORY_CACHE_TTL_SECONDS):
+        self._defaults = None
+        self._defaults_lock = threading.Lock()
+        self.custom = TTLCache(maxsize=maxsize, ttl=ttl) # profile_id -> tuple of custom categories
+        self.keyboards = TTLCache(maxsize=maxsize, ttl=ttl) # profile_id -> {kind: InlineKeyboardMarkup}
+
+    def _load(self, db_session: Session, profile_id):
+        rows = db_session.query(Category.id, Category.name, Category.profile_id).filter(
+            Category.profile_id == profile_id
+        ).order_by(Category.id).all()
+        return tuple(_category(row) for row in rows)
+
+    def get_categories(self, db_session: Session, profile_id: int) -> list:
+        """Default categories followed by the profile's custom ones."""
+        if self._defaults is None:
+            with self._defaults_lock:
+                if self._defaults is None:
+                    self._defaults = self._load(db_session, None)
+        custom = self.custom.get(profile_id)
+        if custom is None:
+            custom = self._load(db_session, profile_id)
+            self.custom.set(profile_id, custom)
+        return list(self._defaults + custom)
+
+    def find(self, db_session: Session, profile_id: int, category_id: int):
+        """Returns the category if it is visible to the profile (a default or one of its own), else None."""
+        return next((category for category in self.get_categories(db_session, profile_id) if category.id == category_id), None)
+
+    def get_keyboard(self, db_session: Session, profile_id: int, kind: str, build):
+        """Returns the cached keyboard of the given kind, building it with build(categories) on a miss."""
+        keyboards = self.keyboards.get(profile_id)
+        if keyboards is None:
+            keyboards = {}
+            self.keyboards.set(profile_id, keyboards)
+        if kind not in keyboards:
+            keyboards[kind] = build(self.get_categories(db_session, profile_id))
+        return keyboards[kind]
+
+    def invalidate(self, profile_id: int):
+        self.custom.invalidate(profile_id)
+        self.keyboards.invalidate(profile_id)
+
+    def clear(self):
+        """Drops every profile's custom categories and keyboards; defaults never change at runtime."""
+        self.custom.clear()
+        self.keyboards.clear()
+
+    def get_stats(self) -> dict:
+        return {"defaults_loaded": self._defaults is not None, "custom": self.custom.get_stats(), "keyboards": self.keyboards.get_stats()}
+
+category_cache = CategoryCache()
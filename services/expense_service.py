@@ -4,46 +4,122 @@ from models import Expense, Category, User
 import datetime # Keep base datetime for utcnow
 from datetime import timezone # Import timezone
 import re
-from sqlalchemy import func, delete # Import delete
+from sqlalchemy import func, delete, insert # Import delete
 from utils.datetime_utils import wat_month_bounds_utc, to_wat, WAT # Import the new utilities
+from services.category_cache import category_cache
+from services.summary_cache import summary_cache
+from services.history_cache import history_cache
+from services.quota_service import QuotaService
+from services.budget_service import BudgetService
 # Removed: from services import UserService, ProfileService # Moved inside function to break circular import
 
 FREE_CUSTOM_CATEGORY_LIMIT = 3
+FREE_MONTHLY_EXPENSE_LIMIT = 150
+BULK_EXPENSE_MAX_LINES = 50 # Lines accepted from a single bulk entry message
+BULK_FALLBACK_CATEGORY = "Other" # Used when a bulk line names a category the profile doesn't have
+
+# Compiled once at import; "paid [amount] for [description]" or "[amount] for [description]"
+EXPENSE_LINE_PATTERN = re.compile(r"(?:paid\s+)?(\d+(?:[.,]\d{1,2})?)\s+for\s+(.+)", re.IGNORECASE)
+# Optional trailing "#Category" on bulk lines
+CATEGORY_SUFFIX_PATTERN = re.compile(r"\s+#([^\s#]+)$")
 
 class ExpenseService:
     def __init__(self, db_session: Session):
         self.db_session = db_session
+        self.budget_alerts = [] # Budget alerts raised by expenses added through this service; callers send them
 
     def add_expense(self, profile_id: int, amount: float, description: str, category_id: int = None, date: datetime = None):
-        expense = Expense(
-            profile_id=profile_id,
-            amount=amount,
-            description=description,
-            category_id=category_id,
-            date=date if date is not None else datetime.datetime.now(timezone.utc) # Use provided date or fallback to now
-        )
-        self.db_session.add(expense)
+        # INSERT ... RETURNING hands back the full row in the same round trip; no refresh needed
+        expense = self.db_session.scalars(
+            insert(Expense).values(
+                profile_id=profile_id,
+                amount=amount,
+                description=description,
+                category_id=category_id,
+                date=date if date is not None else datetime.datetime.now(timezone.utc) # Use provided date or fallback to now
+            ).returning(Expense)
+        ).one()
+        QuotaService(self.db_session).record_expenses(profile_id, [expense.date])
+        self.budget_alerts.extend(BudgetService(self.db_session).record_expense(profile_id, amount, category_id, expense.date))
+        history_version = history_cache.begin_write(profile_id)
         self.db_session.commit()
-        self.db_session.refresh(expense)
+        summary_cache.invalidate(profile_id)
+        history_cache.record_expenses(profile_id, [(expense.date, expense.amount, expense.category_id)], history_version)
         return expense
 
     def parse_expense_message(self, message_text: str):
-        # Regex to match "paid [amount] for [description]" or "[amount] for [description]"
-        pattern = re.compile(r"(?:paid\s+)?(\d+(?:[.,]\d{1,2})?)\s+for\s+(.+)", re.IGNORECASE)
-        match = pattern.match(message_text.strip())
+        match = EXPENSE_LINE_PATTERN.match(message_text.strip())
         if match:
             amount_str = match.group(1).replace(',', '.') # Handle comma as decimal separator
             amount = float(amount_str)
             description = match.group(2).strip()
             return amount, description
         return None, None
+
+    def parse_bulk_expense_message(self, message_text: str, max_lines: int = BULK_EXPENSE_MAX_LINES):
+        """
+        Parses one expense per line, each optionally ending in '#Category'.
+        Returns (entries, rejected_lines); entries are {"amount", "description", "category"} dicts.
+        Lines past max_lines are rejected rather than silently dropped.
+        """
+        entries, rejected = [], []
+        lines = [line.strip() for line in message_text.splitlines() if line.strip()]
+        for index, line in enumerate(lines):
+            if index >= max_lines:
+                rejected.append(line)
+                continue
+            category = None
+            suffix = CATEGORY_SUFFIX_PATTERN.search(line)
+            if suffix:
+                category = suffix.group(1)
+                line_body = line[:suffix.start()]
+            else:
+                line_body = line
+            amount, description = self.parse_expense_message(line_body)
+            if amount is None or amount <= 0:
+                rejected.append(line)
+                continue
+            entries.append({"amount": amount, "description": description, "category": category})
+        return entries, rejected
+
+    def add_expenses_bulk(self, profile_id: int, entries: list, date: datetime.datetime = None) -> int:
+        """
+        Inserts many expenses with one multi-row INSERT and a single commit.
+        Category names are matched case-insensitively against the profile's and default categories
+        (from the category cache); unknown names fall back to BULK_FALLBACK_CATEGORY.
+        """
+        if not entries:
+            return 0
+        categories = {category.name.lower(): category.id for category in self.get_categories(profile_id)}
+        fallback_category_id = categories.get(BULK_FALLBACK_CATEGORY.lower())
+        expense_date = date if date is not None else datetime.datetime.now(timezone.utc)
+
+        rows = [
+            {
+                "profile_id": profile_id,
+                "amount": entry["amount"],
+                "description": entry["description"],
+                "category_id": categories.get((entry.get("category") or BULK_FALLBACK_CATEGORY).lower(), fallback_category_id),
+                "date": expense_date
+            }
+            for entry in entries
+        ]
+        self.db_session.execute(insert(Expense), rows)
+        QuotaService(self.db_session).record_expenses(profile_id, [expense_date] * len(rows))
+        # Budgets are resolved and updated once for the whole batch
+        category_totals = {}
+        for row in rows:
+            category_totals[row["category_id"]] = category_totals.get(row["category_id"], 0) + row["amount"]
+        self.budget_alerts.extend(BudgetService(self.db_session).record_expenses(profile_id, category_totals, expense_date))
+        history_version = history_cache.begin_write(profile_id)
+        self.db_session.commit()
+        summary_cache.invalidate(profile_id)
+        history_cache.record_expenses(profile_id, [(row["date"], row["amount"], row["category_id"]) for row in rows], history_version)
+        return len(rows)
     
     def get_categories(self, profile_id: int):
-        # Get default categories (profile_id is NULL)
-        default_categories = self.db_session.query(Category).filter(Category.profile_id == None).all()
-        # Get custom categories for the profile
-        user_categories = self.db_session.query(Category).filter(Category.profile_id == profile_id).all()
-        return default_categories + user_categories
+        # Default categories (profile_id is NULL) followed by the profile's custom ones, served from the category cache
+        return category_cache.get_categories(self.db_session, profile_id)
 
     def add_custom_category(self, profile_id: int, category_name: str):
         # Local imports to break circular dependency
@@ -60,11 +136,10 @@ class ExpenseService:
         if not user:
             return "User not found."
 
+        quota_service = QuotaService(self.db_session)
         # Restrict free users
         if not user.is_pro:
-            custom_categories_count = self.db_session.query(Category).filter(
-                Category.profile_id == profile_id
-            ).count()
+            custom_categories_count = quota_service.custom_category_count(profile_id)
             if custom_categories_count >= FREE_CUSTOM_CATEGORY_LIMIT:
                 return f"Free users are limited to {FREE_CUSTOM_CATEGORY_LIMIT} custom categories. Please upgrade to Pro to create more!"
 
@@ -77,24 +152,20 @@ class ExpenseService:
         if existing_category:
             return "Category already exists."
 
-        new_category = Category(name=category_name, profile_id=profile_id)
-        self.db_session.add(new_category)
+        new_category = self.db_session.scalars(
+            insert(Category).values(name=category_name, profile_id=profile_id).returning(Category)
+        ).one()
+        quota_service.record_custom_categories(profile_id)
         self.db_session.commit()
-        self.db_session.refresh(new_category)
+        category_cache.invalidate(profile_id)
         return new_category
 
     def get_category_by_id(self, category_id: int):
         return self.db_session.query(Category).filter(Category.id == category_id).first()
 
     def get_monthly_expense_count(self, profile_id: int) -> int:
-        start_of_month_utc, start_of_next_month_utc = wat_month_bounds_utc()
-        
-        count = self.db_session.query(func.count(Expense.id)).filter(
-            Expense.profile_id == profile_id,
-            Expense.date >= start_of_month_utc,
-            Expense.date < start_of_next_month_utc
-        ).scalar()
-        return count
+        # Read from the profile's usage counter for the current WAT month instead of counting rows
+        return QuotaService(self.db_session).monthly_expense_count(profile_id)
 
     def get_monthly_limit_reset_date(self) -> datetime.datetime:
         # Get the start of the current WAT month in UTC
@@ -110,34 +181,41 @@ class ExpenseService:
             
         return reset_date_wat # Return WAT-aware datetime for display, consistent with trial_end_date.
 
-    def can_log_expense(self, user: User) -> bool:
+    def can_log_expense(self, user: User, profile_id: int = None) -> bool:
         if user.is_pro:
             return True
         
-        # Free users can only have one profile, so we can use the first one
-        if not user.profiles:
-            return False # Should not happen if profile is created on start
-            
-        profile = user.profiles[0]
-        monthly_expense_count = self.get_monthly_expense_count(profile.id)
-        return monthly_expense_count < 150 # Free user limit
+        if profile_id is None:
+            # Free users can only have one profile, so we can use the first one
+            if not user.profiles:
+                return False # Should not happen if profile is created on start
+            profile_id = user.profiles[0].id
+
+        monthly_expense_count = self.get_monthly_expense_count(profile_id)
+        return monthly_expense_count < FREE_MONTHLY_EXPENSE_LIMIT # Free user limit
 
     def get_expenses_by_profile(self, profile_id: int):
         expenses = self.db_session.query(Expense).filter(Expense.profile_id == profile_id).order_by(Expense.date).all()
         for exp in expenses:
             if exp.date and exp.date.tzinfo is None:
                 exp.date = exp.date.replace(tzinfo=timezone.utc) # Assume naive is UTC
-            logging.info(f"Expense ID: {exp.id}, Date: {exp.date}, TZInfo: {exp.date.tzinfo}, Type: {type(exp.date)}")
         return expenses
 
     def delete_expenses_by_date_range(self, profile_id: int, start_date_utc: datetime.datetime, end_date_utc: datetime.datetime) -> int:
         """Deletes expenses for a given profile within a specified UTC date range."""
-        deleted_count = self.db_session.query(Expense).filter(
-            Expense.profile_id == profile_id,
-            Expense.date >= start_date_utc,
-            Expense.date < end_date_utc
-        ).delete(synchronize_session=False)
+        deleted_dates = self.db_session.scalars(
+            delete(Expense).where(
+                Expense.profile_id == profile_id,
+                Expense.date >= start_date_utc,
+                Expense.date < end_date_utc
+            ).returning(Expense.date).execution_options(synchronize_session=False)
+        ).all()
+        deleted_count = len(deleted_dates)
+        QuotaService(self.db_session).record_expenses(profile_id, deleted_dates, sign=-1)
+        BudgetService(self.db_session).recompute_spent(profile_id)
         self.db_session.commit()
+        summary_cache.invalidate(profile_id)
+        history_cache.invalidate(profile_id)
         return deleted_count
 
     def delete_all_expenses(self, profile_id: int) -> int:
@@ -145,5 +223,9 @@ class ExpenseService:
         deleted_count = self.db_session.query(Expense).filter(
             Expense.profile_id == profile_id
         ).delete(synchronize_session=False)
+        QuotaService(self.db_session).clear_expenses(profile_id)
+        BudgetService(self.db_session).recompute_spent(profile_id)
         self.db_session.commit()
+        summary_cache.invalidate(profile_id)
+        history_cache.invalidate(profile_id)
         return deleted_count
\ No newline at end of file
@@ -0,0 +1,253 @@
+import os
+import time
+import threading
+import datetime
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import Expense, Income
+
+HISTORY_CACHE_ENABLED = os.getenv("HISTORY_CACHE_ENABLED", "false").lower() in ("1", "true", "yes") # Off by default; summaries fall back to SQL
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))) # Memory budget for all cached histories in a process
+HISTORY_CACHE_TTL_SECONDS = int(os.getenv("HISTORY_CACHE_TTL_SECONDS", "900")) # Bounds staleness for writes made by other processes
+HISTORY_CACHE_MAX_VERSIONS = int(os.getenv("HISTORY_CACHE_MAX_VERSIONS", "100000")) # Profiles with a write version kept before the cache starts over
+
+KIND_EXPENSE = 0
+KIND_INCOME = 1
+NO_CATEGORY = -1 # category_ids value for uncategorized expenses and for incomes
+
+def to_epoch(date: datetime.datetime) -> int:
+    """Seconds since the epoch; naive datetimes are taken as UTC."""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return int(date.timestamp())
+
+class ProfileHistory:
+    """
+    One profile's expenses and incomes as parallel NumPy arrays sorted by timestamp. The arrays keep
+    spare capacity so appends are amortized O(1); only out-of-order (backdated) appends re-sort.
+    """
+    def __init__(self, timestamps, amounts, category_ids, kinds):
+        order = np.argsort(timestamps, kind="stable")
+        self._size = len(order)
+        capacity = max(16, self._size)
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._amounts = np.empty(capacity, dtype=np.float64)
+        self._category_ids = np.empty(capacity, dtype=np.int32)
+        self._kinds = np.empty(capacity, dtype=np.int8)
+        self._timestamps[:self._size] = timestamps[order]
+        self._amounts[:self._size] = amounts[order]
+        self._category_ids[:self._size] = category_ids[order]
+        self._kinds[:self._size] = kinds[order]
+        self._lock = threading.Lock()
+        self.loaded_at = time.monotonic()
+        self.version = None # (epoch, profile write version) when the cache stored this history
+
+    @property
+    def nbytes(self) -> int:
+        return self._timestamps.nbytes + self._amounts.nbytes + self._category_ids.nbytes + self._kinds.nbytes
+
+    def append(self, timestamps, amounts, category_ids, kind: int):
+        count = len(timestamps)
+        if not count:
+            return
+        with self._lock:
+            needed = self._size + count
+            if needed > len(self._timestamps):
+                capacity = max(needed, 2 * len(self._timestamps))
+                for name in ("_timestamps", "_amounts", "_category_ids", "_kinds"):
+                    grown = np.empty(capacity, dtype=getattr(self, name).dtype)
+                    grown[:self._size] = getattr(self, name)[:self._size]
+                    setattr(self, name, grown)
+            in_order = self._size == 0 or timestamps.min() >= self._timestamps[self._size - 1]
+            self._timestamps[self._size:needed] = timestamps
+            self._amounts[self._size:needed] = amounts
+            self._category_ids[self._size:needed] = category_ids
+            self._kinds[self._size:needed] = kind
+            self._size = needed
+            if not in_order:
+                order = np.argsort(self._timestamps[:needed], kind="stable")
+                for name in ("_timestamps", "_amounts", "_category_ids", "_kinds"):
+                    array = getattr(self, name)
+                    array[:needed] = array[:needed][order]
+
+    def window(self, start_utc: datetime.datetime, end_utc: datetime.datetime):
+        """Copies of (amounts, category_ids, kinds) for entries in [start_utc, end_utc), found with searchsorted."""
+        with self._lock:
+            timestamps = self._timestamps[:self._size]
+            lo = np.searchsorted(timestamps, to_epoch(start_utc), side="left")
+            hi = np.searchsorted(timestamps, to_epoch(end_utc), side="left")
+            return self._amounts[lo:hi].copy(), self._category_ids[lo:hi].copy(), self._kinds[lo:hi].copy()
+
+    def daily_expenses(self, start_utc: datetime.datetime, days: int, day_seconds: int = 86400):
+        """Dense array of expense totals per day for `days` days from start_utc, with one bincount."""
+        with self._lock:
+            timestamps = self._timestamps[:self._size]
+            start = to_epoch(start_utc)
+            lo = np.searchsorted(timestamps, start, side="left")
+            hi = np.searchsorted(timestamps, start + days * day_seconds, side="left")
+            is_expense = self._kinds[lo:hi] == KIND_EXPENSE
+            offsets = (timestamps[lo:hi][is_expense] - start) // day_seconds
+            amounts = self._amounts[lo:hi][is_expense]
+        return np.bincount(offsets, weights=amounts, minlength=days)[:days]
+
+    def totals(self, start_utc: datetime.datetime, end_utc: datetime.datetime) -> dict:
+        """
+        Expense and income totals for the range, plus expense totals per category id
+        (NO_CATEGORY for uncategorized), using one bincount over the window.
+        """
+        amounts, category_ids, kinds = self.window(start_utc, end_utc)
+        is_expense = kinds == KIND_EXPENSE
+        expense_amounts = amounts[is_expense]
+        expense_categories = category_ids[is_expense]
+        by_category = {}
+        if len(expense_amounts):
+            sums = np.bincount(expense_categories + 1, weights=expense_amounts) # Shift so NO_CATEGORY lands in bin 0
+            present = np.bincount(expense_categories + 1)
+            by_category = {int(index) - 1: float(sums[index]) for index in np.flatnonzero(present)}
+        return {
+            "total_expenses": float(expense_amounts.sum()),
+            "num_expense_entries": int(len(expense_amounts)),
+            "total_income": float(amounts[~is_expense].sum()),
+            "expenses_by_category_id": by_category,
+        }
+
+class HistoryCache:
+    """
+    Per-profile columnar history, loaded on first use, appended to by writes in this process and
+    dropped by deletes and imports. Least recently used profiles are evicted to stay within
+    max_bytes; entries older than ttl are reloaded.
+    Writers call begin_write before their commit and pass its version to record_expenses/record_incomes,
+    so rows are only appended to histories known to have been loaded before the commit.
+    """
+    def __init__(self, max_bytes: int = HISTORY_CACHE_MAX_BYTES, ttl: float = HISTORY_CACHE_TTL_SECONDS, enabled: bool = HISTORY_CACHE_ENABLED):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self._histories = OrderedDict() # profile_id -> ProfileHistory, least recently used first
+        self._versions = {} # profile_id -> int, bumped by every write so a load racing a write is not kept
+        self._epoch = 0 # Bumped by clear(), so loads already running are not kept
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self, db_session: Session, profile_id: int) -> ProfileHistory:
+        expenses = db_session.execute(
+            select(Expense.date, Expense.amount, Expense.category_id).where(Expense.profile_id == profile_id, Expense.date != None)
+        ).all()
+        incomes = db_session.execute(
+            select(Income.date, Income.amount).where(Income.profile_id == profile_id, Income.date != None)
+        ).all()
+        count = len(expenses) + len(incomes)
+        timestamps = np.fromiter((to_epoch(row[0]) for row in (*expenses, *incomes)), dtype=np.int64, count=count)
+        amounts = np.fromiter((row[1] for row in (*expenses, *incomes)), dtype=np.float64, count=count)
+        category_ids = np.full(count, NO_CATEGORY, dtype=np.int32)
+        category_ids[:len(expenses)] = np.fromiter(
+            (NO_CATEGORY if row[2] is None else row[2] for row in expenses), dtype=np.int32, count=len(expenses)
+        )
+        kinds = np.full(count, KIND_INCOME, dtype=np.int8)
+        kinds[:len(expenses)] = KIND_EXPENSE
+        return ProfileHistory(timestamps, amounts, category_ids, kinds)
+
+    def get(self, db_session: Session, profile_id: int) -> ProfileHistory:
+        """Returns the profile's history, loading it on a miss. Returns None when the cache is disabled."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            history = self._histories.get(profile_id)
+            if history is not None and time.monotonic() - history.loaded_at < self.ttl:
+                self._histories.move_to_end(profile_id)
+                self.hits += 1
+                return history
+            self.misses += 1
+            version = (self._epoch, self._versions.get(profile_id, 0))
+        history = self._load(db_session, profile_id)
+        with self._lock:
+            if (self._epoch, self._versions.get(profile_id, 0)) == version:
+                history.version = version
+                self._histories[profile_id] = history
+                self._histories.move_to_end(profile_id)
+                self._evict()
+        return history
+
+    def _evict(self):
+        total = sum(history.nbytes for history in self._histories.values())
+        while total > self.max_bytes and len(self._histories) > 1:
+            _, evicted = self._histories.popitem(last=False)
+            total -= evicted.nbytes
+            self.evictions += 1
+
+    def _bump_version(self, profile_id: int):
+        """Call with the lock held."""
+        self._versions[profile_id] = self._versions.get(profile_id, 0) + 1
+        if len(self._versions) > HISTORY_CACHE_MAX_VERSIONS:
+            self._clear() # Versions can only be forgotten once every load keyed by them is discarded
+
+    def begin_write(self, profile_id: int) -> tuple:
+        """Call before committing rows that will be recorded; returns the version to pass to record_*."""
+        with self._lock:
+            self._bump_version(profile_id)
+            return (self._epoch, self._versions.get(profile_id, 0))
+
+    def _record(self, profile_id: int, rows: list, kind: int, write_version: tuple):
+        with self._lock:
+            history = self._histories.get(profile_id)
+            if history is not None and not (history.version[0] == write_version[0] and history.version[1] < write_version[1]):
+                # Stored after begin_write, so it may have been loaded after the commit and hold the rows already
+                self._histories.pop(profile_id)
+                history = None
+            self._bump_version(profile_id) # A load that started before the commit must not be stored
+        if history is None or not rows:
+            return # Not loaded; the next get reads the rows from the database
+        history.append(
+            np.fromiter((to_epoch(row[0]) for row in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows)),
+            np.fromiter((NO_CATEGORY if len(row) < 3 or row[2] is None else row[2] for row in rows), dtype=np.int32, count=len(rows)),
+            kind
+        )
+        with self._lock:
+            self._evict()
+
+    def record_expenses(self, profile_id: int, rows: list, write_version: tuple):
+        """Appends committed expenses given as (date, amount, category_id) tuples."""
+        self._record(profile_id, rows, KIND_EXPENSE, write_version)
+
+    def record_incomes(self, profile_id: int, rows: list, write_version: tuple):
+        """Appends committed incomes given as (date, amount) tuples."""
+        self._record(profile_id, rows, KIND_INCOME, write_version)
+
+    def invalidate(self, profile_id: int):
+        """Call after deletes or bulk loads that are not worth replaying."""
+        with self._lock:
+            self._bump_version(profile_id)
+            self._histories.pop(profile_id, None)
+
+    def _clear(self):
+        self._epoch += 1
+        self._histories.clear()
+        self._versions.clear()
+
+    def clear(self):
+        """Drops every loaded history, e.g. after another process bulk-wrote rows."""
+        with self._lock:
+            self._clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            size = len(self._histories)
+            nbytes = sum(history.nbytes for history in self._histories.values())
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": size,
+            "bytes": nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+history_cache = HistoryCache()
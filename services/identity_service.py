@@ -0,0 +1,53 @@
+import os
+from types import SimpleNamespace
+from sqlalchemy import select, inspect
+from sqlalchemy.orm import Session
+from models import User, Profile
+from utils.cache import TTLCache
+
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000")) # Users kept per process
+IDENTITY_CACHE_TTL_SECONDS = int(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "120")) # Bounds staleness for writes made by other processes
+
+# telegram_id -> Identity; snapshots are shared across updates, so never mutate them
+identity_cache = TTLCache(maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL_SECONDS)
+
+def invalidate_identity(telegram_id: int):
+    """Drops a user's cached identity. Call after writing their user row or any of their profiles."""
+    identity_cache.invalidate(telegram_id)
+
+def _snapshot(instance):
+    """Copies an ORM row's column values into a plain object that is safe to use after the session closes."""
+    if instance is None:
+        return None
+    return SimpleNamespace(**{attr.key: getattr(instance, attr.key) for attr in inspect(instance).mapper.column_attrs})
+
+class Identity:
+    """The user behind an update and their current profile, as read-only snapshots (either may be None)."""
+    def __init__(self, telegram_id: int, user=None, profile=None):
+        self.telegram_id = telegram_id
+        self.user = user
+        self.profile = profile
+
+class IdentityService:
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def resolve(self, telegram_id: int) -> Identity:
+        """Returns the cached identity, or loads it and caches it."""
+        identity = identity_cache.get(telegram_id)
+        if identity is None:
+            identity = self.load(telegram_id)
+            identity_cache.set(telegram_id, identity)
+        return identity
+
+    def load(self, telegram_id: int) -> Identity:
+        """Loads the user and their current profile with one joined query."""
+        row = self.db_session.execute(
+            select(User, Profile)
+            .outerjoin(Profile, User.current_profile_id == Profile.id)
+            .where(User.telegram_id == telegram_id)
+        ).first()
+        if row is None:
+            return Identity(telegram_id)
+        user, profile = row
+        return Identity(telegram_id, _snapshot(user), _snapshot(profile))
@@ -0,0 +1,234 @@
+import io
+import os
+import re
+import csv
+import logging
+import datetime
+from datetime import timezone
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from models import SessionLocal, Expense, Income, Category
+from utils.datetime_utils import WAT
+from services.expense_service import FREE_CUSTOM_CATEGORY_LIMIT, BULK_FALLBACK_CATEGORY
+from services.category_cache import category_cache
+from services.quota_service import QuotaService
+from services.summary_cache import summary_cache
+from services.history_cache import history_cache
+from services.budget_service import BudgetService
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000")) # Rows per multi-row INSERT
+IMPORT_MAX_FILE_BYTES = 20 * 1024 * 1024 # Telegram's bot download limit
+IMPORT_MAX_ERROR_SAMPLES = 10
+MAX_IMPORT_AMOUNT = 1_000_000_000_000 # Sanity cap on a single row
+
+# Accepted header names (case-insensitive) for each field; the export's own headers come first
+COLUMN_ALIASES = {
+    "type": ("type", "transaction type"),
+    "date": ("date", "transaction date", "value date", "posted date"),
+    "amount": ("amount", "value"),
+    "debit": ("debit", "withdrawal", "money out"),
+    "credit": ("credit", "deposit", "money in"),
+    "description": ("description/source", "description", "source", "narration", "details", "memo"),
+    "category": ("category",),
+}
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%d/%m/%Y %H:%M", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d %b %Y")
+EXPORT_TZ_SUFFIX = re.compile(r"\s+[A-Z]{2,5}([+-]\d{4})$") # "2024-03-01 10:00:00 WAT+0100" as written by ReportService
+AMOUNT_CLEANUP = re.compile(r"[^\d.\-]")
+
+class ImportResult:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.expenses = 0
+        self.incomes = 0
+        self.categories_created = 0
+        self.errors = [] # First IMPORT_MAX_ERROR_SAMPLES "row N: reason" messages
+
+    def reject(self, row_number: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERROR_SAMPLES:
+            self.errors.append(f"Row {row_number}: {reason}")
+
+def _parse_amount(raw: str):
+    if raw is None or not raw.strip():
+        return None
+    negative = raw.strip().startswith("(") and raw.strip().endswith(")") # Accounting style (1,000.00)
+    try:
+        amount = float(AMOUNT_CLEANUP.sub("", raw.replace(",", "")))
+    except ValueError:
+        raise ValueError(f"invalid amount '{raw.strip()}'")
+    return -amount if negative else amount
+
+def _parse_date(raw: str) -> datetime.datetime:
+    """Parses the supported date formats; naive values are taken as WAT wall-clock time."""
+    raw = (raw or "").strip()
+    if not raw:
+        raise ValueError("missing date")
+    raw = EXPORT_TZ_SUFFIX.sub(r"\1", raw)
+    try:
+        parsed = datetime.datetime.fromisoformat(raw)
+    except ValueError:
+        for fmt in DATE_FORMATS + tuple(f + "%z" for f in DATE_FORMATS[:2]):
+            try:
+                parsed = datetime.datetime.strptime(raw, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"unrecognised date '{raw}'")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=WAT)
+    return parsed.astimezone(timezone.utc)
+
+class ImportService:
+    """
+    Imports transactions from a CSV file (the bot's own export or a bank/spreadsheet statement).
+    Rows are streamed and validated one at a time and written in IMPORT_BATCH_SIZE multi-row
+    INSERTs, so memory stays bounded by the batch size. The whole file is one transaction: a file
+    that fails partway (e.g. a decoding error deep into it) leaves nothing behind and can be resent.
+    """
+    def __init__(self, db_session: Session, batch_size: int = IMPORT_BATCH_SIZE):
+        self.db_session = db_session
+        self.batch_size = batch_size
+
+    def _resolve_columns(self, fieldnames: list) -> dict:
+        normalized = {name.strip().lower(): name for name in fieldnames if name}
+        columns = {}
+        for field, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in normalized:
+                    columns[field] = normalized[alias]
+                    break
+        return columns
+
+    def _load_categories(self, profile_id: int):
+        rows = self.db_session.query(Category.id, Category.name, Category.profile_id).filter(
+            (Category.profile_id == profile_id) | (Category.profile_id == None)
+        ).all()
+        categories = {name.lower(): category_id for category_id, name, _ in rows}
+        custom_count = sum(1 for _, _, owner in rows if owner is not None)
+        return categories, custom_count
+
+    def _parse_row(self, row: dict, columns: dict):
+        """Returns (kind, values) for a valid row; raises ValueError with a user-facing reason otherwise."""
+        if "amount" in columns:
+            amount = _parse_amount(row.get(columns["amount"]))
+        else:
+            debit = _parse_amount(row.get(columns["debit"])) if "debit" in columns else None
+            credit = _parse_amount(row.get(columns["credit"])) if "credit" in columns else None
+            amount = -abs(debit) if debit else credit
+        if amount is None or amount == 0:
+            raise ValueError("missing amount")
+
+        kind_raw = (row.get(columns["type"]) or "").strip().lower() if "type" in columns else ""
+        if kind_raw in ("expense", "debit", "dr"):
+            kind = "expense"
+        elif kind_raw in ("income", "credit", "cr"):
+            kind = "income"
+        elif not kind_raw:
+            # Without a type column, bank-style signed amounts decide; plain spreadsheets are expenses
+            kind = "income" if amount > 0 and ("credit" in columns or "debit" in columns) else "expense"
+        else:
+            raise ValueError(f"unknown type '{kind_raw}'")
+
+        amount = abs(amount)
+        if amount > MAX_IMPORT_AMOUNT:
+            raise ValueError("amount too large")
+
+        description = (row.get(columns["description"]) or "").strip() if "description" in columns else ""
+        category = (row.get(columns["category"]) or "").strip() if "category" in columns else ""
+        return kind, {
+            "amount": amount,
+            "date": _parse_date(row.get(columns["date"])),
+            "description": description[:255] or None,
+            "category": None if category in ("", "N/A") else category
+        }
+
+    def _flush(self, profile_id: int, expense_rows: list, income_rows: list):
+        if expense_rows:
+            self.db_session.execute(insert(Expense), expense_rows)
+            QuotaService(self.db_session).record_expenses(profile_id, [row["date"] for row in expense_rows])
+        if income_rows:
+            self.db_session.execute(insert(Income), income_rows)
+        self.db_session.flush()
+        expense_rows.clear()
+        income_rows.clear()
+
+    def import_csv(self, profile_id: int, binary_file, is_pro: bool) -> ImportResult:
+        """
+        Streams the CSV in binary_file into the profile. Categories are matched by name
+        (case-insensitive); unknown ones are created while the plan's custom category limit
+        allows, otherwise the row is filed under the fallback category. Commits once, after the
+        last row; the caller rolls back if anything raises.
+        """
+        result = ImportResult()
+        text_file = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(text_file)
+        if not reader.fieldnames:
+            raise ValueError("The file is empty.")
+        columns = self._resolve_columns(reader.fieldnames)
+        if "date" not in columns or not ({"amount", "debit", "credit"} & columns.keys()):
+            raise ValueError("The file needs a Date column and an Amount (or Debit/Credit) column.")
+
+        categories, custom_count = self._load_categories(profile_id)
+        fallback_category_id = categories.get(BULK_FALLBACK_CATEGORY.lower())
+        expense_rows, income_rows = [], []
+
+        for row_number, row in enumerate(reader, start=2): # Row 1 is the header
+            try:
+                kind, values = self._parse_row(row, columns)
+            except (ValueError, TypeError) as e:
+                result.reject(row_number, str(e))
+                continue
+
+            if kind == "expense":
+                category_id = fallback_category_id
+                if values["category"]:
+                    key = values["category"].lower()
+                    if key not in categories and (is_pro or custom_count < FREE_CUSTOM_CATEGORY_LIMIT):
+                        new_category = Category(name=values["category"], profile_id=profile_id)
+                        self.db_session.add(new_category)
+                        self.db_session.flush() # Assigns the id inside the import's transaction
+                        QuotaService(self.db_session).record_custom_categories(profile_id)
+                        categories[key] = new_category.id
+                        custom_count += 1
+                        result.categories_created += 1
+                    category_id = categories.get(key, fallback_category_id)
+                expense_rows.append({
+                    "profile_id": profile_id, "amount": values["amount"], "description": values["description"],
+                    "category_id": category_id, "date": values["date"]
+                })
+                result.expenses += 1
+            else:
+                income_rows.append({
+                    "profile_id": profile_id, "amount": values["amount"], "source": values["description"], "date": values["date"]
+                })
+                result.incomes += 1
+            result.accepted += 1
+
+            if len(expense_rows) + len(income_rows) >= self.batch_size:
+                self._flush(profile_id, expense_rows, income_rows)
+
+        self._flush(profile_id, expense_rows, income_rows)
+        BudgetService(self.db_session).recompute_spent(profile_id) # Imported rows may land in active budget windows
+        self.db_session.commit()
+        text_file.detach()
+        logger.info(f"Imported {result.accepted} rows ({result.rejected} rejected) into profile {profile_id}.")
+        return result
+
+def import_csv_file(profile_id: int, binary_file, is_pro: bool) -> ImportResult:
+    """Runs an import on its own session. Meant to run in a worker thread via asyncio.to_thread."""
+    db_session = SessionLocal()
+    try:
+        return ImportService(db_session).import_csv(profile_id, binary_file, is_pro)
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+        # Whether the import committed or rolled back, cached reads of this profile must not outlive it
+        summary_cache.invalidate(profile_id)
+        history_cache.invalidate(profile_id)
+        category_cache.invalidate(profile_id)
@@ -3,28 +3,34 @@ from sqlalchemy.orm import Session
 from models import Income
 from datetime import datetime, timezone # Updated import to include timezone
 import re
-from sqlalchemy import func, delete # Import delete
+from sqlalchemy import func, delete, insert # Import delete
+from services.summary_cache import summary_cache
+from services.history_cache import history_cache
+
+# Compiled once at import; "[amount] from [source]" or "earned [amount] from [source]"
+INCOME_LINE_PATTERN = re.compile(r"(?:(?:earned|received)\s+)?(\d+(?:[.,]\d{1,2})?)\s+(?:from|for)\s+(.+)", re.IGNORECASE)
 
 class IncomeService:
     def __init__(self, db_session: Session):
         self.db_session = db_session
 
     def add_income(self, profile_id: int, amount: float, source: str):
-        income = Income(
-            profile_id=profile_id,
-            amount=amount,
-            source=source,
-            date=datetime.now(timezone.utc) # Store as UTC
-        )
-        self.db_session.add(income)
+        income = self.db_session.scalars(
+            insert(Income).values(
+                profile_id=profile_id,
+                amount=amount,
+                source=source,
+                date=datetime.now(timezone.utc) # Store as UTC
+            ).returning(Income)
+        ).one()
+        history_version = history_cache.begin_write(profile_id)
         self.db_session.commit()
-        self.db_session.refresh(income)
+        summary_cache.invalidate(profile_id)
+        history_cache.record_incomes(profile_id, [(income.date, income.amount)], history_version)
         return income
 
     def parse_income_message(self, message_text: str):
-        # Regex to match "[amount] from [source]" or "earned [amount] from [source]"
-        pattern = re.compile(r"(?:(?:earned|received)\s+)?(\d+(?:[.,]\d{1,2})?)\s+(?:from|for)\s+(.+)", re.IGNORECASE)
-        match = pattern.match(message_text.strip())
+        match = INCOME_LINE_PATTERN.match(message_text.strip())
         if match:
             amount_str = match.group(1).replace(',', '.') # Handle comma as decimal separator
             amount = float(amount_str)
@@ -37,7 +43,6 @@ class IncomeService:
         for inc in incomes:
             if inc.date and inc.date.tzinfo is None:
                 inc.date = inc.date.replace(tzinfo=timezone.utc) # Assume naive is UTC
-            logging.info(f"Income ID: {inc.id}, Date: {inc.date}, TZInfo: {inc.date.tzinfo}, Type: {type(inc.date)}")
         return incomes
 
     def delete_incomes_by_date_range(self, profile_id: int, start_date_utc: datetime, end_date_utc: datetime) -> int:
@@ -48,6 +53,8 @@ class IncomeService:
             Income.date < end_date_utc
         ).delete(synchronize_session=False)
         self.db_session.commit()
+        summary_cache.invalidate(profile_id)
+        history_cache.invalidate(profile_id)
         return deleted_count
 
     def delete_all_incomes(self, profile_id: int) -> int:
@@ -56,6 +63,8 @@ class IncomeService:
             Income.profile_id == profile_id
         ).delete(synchronize_session=False)
         self.db_session.commit()
+        summary_cache.invalidate(profile_id)
+        history_cache.invalidate(profile_id)
         return deleted_count
 
 
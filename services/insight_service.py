@@ -0,0 +1,140 @@
+import os
+import logging
+import datetime
+from datetime import timezone, timedelta
+import numpy as np
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+from models import SessionLocal, Expense, Insight, dialect_insert
+from services.category_cache import category_cache
+from services.cache_generations import bump_cache_generations, SUMMARY_CACHE
+from services.summary_service import wat_day_expression, as_date
+from utils.datetime_utils import wat_day_bounds_utc, to_wat, WAT
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_BASELINE_DAYS = int(os.getenv("ANOMALY_BASELINE_DAYS", "90")) # Days before the checked day that make up the baseline
+ANOMALY_SIGMA = float(os.getenv("ANOMALY_SIGMA", "3")) # Flag a day's category spend above mean + k * std of the baseline
+ANOMALY_MIN_ACTIVE_DAYS = int(os.getenv("ANOMALY_MIN_ACTIVE_DAYS", "5")) # Baseline days with spending needed before a category is judged
+INSIGHT_CATEGORY_SPIKE = "category_spike"
+NO_CATEGORY = -1 # Stands in for uncategorized spending in the NumPy key arrays
+
+class InsightService:
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def detect_anomalies(self, day: datetime.date = None) -> int:
+        """
+        Flags (profile, category) pairs whose spend on `day` (default yesterday, WAT) is more than
+        ANOMALY_SIGMA standard deviations above their daily mean over the preceding ANOMALY_BASELINE_DAYS.
+        All profiles that spent that day are handled together: one grouped query, NumPy statistics over
+        a (series x day) matrix, and one bulk insert. Returns the number of insights stored.
+        """
+        if day is None:
+            day = to_wat(datetime.datetime.now(timezone.utc)).date() - timedelta(days=1)
+        day_start_utc, day_end_utc = wat_day_bounds_utc(datetime.datetime.combine(day, datetime.time(12), tzinfo=WAT))
+        first_day = day - timedelta(days=ANOMALY_BASELINE_DAYS)
+
+        spent_that_day = select(Expense.profile_id).where(Expense.date >= day_start_utc, Expense.date < day_end_utc).distinct()
+        wat_day = wat_day_expression(self.db_session.get_bind()).label("day")
+        rows = self.db_session.execute(
+            select(Expense.profile_id, Expense.category_id, wat_day, func.sum(Expense.amount))
+            .where(
+                Expense.profile_id.in_(spent_that_day),
+                Expense.date >= day_start_utc - timedelta(days=ANOMALY_BASELINE_DAYS),
+                Expense.date < day_end_utc
+            )
+            .group_by(Expense.profile_id, Expense.category_id, wat_day)
+        ).all()
+        if not rows:
+            return 0
+
+        count = len(rows)
+        profile_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        category_ids = np.fromiter((NO_CATEGORY if row[1] is None else row[1] for row in rows), dtype=np.int64, count=count)
+        offsets = np.fromiter(((as_date(row[2]) - first_day).days for row in rows), dtype=np.int64, count=count)
+        totals = np.fromiter((row[3] for row in rows), dtype=np.float64, count=count)
+
+        # One row per (profile, category) series, one column per day; the last column is the checked day
+        series_keys, series_index = np.unique(np.stack([profile_ids, category_ids], axis=1), axis=0, return_inverse=True)
+        in_window = (offsets >= 0) & (offsets <= ANOMALY_BASELINE_DAYS)
+        matrix = np.zeros((len(series_keys), ANOMALY_BASELINE_DAYS + 1), dtype=np.float64)
+        matrix[series_index.ravel()[in_window], offsets[in_window]] = totals[in_window]
+
+        baseline, spent = matrix[:, :-1], matrix[:, -1]
+        mean = baseline.mean(axis=1)
+        std = baseline.std(axis=1)
+        active_days = np.count_nonzero(baseline, axis=1)
+        z_scores = np.divide(spent - mean, std, out=np.zeros_like(spent), where=std > 0)
+        flagged = np.flatnonzero((spent > 0) & (active_days >= ANOMALY_MIN_ACTIVE_DAYS) & (z_scores > ANOMALY_SIGMA))
+        if not flagged.size:
+            return 0
+
+        insights = [
+            {
+                "profile_id": int(series_keys[index, 0]),
+                "kind": INSIGHT_CATEGORY_SPIKE,
+                "category_id": None if series_keys[index, 1] == NO_CATEGORY else int(series_keys[index, 1]),
+                "day": day,
+                "amount": float(spent[index]),
+                "baseline_mean": float(mean[index]),
+                "baseline_std": float(std[index]),
+                "z_score": float(z_scores[index]),
+            }
+            for index in flagged
+        ]
+        stored = self.db_session.scalars(
+            dialect_insert(Insight, self.db_session.get_bind()).values(insights)
+            .on_conflict_do_nothing() # Either unique index: categorized or uncategorized
+            .returning(Insight.id)
+        ).all()
+        if stored:
+            bump_cache_generations(self.db_session, SUMMARY_CACHE) # Cached summaries don't list the new insights yet
+        self.db_session.commit()
+        return len(stored)
+
+    def get_unseen(self, profile_id: int, limit: int = 5) -> list:
+        """The profile's insights not yet shown in a summary, newest first, as plain dicts."""
+        insights = self.db_session.query(Insight).filter(
+            Insight.profile_id == profile_id,
+            Insight.seen_at == None
+        ).order_by(Insight.day.desc(), Insight.z_score.desc()).limit(limit).all()
+        result = []
+        for insight in insights:
+            category = category_cache.find(self.db_session, profile_id, insight.category_id) if insight.category_id else None
+            result.append({
+                "id": insight.id,
+                "kind": insight.kind,
+                "category_name": category.name if category else "Uncategorized",
+                "day": insight.day,
+                "amount": insight.amount,
+                "baseline_mean": insight.baseline_mean,
+                "z_score": insight.z_score,
+            })
+        return result
+
+    def mark_seen(self, profile_id: int, insight_ids: list):
+        if not insight_ids:
+            return
+        self.db_session.execute(
+            update(Insight)
+            .where(Insight.profile_id == profile_id, Insight.id.in_(insight_ids), Insight.seen_at == None)
+            .values(seen_at=datetime.datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        self.db_session.commit()
+
+def detect_spending_anomalies(day: datetime.date = None) -> int:
+    """Runs anomaly detection on its own session. Meant to run in a worker thread via asyncio.to_thread."""
+    db_session = SessionLocal()
+    try:
+        return InsightService(db_session).detect_anomalies(day)
+    finally:
+        db_session.close()
+
+def mark_insights_seen(profile_id: int, insight_ids: list):
+    db_session = SessionLocal()
+    try:
+        InsightService(db_session).mark_seen(profile_id, insight_ids)
+    finally:
+        db_session.close()
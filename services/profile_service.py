@@ -2,13 +2,26 @@ from sqlalchemy.orm import Session
 from models import Profile, User
 from services.user_service import UserService
 from services.referral_service import ReferralService # Import ReferralService
+from services.identity_service import invalidate_identity
 from telegram.ext import Application # Import Application
 
 class ProfileService:
     def __init__(self, db_session: Session):
         self.db_session = db_session
-        self.user_service = UserService(db_session)
-        self.referral_service = ReferralService(db_session) # Initialize ReferralService
+        self._user_service = None
+        self._referral_service = None
+
+    @property
+    def user_service(self) -> UserService:
+        if self._user_service is None: # Built on first use; most callers only read profiles
+            self._user_service = UserService(self.db_session)
+        return self._user_service
+
+    @property
+    def referral_service(self) -> ReferralService:
+        if self._referral_service is None: # Only needed when a referred user creates their first profile
+            self._referral_service = ReferralService(self.db_session)
+        return self._referral_service
 
     def create_profile(self, user_telegram_id: int, name: str, profile_type: str, currency: str, application: Application = None) -> Profile: # Added currency and application
         user = self.user_service.get_user(user_telegram_id)
@@ -28,6 +41,7 @@ class ProfileService:
         self.db_session.add(new_profile)
         self.db_session.commit()
         self.db_session.refresh(new_profile)
+        invalidate_identity(user_telegram_id)
 
         # If this is the user's first profile, set it as current
         if not user.current_profile_id:
@@ -35,6 +49,7 @@ class ProfileService:
             self.db_session.add(user)
             self.db_session.commit()
             self.db_session.refresh(user)
+            invalidate_identity(user_telegram_id)
 
             # Check if the user was referred and this is their first profile creation
             if user.referred_by:
@@ -66,5 +81,6 @@ class ProfileService:
             user.current_profile_id = profile_id
             self.db_session.add(user)
             self.db_session.commit()
+            invalidate_identity(user_telegram_id)
             return True
         return False
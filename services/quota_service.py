@@ -0,0 +1,95 @@
+import logging
+import datetime
+from collections import Counter
+from sqlalchemy import select, delete, func, literal
+from sqlalchemy.orm import Session
+from models import SessionLocal, UsageCounter, Expense, Category, dialect_insert
+from utils.datetime_utils import to_wat, wat_month_bounds_utc
+
+logger = logging.getLogger(__name__)
+
+METRIC_EXPENSES = "expenses" # Counted per WAT month
+METRIC_CUSTOM_CATEGORIES = "custom_categories" # Counted over the profile's lifetime
+ALL_TIME_PERIOD = "all"
+
+def month_period(date: datetime.datetime = None) -> str:
+    """The counter period ('YYYY-MM', WAT) a UTC timestamp falls in; defaults to the current month."""
+    return to_wat(date or datetime.datetime.now(datetime.timezone.utc)).strftime("%Y-%m")
+
+class QuotaService:
+    """
+    Per-profile usage counters for free-tier limits. Counters are changed with an atomic upsert in the
+    same transaction as the rows they count (callers commit), and read with one primary-key lookup,
+    so limit checks cost the same however many expenses a profile has.
+    """
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def increment(self, profile_id: int, metric: str, period: str, delta: int = 1):
+        if not delta:
+            return
+        stmt = dialect_insert(UsageCounter, self.db_session.get_bind()).values(
+            profile_id=profile_id, metric=metric, period=period, count=delta
+        )
+        self.db_session.execute(stmt.on_conflict_do_update(
+            index_elements=["profile_id", "metric", "period"],
+            set_={"count": UsageCounter.count + stmt.excluded.count}
+        ))
+
+    def get_count(self, profile_id: int, metric: str, period: str) -> int:
+        return self.db_session.execute(
+            select(UsageCounter.count).where(
+                UsageCounter.profile_id == profile_id,
+                UsageCounter.metric == metric,
+                UsageCounter.period == period
+            )
+        ).scalar() or 0
+
+    def record_expenses(self, profile_id: int, dates, sign: int = 1):
+        """Adds (or with sign=-1 removes) one expense per date to the matching monthly counters."""
+        for period, count in Counter(month_period(date) for date in dates).items():
+            self.increment(profile_id, METRIC_EXPENSES, period, sign * count)
+
+    def clear_expenses(self, profile_id: int):
+        self.db_session.execute(delete(UsageCounter).where(
+            UsageCounter.profile_id == profile_id,
+            UsageCounter.metric == METRIC_EXPENSES
+        ))
+
+    def monthly_expense_count(self, profile_id: int) -> int:
+        return self.get_count(profile_id, METRIC_EXPENSES, month_period())
+
+    def record_custom_categories(self, profile_id: int, count: int = 1):
+        self.increment(profile_id, METRIC_CUSTOM_CATEGORIES, ALL_TIME_PERIOD, count)
+
+    def custom_category_count(self, profile_id: int) -> int:
+        return self.get_count(profile_id, METRIC_CUSTOM_CATEGORIES, ALL_TIME_PERIOD)
+
+    def backfill(self):
+        """
+        Seeds missing counters for the current month and for custom categories from the existing rows.
+        Counters that already exist are left alone, so this is safe to run on every startup.
+        """
+        start_utc, end_utc = wat_month_bounds_utc()
+        sources = [
+            select(Expense.profile_id, literal(METRIC_EXPENSES), literal(month_period()), func.count(Expense.id))
+            .where(Expense.date >= start_utc, Expense.date < end_utc)
+            .group_by(Expense.profile_id),
+            select(Category.profile_id, literal(METRIC_CUSTOM_CATEGORIES), literal(ALL_TIME_PERIOD), func.count(Category.id))
+            .where(Category.profile_id != None)
+            .group_by(Category.profile_id),
+        ]
+        for source in sources:
+            stmt = dialect_insert(UsageCounter, self.db_session.get_bind()).from_select(
+                ["profile_id", "metric", "period", "count"], source
+            )
+            self.db_session.execute(stmt.on_conflict_do_nothing(index_elements=["profile_id", "metric", "period"]))
+        self.db_session.commit()
+
+def backfill_usage_counters():
+    db_session = SessionLocal()
+    try:
+        QuotaService(db_session).backfill()
+        logger.info("Usage counters backfilled.")
+    finally:
+        db_session.close()
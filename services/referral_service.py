@@ -4,6 +4,8 @@ import datetime
 from zoneinfo import ZoneInfo
 from sqlalchemy.orm import Session
 from models import Referral, User
+from services.identity_service import invalidate_identity
+from services.cache_generations import bump_cache_generations, IDENTITY_CACHE
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup # Import necessary classes
 from telegram.ext import Application # Import Application
 import asyncio # Import asyncio
@@ -112,7 +114,9 @@ class ReferralService:
         referral.profile_creation_reward_granted = True
         self.db_session.add(referrer)
         self.db_session.add(referral)
+        bump_cache_generations(self.db_session, IDENTITY_CACHE) # The referrer's updates may be served by another process
         self.db_session.commit()
+        invalidate_identity(referrer.telegram_id)
         
         logger.info(f"Profile creation bonus of {days_to_add} days granted to referrer {referrer.telegram_id} for referred {referred_id}.")
         # Send notification
@@ -145,7 +149,9 @@ class ReferralService:
         referral.upgrade_bonuses_granted_count += 1
         self.db_session.add(referrer)
         self.db_session.add(referral)
+        bump_cache_generations(self.db_session, IDENTITY_CACHE) # The referrer's updates may be served by another process
         self.db_session.commit()
+        invalidate_identity(referrer.telegram_id)
         
         logger.info(f"Upgrade bonus of {days_to_add} days granted to referrer {referrer.telegram_id} for referred {referred_id}. Total upgrade bonuses: {referral.upgrade_bonuses_granted_count}.")
         # Send notification
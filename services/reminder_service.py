@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from models import User, Expense
+from services.identity_service import invalidate_identity
 import datetime
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup # Import necessary classes
 from services.profile_service import ProfileService # Import ProfileService
@@ -23,6 +24,7 @@ class ReminderService:
             self.db_session.add(user)
             self.db_session.commit()
             self.db_session.refresh(user)
+            invalidate_identity(user_telegram_id)
             return user.daily_reminders_enabled
         return False
 
@@ -48,6 +50,7 @@ class ReminderService:
             user.reminder_time = new_time
             self.db_session.add(user)
             self.db_session.commit()
+            invalidate_identity(user_telegram_id)
             return True
         return False
 
@@ -1,38 +1,171 @@
 import io
 import csv
+import time
+import logging
+import tempfile
+from sqlalchemy import select, func, literal
 from sqlalchemy.orm import Session
-from services import ExpenseService, IncomeService
+from models import SessionLocal, Expense, Income, Category
 import datetime
 from utils.datetime_utils import to_wat # Import to_wat
 
+logger = logging.getLogger(__name__)
+
+EXPORT_YIELD_PER = 1000 # Rows fetched from the server-side cursor at a time
+EXPORT_SPOOL_MAX_BYTES = 5 * 1024 * 1024 # Exports larger than this spill from memory to a temp file
+EXPORT_FORMATS = {"csv": "CSV", "xlsx": "Excel (XLSX)", "parquet": "Parquet"} # format (also the file extension) -> label
+REPORT_COLUMNS = ["Type", "Date", "Amount", "Description/Source", "Category"]
+CSV_HEADER = REPORT_COLUMNS
+
 class ReportService:
     def __init__(self, db_session: Session):
         self.db_session = db_session
-        self.expense_service = ExpenseService(db_session)
-        self.income_service = IncomeService(db_session)
 
-    def generate_csv_report(self, profile_id: int) -> io.BytesIO:
+    def _expense_rows(self, profile_id: int, start_date: datetime.datetime = None, end_date: datetime.datetime = None):
+        stmt = (
+            select(Expense.date, Expense.amount, Expense.description, func.coalesce(Category.name, "N/A"))
+            .select_from(Expense)
+            .outerjoin(Category, Expense.category_id == Category.id)
+            .where(Expense.profile_id == profile_id)
+        )
+        if start_date is not None:
+            stmt = stmt.where(Expense.date >= start_date)
+        if end_date is not None:
+            stmt = stmt.where(Expense.date < end_date)
+        return self.db_session.execute(stmt.order_by(Expense.date).execution_options(yield_per=EXPORT_YIELD_PER))
+
+    def _income_rows(self, profile_id: int, start_date: datetime.datetime = None, end_date: datetime.datetime = None):
+        stmt = select(Income.date, Income.amount, Income.source, literal("N/A")).where(Income.profile_id == profile_id)
+        if start_date is not None:
+            stmt = stmt.where(Income.date >= start_date)
+        if end_date is not None:
+            stmt = stmt.where(Income.date < end_date)
+        return self.db_session.execute(stmt.order_by(Income.date).execution_options(yield_per=EXPORT_YIELD_PER))
+
+    def iter_report_chunks(self, profile_id: int, start_date: datetime.datetime = None, end_date: datetime.datetime = None, kinds=("expense", "income")):
         """
-        Generates a CSV report of all expenses and income for a given profile.
-        Returns a BytesIO object containing the CSV data.
+        Yields the report in column-wise chunks of up to EXPORT_YIELD_PER rows:
+        {"Type": [...], "Date": [WAT datetimes], "Amount": [...], "Description/Source": [...], "Category": [...]}.
+        Date range (UTC, end exclusive) and kinds are applied in SQL.
         """
-        output = io.StringIO()
-        writer = csv.writer(output)
+        sources = []
+        if "expense" in kinds:
+            sources.append(("Expense", self._expense_rows(profile_id, start_date, end_date)))
+        if "income" in kinds:
+            sources.append(("Income", self._income_rows(profile_id, start_date, end_date)))
+
+        for kind, result in sources:
+            for partition in result.partitions():
+                dates, amounts, descriptions, categories = zip(*partition)
+                yield {
+                    "Type": [kind] * len(partition),
+                    "Date": [to_wat(date) for date in dates], # Convert to WAT for display
+                    "Amount": list(amounts),
+                    "Description/Source": list(descriptions),
+                    "Category": list(categories)
+                }
+
+    def count_report_rows(self, profile_id: int, start_date: datetime.datetime = None, end_date: datetime.datetime = None, kinds=("expense", "income")) -> int:
+        """Number of rows an export will contain; one indexed COUNT per kind, used for progress reporting."""
+        total = 0
+        for kind, model in (("expense", Expense), ("income", Income)):
+            if kind not in kinds:
+                continue
+            query = self.db_session.query(func.count(model.id)).filter(model.profile_id == profile_id)
+            if start_date is not None:
+                query = query.filter(model.date >= start_date)
+            if end_date is not None:
+                query = query.filter(model.date < end_date)
+            total += query.scalar()
+        return total
+
+    def _with_progress(self, chunks, progress_callback, total_rows: int):
+        """Reports (rows_written, total_rows) after the writer has consumed each chunk."""
+        rows_written = 0
+        for chunk in chunks:
+            yield chunk
+            rows_written += len(chunk["Type"])
+            progress_callback(rows_written, total_rows)
 
-        # Write header row
-        writer.writerow(["Type", "Date", "Amount", "Description/Source", "Category"])
+    def _write_csv(self, chunks, output) -> int:
+        text_output = io.TextIOWrapper(output, encoding="utf-8", newline="")
+        writer = csv.writer(text_output)
+        writer.writerow(REPORT_COLUMNS)
+        row_count = 0
+        for chunk in chunks:
+            formatted_dates = [date.strftime("%Y-%m-%d %H:%M:%S %Z%z") for date in chunk["Date"]]
+            writer.writerows(zip(chunk["Type"], formatted_dates, chunk["Amount"], chunk["Description/Source"], chunk["Category"]))
+            row_count += len(formatted_dates)
+        text_output.flush()
+        text_output.detach() # Hand the binary file back without closing it
+        return row_count
 
-        # Fetch expenses
-        expenses = self.expense_service.get_expenses_by_profile(profile_id)
-        for exp in expenses:
-            wat_date = to_wat(exp.date) # Convert to WAT for display
-            writer.writerow(["Expense", wat_date.strftime("%Y-%m-%d %H:%M:%S %Z%z"), exp.amount, exp.description, exp.category.name if exp.category else "N/A"])
+    def _write_parquet(self, chunks, output) -> int:
+        import pyarrow as pa # Optional dependency, only needed for Parquet exports
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ("Type", pa.string()),
+            ("Date", pa.timestamp("us", tz="Africa/Lagos")),
+            ("Amount", pa.float64()),
+            ("Description/Source", pa.string()),
+            ("Category", pa.string()),
+        ])
+        row_count = 0
+        with pq.ParquetWriter(output, schema, compression="zstd") as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+                row_count += len(chunk["Type"])
+        return row_count
+
+    def _write_xlsx(self, chunks, output) -> int:
+        import pandas as pd # openpyxl is required by pandas for .xlsx output
+
+        row_count = 0
+        with pd.ExcelWriter(output, engine="openpyxl") as writer:
+            # Excel has no timezone support, so dates are written as naive WAT wall-clock times
+            pd.DataFrame(columns=REPORT_COLUMNS).to_excel(writer, sheet_name="Transactions", index=False)
+            for chunk in chunks:
+                frame = pd.DataFrame(chunk, columns=REPORT_COLUMNS)
+                frame["Date"] = pd.to_datetime(frame["Date"].map(lambda date: date.replace(tzinfo=None)))
+                frame.to_excel(writer, sheet_name="Transactions", index=False, header=False, startrow=row_count + 1)
+                row_count += len(frame)
+        return row_count
+
+    def generate_report(self, profile_id: int, fmt: str = "csv", start_date: datetime.datetime = None, end_date: datetime.datetime = None, kinds=("expense", "income"), progress_callback=None):
+        """
+        Builds an export of a profile's transactions in the given format ("csv", "xlsx" or "parquet").
+        Rows are fetched in EXPORT_YIELD_PER chunks (category names joined in, no per-row queries)
+        and written column-wise into a SpooledTemporaryFile, which is returned positioned at the start.
+        The caller closes it. progress_callback(rows_written, total_rows) is called after every chunk.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
 
-        # Fetch income
-        incomes = self.income_service.get_incomes_by_profile(profile_id)
-        for inc in incomes:
-            wat_date = to_wat(inc.date) # Convert to WAT for display
-            writer.writerow(["Income", wat_date.strftime("%Y-%m-%d %H:%M:%S %Z%z"), inc.amount, inc.source, "N/A"]) # Income doesn't have categories
+        started = time.monotonic()
+        output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES, mode="w+b")
+        chunks = self.iter_report_chunks(profile_id, start_date, end_date, kinds)
+        if progress_callback is not None:
+            total_rows = self.count_report_rows(profile_id, start_date, end_date, kinds)
+            progress_callback(0, total_rows)
+            chunks = self._with_progress(chunks, progress_callback, total_rows)
+        writers = {"csv": self._write_csv, "xlsx": self._write_xlsx, "parquet": self._write_parquet}
+        try:
+            row_count = writers[fmt](chunks, output)
+        except Exception:
+            output.close()
+            raise
+        size = output.tell()
+        output.seek(0)
 
-        return io.BytesIO(output.getvalue().encode('utf-8'))
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(f"{fmt.upper()} export for profile {profile_id}: {row_count} rows, {size:,} bytes in {elapsed:.2f}s ({row_count / elapsed:,.0f} rows/s).")
+        return output
 
+def generate_report_file(profile_id: int, fmt: str = "csv", start_date: datetime.datetime = None, end_date: datetime.datetime = None, kinds=("expense", "income"), progress_callback=None):
+    """Builds an export on its own session. Meant to run in a worker thread via asyncio.to_thread."""
+    db_session = SessionLocal()
+    try:
+        return ReportService(db_session).generate_report(profile_id, fmt, start_date, end_date, kinds, progress_callback)
+    finally:
+        db_session.close()
@@ -1,5 +1,7 @@
 from sqlalchemy.orm import Session
 from models import User, Payment # Import Payment model
+from services.identity_service import invalidate_identity
+from services.cache_generations import bump_cache_generations, IDENTITY_CACHE
 import datetime
 from dateutil.relativedelta import relativedelta # Import relativedelta
 import zoneinfo
@@ -54,6 +56,7 @@ class SubscriptionService:
                 user.trial_end_date = None
                 self.db_session.add(user)
                 self.db_session.commit()
+                invalidate_identity(user_telegram_id)
                 return {
                     "plan": "Free",
                     "expires_at": None,
@@ -75,6 +78,7 @@ class SubscriptionService:
                 user.subscription_end_date = None
                 self.db_session.add(user)
                 self.db_session.commit()
+                invalidate_identity(user_telegram_id)
                 return {
                     "plan": "Free",
                     "expires_at": None,
@@ -214,8 +218,10 @@ class SubscriptionService:
             user.trial_end_date = None
 
             self.db_session.add(user)
+            bump_cache_generations(self.db_session, IDENTITY_CACHE) # The payment callback may not run in the process serving this user
             self.db_session.commit()
             self.db_session.refresh(user)
+            invalidate_identity(user.telegram_id)
 
             if user.referred_by_info:
                 from services import ReferralService
@@ -295,5 +301,9 @@ class SubscriptionService:
             downgraded_user_ids.append(user.telegram_id)
             logger.info(f"User {user.telegram_id} (paid) downgraded to Free.")
         
+        if downgraded_user_ids:
+            bump_cache_generations(self.db_session, IDENTITY_CACHE) # Other processes may still hold these users as Pro
         self.db_session.commit()
+        for telegram_id in downgraded_user_ids:
+            invalidate_identity(telegram_id)
         return downgraded_user_ids
\ No newline at end of file
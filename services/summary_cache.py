@@ -0,0 +1,87 @@
+import os
+import asyncio
+import logging
+from models import SessionLocal
+from utils.cache import TTLCache
+from utils.datetime_utils import wat_day_bounds_utc, wat_week_bounds_utc, wat_month_bounds_utc
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "2000")) # Summaries kept per process
+SUMMARY_CACHE_TTL_SECONDS = int(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "300")) # Writes invalidate explicitly; this bounds anything missed
+SUMMARY_GENERATIONS_PER_ENTRY = 10 # Profiles with a generation kept per cached summary before the cache starts over
+
+# period -> (function returning the current (start_utc, end_utc), SummaryService method name)
+SUMMARY_PERIODS = {
+    "daily": (wat_day_bounds_utc, "get_daily_summary"),
+    "weekly": (wat_week_bounds_utc, "get_weekly_summary"),
+    "monthly": (wat_month_bounds_utc, "get_monthly_summary"),
+}
+
+def compute_summary(profile_id: int, period: str) -> dict:
+    """Builds a summary on its own session. Meant to run in a worker thread via asyncio.to_thread."""
+    from services.summary_service import SummaryService # Local import; summary_service imports the write paths that invalidate this cache
+    db_session = SessionLocal()
+    try:
+        return getattr(SummaryService(db_session), SUMMARY_PERIODS[period][1])(profile_id)
+    finally:
+        db_session.close()
+
+class SummaryCache:
+    """
+    Caches summary results keyed by (profile_id, period bounds). Writes to a profile bump its
+    generation, which retires all of its cached summaries at once. Concurrent requests for the same
+    summary share one computation (single flight), so a double tap computes it once.
+    """
+    def __init__(self, maxsize: int = SUMMARY_CACHE_SIZE, ttl: float = SUMMARY_CACHE_TTL_SECONDS):
+        self._results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.max_generations = maxsize * SUMMARY_GENERATIONS_PER_ENTRY
+        self._generations = {} # profile_id -> int, bumped on every write
+        self._inflight = {} # key -> asyncio.Future of the running computation
+        self._epoch = 0 # Bumped by clear(), so computations already running are not cached
+        self.coalesced = 0
+
+    def _key(self, profile_id: int, period: str):
+        start_utc, end_utc = SUMMARY_PERIODS[period][0]()
+        return (profile_id, self._generations.get(profile_id, 0), self._epoch, period, start_utc.isoformat(), end_utc.isoformat())
+
+    def invalidate(self, profile_id: int):
+        """Call after any write that changes a profile's expenses, incomes or budgets."""
+        self._generations[profile_id] = self._generations.get(profile_id, 0) + 1
+        if len(self._generations) > self.max_generations:
+            self.clear() # Generations can only be forgotten together with every summary keyed by them
+
+    def clear(self):
+        """Drops every cached summary, e.g. after another process wrote data these summaries include."""
+        self._epoch += 1
+        self._results.clear()
+        self._generations.clear() # Safe once the epoch moved: no remaining key can match a reset generation
+
+    async def get_summary(self, profile_id: int, period: str) -> dict:
+        """Returns the cached summary or computes it on a worker thread, sharing any computation already running."""
+        key = self._key(profile_id, period)
+        summary = self._results.get(key)
+        if summary is not None:
+            return summary
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        inflight = asyncio.ensure_future(asyncio.to_thread(compute_summary, profile_id, period))
+        self._inflight[key] = inflight
+        try:
+            summary = await asyncio.shield(inflight)
+        finally:
+            self._inflight.pop(key, None)
+        if self._generations.get(profile_id, 0) == key[1] and self._epoch == key[2]: # Skip caching if a write landed while computing
+            self._results.set(key, summary)
+        return summary
+
+    def get_stats(self) -> dict:
+        stats = self._results.get_stats()
+        stats.update({"coalesced": self.coalesced, "inflight": len(self._inflight)})
+        return stats
+
+summary_cache = SummaryCache()
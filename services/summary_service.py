@@ -1,10 +1,26 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, cast, Integer, and_
 from models import Expense, Income, Category, User
-from datetime import datetime, timedelta # Keep datetime, timedelta for general use
+from datetime import datetime, timedelta, timezone # Keep datetime, timedelta for general use
 import random # For randomized delays
+import numpy as np
 from services.budget_service import BudgetService # Absolute import
-from utils.datetime_utils import wat_day_bounds_utc, wat_week_bounds_utc, wat_month_bounds_utc, to_wat # Import the new utilities
+from services.category_cache import category_cache
+from services.history_cache import history_cache, NO_CATEGORY
+from utils.datetime_utils import wat_day_bounds_utc, wat_week_bounds_utc, wat_month_bounds_utc, to_wat, WAT # Import the new utilities
+
+TREND_DAYS = 30 # Days covered by the spending trend in weekly and monthly summaries
+COMPARISON_PERIODS = {"weekly": wat_week_bounds_utc, "monthly": wat_month_bounds_utc}
+
+def wat_day_expression(bind):
+    """SQL expression for the WAT calendar day of Expense.date."""
+    if bind.dialect.name == "sqlite":
+        return func.date(Expense.date, "+1 hours") # SQLite stand-in; WAT is UTC+1 all year
+    return func.date_trunc("day", func.timezone(str(WAT), Expense.date))
+
+def as_date(value):
+    """A day value from wat_day_expression as a date (SQLite returns 'YYYY-MM-DD', Postgres a timestamp)."""
+    return datetime.fromisoformat(value).date() if isinstance(value, str) else value.date()
 
 class SummaryService:
     def __init__(self, db_session: Session):
@@ -35,28 +51,42 @@ class SummaryService:
                     insights.append(f"🟢 Excellent! You are ₦{remaining_amount:,.2f} ({100 - percentage_spent:.0f}%) under your {category_name} budget this {period}.")
         return insights
 
-    def get_daily_summary(self, profile_id: int):
-        start_of_day_utc, end_of_day_utc = wat_day_bounds_utc()
+    def get_range_totals(self, profile_id: int, start_utc: datetime, end_utc: datetime) -> dict:
+        """
+        Expense and income totals and expenses per category for [start_utc, end_utc). Answered from the
+        in-memory history cache when it is enabled, otherwise with SQL aggregates.
+        """
+        history = history_cache.get(self.db_session, profile_id)
+        if history is not None:
+            totals = history.totals(start_utc, end_utc)
+            names = {category.id: category.name for category in category_cache.get_categories(self.db_session, profile_id)}
+            by_category = totals.pop("expenses_by_category_id")
+            category_data = [
+                {"category": names.get(category_id, "Uncategorized"), "amount": amount}
+                for category_id, amount in by_category.items() if category_id != NO_CATEGORY
+            ]
+            if by_category.get(NO_CATEGORY, 0) > 0:
+                category_data.append({"category": "Uncategorized", "amount": by_category[NO_CATEGORY]})
+            totals["expenses_by_category"] = category_data
+            return totals
 
         total_expenses = self.db_session.query(func.sum(Expense.amount)).filter(
             Expense.profile_id == profile_id,
-            Expense.date >= start_of_day_utc,
-            Expense.date < end_of_day_utc # Use < for exclusive end
+            Expense.date >= start_utc,
+            Expense.date < end_utc # Use < for exclusive end
         ).scalar() or 0
 
         num_expense_entries = self.db_session.query(Expense).filter(
             Expense.profile_id == profile_id,
-            Expense.date >= start_of_day_utc,
-            Expense.date < end_of_day_utc
+            Expense.date >= start_utc,
+            Expense.date < end_utc
         ).count()
 
         total_income = self.db_session.query(func.sum(Income.amount)).filter(
             Income.profile_id == profile_id,
-            Income.date >= start_of_day_utc,
-            Income.date < end_of_day_utc
+            Income.date >= start_utc,
+            Income.date < end_utc
         ).scalar() or 0
-        
-        balance = total_income - total_expenses
 
         # Get expenses by category for charts
         expenses_by_category_query = self.db_session.query(
@@ -66,8 +96,8 @@ class SummaryService:
             Category, Expense.category_id == Category.id
         ).filter(
             Expense.profile_id == profile_id,
-            Expense.date >= start_of_day_utc,
-            Expense.date < end_of_day_utc
+            Expense.date >= start_utc,
+            Expense.date < end_utc
         ).group_by(Category.name).all()
 
         # Format for charts
@@ -78,153 +108,194 @@ class SummaryService:
             func.sum(Expense.amount)
         ).filter(
             Expense.profile_id == profile_id,
-            Expense.date >= start_of_day_utc,
-            Expense.date < end_of_day_utc,
+            Expense.date >= start_utc,
+            Expense.date < end_utc,
             Expense.category_id == None
         ).scalar() or 0
 
         if uncategorized_expenses > 0:
             category_data.append({"category": "Uncategorized", "amount": uncategorized_expenses})
 
-        detailed_budget_statuses = self.budget_service.get_budget_status(profile_id, start_of_day_utc, end_of_day_utc, "daily")
-        budget_insights = self._generate_budget_insight_messages(detailed_budget_statuses, "day")
-
         return {
             "total_expenses": total_expenses,
             "num_expense_entries": num_expense_entries,
             "total_income": total_income,
-            "balance": balance,
-            "budget_insights": budget_insights,
             "expenses_by_category": category_data,
-            "detailed_budget_statuses": detailed_budget_statuses # New structured budget data
         }
 
-    def get_weekly_summary(self, profile_id: int):
-        start_of_week_utc, end_of_week_utc = wat_week_bounds_utc()
+    def get_daily_series(self, profile_id: int, days: int = TREND_DAYS):
+        """
+        Expense totals for each of the last `days` WAT days, oldest first and including today, as
+        (dates, amounts) where amounts is a dense NumPy array with zeros for days without expenses.
+        Costs one grouped query (or none with the history cache) whatever the window length.
+        """
+        _, end_utc = wat_day_bounds_utc()
+        start_utc = end_utc - timedelta(days=days)
+        first_day = to_wat(start_utc).date()
+        dates = [first_day + timedelta(days=offset) for offset in range(days)]
 
-        total_expenses = self.db_session.query(func.sum(Expense.amount)).filter(
-            Expense.profile_id == profile_id,
-            Expense.date >= start_of_week_utc,
-            Expense.date < end_of_week_utc
-        ).scalar() or 0
+        history = history_cache.get(self.db_session, profile_id)
+        if history is not None:
+            return dates, history.daily_expenses(start_utc, days)
 
-        num_expense_entries = self.db_session.query(Expense).filter(
+        day = wat_day_expression(self.db_session.get_bind()).label("day")
+        rows = self.db_session.query(day, func.sum(Expense.amount)).filter(
             Expense.profile_id == profile_id,
-            Expense.date >= start_of_week_utc,
-            Expense.date < end_of_week_utc
-        ).count()
+            Expense.date >= start_utc,
+            Expense.date < end_utc
+        ).group_by(day).all()
 
-        total_income = self.db_session.query(func.sum(Income.amount)).filter(
-            Income.profile_id == profile_id,
-            Income.date >= start_of_week_utc,
-            Income.date < end_of_week_utc
-        ).scalar() or 0
-        
-        balance = total_income - total_expenses
+        amounts = np.zeros(days, dtype=np.float64)
+        if rows:
+            offsets = np.fromiter(
+                ((as_date(value) - first_day).days for value, _ in rows),
+                dtype=np.int64, count=len(rows)
+            )
+            totals = np.fromiter((total or 0 for _, total in rows), dtype=np.float64, count=len(rows))
+            in_window = (offsets >= 0) & (offsets < days)
+            amounts[offsets[in_window]] = totals[in_window]
+        return dates, amounts
 
-        # Get expenses by category for charts
-        expenses_by_category_query = self.db_session.query(
-            Category.name,
-            func.sum(Expense.amount)
-        ).join(
-            Category, Expense.category_id == Category.id
-        ).filter(
-            Expense.profile_id == profile_id,
-            Expense.date >= start_of_week_utc,
-            Expense.date < end_of_week_utc
-        ).group_by(Category.name).all()
+    def _wat_weekday_hour(self):
+        """SQL expressions for the ISO weekday (1 = Monday) and hour of Expense.date in WAT."""
+        if self.db_session.get_bind().dialect.name == "sqlite":
+            weekday = (cast(func.strftime("%w", Expense.date, "+1 hours"), Integer) + 6) % 7 + 1 # %w counts from Sunday = 0
+            return weekday, cast(func.strftime("%H", Expense.date, "+1 hours"), Integer)
+        local_date = func.timezone(str(WAT), Expense.date)
+        return func.extract("isodow", local_date), func.extract("hour", local_date)
 
-        # Format for charts
-        category_data = [{"category": name, "amount": amount} for name, amount in expenses_by_category_query]
+    def get_weekday_hour_grid(self, profile_id: int, days: int = None):
+        """
+        7x24 array of expense totals by WAT weekday (row 0 = Monday) and hour, over the last `days` days
+        or all history. The database aggregates to at most 168 rows, so cost barely grows with history.
+        """
+        weekday, hour = self._wat_weekday_hour()
+        weekday, hour = weekday.label("weekday"), hour.label("hour")
+        query = self.db_session.query(weekday, hour, func.sum(Expense.amount)).filter(Expense.profile_id == profile_id)
+        if days is not None:
+            _, end_utc = wat_day_bounds_utc()
+            query = query.filter(Expense.date >= end_utc - timedelta(days=days))
+        rows = query.group_by(weekday, hour).all()
 
-        # Also get uncategorized expenses
-        uncategorized_expenses = self.db_session.query(
-            func.sum(Expense.amount)
+        grid = np.zeros((7, 24), dtype=np.float64)
+        if rows:
+            cells = np.array(rows, dtype=np.float64) # At most 168 (weekday, hour, total) rows; extract() returns numerics
+            grid[cells[:, 0].astype(np.int64) - 1, cells[:, 1].astype(np.int64)] = cells[:, 2]
+        return grid
+
+    def get_period_comparison(self, profile_id: int, period: str, now: datetime = None) -> dict:
+        """
+        This week or month so far against the same stretch of the previous one, in total and per
+        category. Both windows come from one grouped query with SUM(...) FILTER (WHERE ...) per window.
+        """
+        now = now or datetime.now(timezone.utc)
+        current_start, _ = COMPARISON_PERIODS[period](now)
+        previous_start, previous_end = COMPARISON_PERIODS[period](current_start - timedelta(seconds=1))
+        previous_cutoff = min(previous_start + (now - current_start), previous_end) # Same elapsed time into the previous period
+
+        in_current = and_(Expense.date >= current_start, Expense.date < now)
+        in_previous = and_(Expense.date >= previous_start, Expense.date < previous_cutoff)
+        rows = self.db_session.query(
+            Expense.category_id,
+            func.sum(Expense.amount).filter(in_current),
+            func.sum(Expense.amount).filter(in_previous)
         ).filter(
             Expense.profile_id == profile_id,
-            Expense.date >= start_of_week_utc,
-            Expense.date < end_of_week_utc,
-            Expense.category_id == None
-        ).scalar() or 0
+            Expense.date >= previous_start,
+            Expense.date < now
+        ).group_by(Expense.category_id).all()
+
+        names = {category.id: category.name for category in category_cache.get_categories(self.db_session, profile_id)}
+        categories = [
+            {
+                "category": names.get(category_id, "Uncategorized"),
+                "current": current or 0,
+                "previous": previous or 0,
+                "delta": (current or 0) - (previous or 0)
+            }
+            for category_id, current, previous in rows
+        ]
+        categories.sort(key=lambda item: abs(item["delta"]), reverse=True)
+        current_total = sum(item["current"] for item in categories)
+        previous_total = sum(item["previous"] for item in categories)
+        return {
+            "current_total": current_total,
+            "previous_total": previous_total,
+            "delta": current_total - previous_total,
+            "percent_change": (current_total - previous_total) / previous_total * 100 if previous_total else None,
+            "categories": categories # Largest movers first
+        }
+
+    def _unseen_insights(self, profile_id: int) -> list:
+        from services.insight_service import InsightService # Local import; insight_service imports this module
+        return InsightService(self.db_session).get_unseen(profile_id)
+
+    def get_daily_summary(self, profile_id: int):
+        start_of_day_utc, end_of_day_utc = wat_day_bounds_utc()
+        totals = self.get_range_totals(profile_id, start_of_day_utc, end_of_day_utc)
+        total_expenses = totals["total_expenses"]
+        balance = totals["total_income"] - total_expenses
+
+        detailed_budget_statuses = self.budget_service.get_budget_status(profile_id, start_of_day_utc, end_of_day_utc, "daily")
+        budget_insights = self._generate_budget_insight_messages(detailed_budget_statuses, "day")
+
+        return {
+            "total_expenses": total_expenses,
+            "num_expense_entries": totals["num_expense_entries"],
+            "total_income": totals["total_income"],
+            "balance": balance,
+            "budget_insights": budget_insights,
+            "expenses_by_category": totals["expenses_by_category"],
+            "detailed_budget_statuses": detailed_budget_statuses, # New structured budget data
+            "anomalies": self._unseen_insights(profile_id) # Flagged by the nightly job, not yet shown
+        }
+
+    def get_weekly_summary(self, profile_id: int):
+        start_of_week_utc, end_of_week_utc = wat_week_bounds_utc()
+        totals = self.get_range_totals(profile_id, start_of_week_utc, end_of_week_utc)
+        total_expenses = totals["total_expenses"]
+        balance = totals["total_income"] - total_expenses
 
-        if uncategorized_expenses > 0:
-            category_data.append({"category": "Uncategorized", "amount": uncategorized_expenses})
-        
         detailed_budget_statuses = self.budget_service.get_budget_status(profile_id, start_of_week_utc, end_of_week_utc, "weekly")
         budget_insights = self._generate_budget_insight_messages(detailed_budget_statuses, "week")
+        trend_dates, trend_amounts = self.get_daily_series(profile_id)
+        comparison = self.get_period_comparison(profile_id, "weekly")
 
         return {
             "total_expenses": total_expenses,
-            "num_expense_entries": num_expense_entries,
-            "total_income": total_income,
+            "num_expense_entries": totals["num_expense_entries"],
+            "total_income": totals["total_income"],
             "balance": balance,
             "budget_insights": budget_insights,
-            "expenses_by_category": category_data,
-            "detailed_budget_statuses": detailed_budget_statuses # New structured budget data
+            "expenses_by_category": totals["expenses_by_category"],
+            "detailed_budget_statuses": detailed_budget_statuses, # New structured budget data
+            "daily_series": {"dates": trend_dates, "amounts": trend_amounts}, # Last TREND_DAYS days, for the trend chart
+            "comparison": comparison, # Against the same point in the previous period
+            "anomalies": self._unseen_insights(profile_id) # Flagged by the nightly job, not yet shown
         }
 
     def get_monthly_summary(self, profile_id: int):
         start_of_month_utc, end_of_month_utc = wat_month_bounds_utc()
-        
-        total_expenses = self.db_session.query(func.sum(Expense.amount)).filter(
-            Expense.profile_id == profile_id,
-            Expense.date >= start_of_month_utc,
-            Expense.date < end_of_month_utc
-        ).scalar() or 0
-
-        num_expense_entries = self.db_session.query(Expense).filter(
-            Expense.profile_id == profile_id,
-            Expense.date >= start_of_month_utc,
-            Expense.date < end_of_month_utc
-        ).count()
+        totals = self.get_range_totals(profile_id, start_of_month_utc, end_of_month_utc)
+        total_expenses = totals["total_expenses"]
+        balance = totals["total_income"] - total_expenses
 
-        total_income = self.db_session.query(func.sum(Income.amount)).filter(
-            Income.profile_id == profile_id,
-            Income.date >= start_of_month_utc,
-            Income.date < end_of_month_utc
-        ).scalar() or 0
-        
-        balance = total_income - total_expenses
-
-        # Get expenses by category for charts
-        expenses_by_category_query = self.db_session.query(
-            Category.name,
-            func.sum(Expense.amount)
-        ).join(
-            Category, Expense.category_id == Category.id
-        ).filter(
-            Expense.profile_id == profile_id,
-            Expense.date >= start_of_month_utc,
-            Expense.date < end_of_month_utc
-        ).group_by(Category.name).all()
-
-        # Format for charts
-        category_data = [{"category": name, "amount": amount} for name, amount in expenses_by_category_query]
-
-        # Also get uncategorized expenses
-        uncategorized_expenses = self.db_session.query(
-            func.sum(Expense.amount)
-        ).filter(
-            Expense.profile_id == profile_id,
-            Expense.date >= start_of_month_utc,
-            Expense.date < end_of_month_utc,
-            Expense.category_id == None
-        ).scalar() or 0
-
-        if uncategorized_expenses > 0:
-            category_data.append({"category": "Uncategorized", "amount": uncategorized_expenses})
-        
         detailed_budget_statuses = self.budget_service.get_budget_status(profile_id, start_of_month_utc, end_of_month_utc, "monthly")
         budget_insights = self._generate_budget_insight_messages(detailed_budget_statuses, "month")
+        trend_dates, trend_amounts = self.get_daily_series(profile_id)
+        comparison = self.get_period_comparison(profile_id, "monthly")
 
         return {
             "total_expenses": total_expenses,
-            "num_expense_entries": num_expense_entries,
-            "total_income": total_income,
+            "num_expense_entries": totals["num_expense_entries"],
+            "total_income": totals["total_income"],
             "balance": balance,
             "budget_insights": budget_insights,
-            "expenses_by_category": category_data,
-            "detailed_budget_statuses": detailed_budget_statuses # New structured budget data
+            "expenses_by_category": totals["expenses_by_category"],
+            "detailed_budget_statuses": detailed_budget_statuses, # New structured budget data
+            "daily_series": {"dates": trend_dates, "amounts": trend_amounts}, # Last TREND_DAYS days, for the trend chart
+            "comparison": comparison, # Against the same point in the previous period
+            "anomalies": self._unseen_insights(profile_id) # Flagged by the nightly job, not yet shown
         }
 
     def get_all_users_for_scheduled_summaries(self):
@@ -0,0 +1,126 @@
+import datetime
+from datetime import timezone
+from sqlalchemy import select, union_all, literal, func, tuple_
+from sqlalchemy.orm import Session
+from models import Expense, Income, Category
+
+HISTORY_PAGE_SIZE = 5
+
+def history_cursor(row: dict) -> list:
+    """Serializable keyset position of a history row: [date ISO string, type, id]."""
+    return [row["date"].isoformat(), row["type"], row["id"]]
+
+def _like_pattern(text: str) -> str:
+    """Substring pattern for ILIKE with the user's own wildcards escaped. Served by the trigram indexes on Postgres."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+class TransactionHistoryService:
+    """
+    Serves a profile's combined expense and income history newest first, one page at a time.
+    Rows are ordered by (date, type, id) and paged with keyset cursors, so each page costs the
+    same no matter how much history the profile has.
+    """
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def _keyset_filter(self, date_col, id_col, kind: str, cursor: list, older: bool):
+        """Rows of one branch (whose type is the constant `kind`) that sort before/after the cursor."""
+        cursor_date, cursor_kind, cursor_id = datetime.datetime.fromisoformat(cursor[0]), cursor[1], cursor[2]
+        if kind == cursor_kind:
+            return tuple_(date_col, id_col) < (cursor_date, cursor_id) if older else tuple_(date_col, id_col) > (cursor_date, cursor_id)
+        if older:
+            return date_col <= cursor_date if kind < cursor_kind else date_col < cursor_date
+        return date_col >= cursor_date if kind > cursor_kind else date_col > cursor_date
+
+    def _branch(self, stmt, date_col, id_col, kind: str, cursor: list, older: bool, limit: int):
+        if cursor is not None:
+            stmt = stmt.where(self._keyset_filter(date_col, id_col, kind, cursor, older))
+        if older:
+            stmt = stmt.order_by(date_col.desc(), id_col.desc())
+        else:
+            stmt = stmt.order_by(date_col.asc(), id_col.asc())
+        # Wrapped so each branch keeps its own ORDER BY/LIMIT inside the UNION ALL
+        return select(stmt.limit(limit).subquery())
+
+    def _apply_common_filters(self, stmt, model, filters: dict):
+        if filters.get("min_amount") is not None:
+            stmt = stmt.where(model.amount >= filters["min_amount"])
+        if filters.get("max_amount") is not None:
+            stmt = stmt.where(model.amount <= filters["max_amount"])
+        if filters.get("start_date"):
+            stmt = stmt.where(model.date >= datetime.datetime.fromisoformat(filters["start_date"]))
+        if filters.get("end_date"):
+            stmt = stmt.where(model.date < datetime.datetime.fromisoformat(filters["end_date"]))
+        return stmt
+
+    def get_page(self, profile_id: int, cursor: list = None, older: bool = True, page_size: int = HISTORY_PAGE_SIZE, filters: dict = None):
+        """
+        Returns (rows, has_more) for the page after (older=True) or before (older=False) the cursor.
+        With no cursor the newest page is returned. Rows are always newest first.
+
+        filters (all optional, JSON-friendly so they can be kept between pages):
+            text: substring of the expense description / income source
+            category: expense category name (excludes incomes)
+            type: "expense" or "income"
+            min_amount, max_amount: inclusive amount range
+            start_date, end_date: ISO UTC datetimes, end exclusive
+        """
+        filters = filters or {}
+        limit = page_size + 1 # One extra row tells us whether another page exists
+        kind = filters.get("type")
+        branches = []
+
+        if kind in (None, "expense"):
+            expenses = select(
+                literal("Expense").label("type"),
+                Expense.id.label("id"),
+                Expense.date.label("date"),
+                Expense.amount.label("amount"),
+                Expense.description.label("description"),
+                func.coalesce(Category.name, "N/A").label("category")
+            ).select_from(Expense).outerjoin(Category, Expense.category_id == Category.id).where(Expense.profile_id == profile_id)
+            if filters.get("text"):
+                expenses = expenses.where(Expense.description.ilike(_like_pattern(filters["text"]), escape="\\"))
+            if filters.get("category"):
+                expenses = expenses.where(func.lower(Category.name) == filters["category"].lower())
+            expenses = self._apply_common_filters(expenses, Expense, filters)
+            branches.append(self._branch(expenses, Expense.date, Expense.id, "Expense", cursor, older, limit))
+
+        if kind in (None, "income") and not filters.get("category"):
+            incomes = select(
+                literal("Income").label("type"),
+                Income.id.label("id"),
+                Income.date.label("date"),
+                Income.amount.label("amount"),
+                Income.source.label("description"),
+                literal("N/A").label("category")
+            ).where(Income.profile_id == profile_id)
+            if filters.get("text"):
+                incomes = incomes.where(Income.source.ilike(_like_pattern(filters["text"]), escape="\\"))
+            incomes = self._apply_common_filters(incomes, Income, filters)
+            branches.append(self._branch(incomes, Income.date, Income.id, "Income", cursor, older, limit))
+
+        if not branches:
+            return [], False
+        history = (union_all(*branches) if len(branches) > 1 else branches[0]).subquery("history")
+
+        if older:
+            order = (history.c.date.desc(), history.c.type.desc(), history.c.id.desc())
+        else:
+            order = (history.c.date.asc(), history.c.type.asc(), history.c.id.asc())
+        result = self.db_session.execute(select(history).order_by(*order).limit(limit)).mappings().all()
+
+        rows = []
+        for row in result[:page_size]:
+            row = dict(row)
+            if row["date"] is not None and row["date"].tzinfo is None:
+                row["date"] = row["date"].replace(tzinfo=timezone.utc) # Assume naive is UTC
+            rows.append(row)
+        if not older:
+            rows.reverse()
+        return rows, len(result) > page_size
+
+    def search(self, profile_id: int, filters: dict, cursor: list = None, older: bool = True, page_size: int = HISTORY_PAGE_SIZE):
+        """Filtered history; see get_page for the supported filters."""
+        return self.get_page(profile_id, cursor=cursor, older=older, page_size=page_size, filters=filters)
@@ -0,0 +1,130 @@
+import os
+import logging
+import datetime
+import threading
+from collections import deque
+from datetime import timezone
+from sqlalchemy import delete
+from models import SessionLocal, ProcessedUpdate, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+DEDUP_RING_SIZE = int(os.getenv("UPDATE_DEDUP_RING_SIZE", "10000"))
+DEDUP_SHARED_TABLE_ENABLED = os.getenv("UPDATE_DEDUP_SHARED_TABLE", "false").lower() == "true"
+DEDUP_RETENTION_HOURS = 24 # Telegram stops redelivering long before this
+
+class UpdateDeduplicator:
+    """
+    Drops Telegram updates whose update_id was already processed.
+    Keeps a fixed-size ring of recent ids in memory and, for multi-process deployments,
+    optionally records each id in the shared processed_updates table.
+    An id is only recorded once its update was processed, so an update that fails can be
+    delivered again; while it is in flight, copies arriving in this process are dropped.
+    """
+    def __init__(self, ring_size: int = DEDUP_RING_SIZE, use_shared_table: bool = DEDUP_SHARED_TABLE_ENABLED):
+        self.use_shared_table = use_shared_table
+        self._ring = deque(maxlen=ring_size)
+        self._seen = set()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.duplicates_dropped = 0
+        self.shared_table_hits = 0
+
+    def _remember(self, update_id: int):
+        """Adds update_id to the ring."""
+        with self._lock:
+            if update_id in self._seen:
+                return
+            if len(self._ring) == self._ring.maxlen:
+                self._seen.discard(self._ring[0])
+            self._ring.append(update_id)
+            self._seen.add(update_id)
+
+    def _in_shared_table(self, update_id: int) -> bool:
+        db_session = SessionLocal()
+        try:
+            return db_session.query(ProcessedUpdate.update_id).filter(ProcessedUpdate.update_id == update_id).first() is not None
+        finally:
+            db_session.close()
+
+    def _record_in_shared_table(self, update_id: int):
+        db_session = SessionLocal()
+        try:
+            db_session.execute(
+                dialect_insert(ProcessedUpdate, db_session.get_bind())
+                .values(update_id=update_id, processed_at=datetime.datetime.now(timezone.utc))
+                .on_conflict_do_nothing(index_elements=["update_id"])
+            )
+            db_session.commit()
+        finally:
+            db_session.close()
+
+    def begin(self, update_id: int) -> bool:
+        """
+        Marks update_id as in flight. Returns False (and counts the drop) if it was already processed
+        or is being processed in this process. Pair every True with mark_processed or release.
+        Blocks on the database when the shared table is on; call it from a worker thread.
+        """
+        with self._lock:
+            duplicate = update_id in self._seen or update_id in self._in_flight
+            if not duplicate:
+                self._in_flight.add(update_id)
+        if duplicate:
+            self.record_duplicate(update_id)
+            return False
+        if self.use_shared_table:
+            try:
+                if self._in_shared_table(update_id):
+                    self.shared_table_hits += 1
+                    self._remember(update_id)
+                    self.release(update_id)
+                    self.record_duplicate(update_id)
+                    return False
+            except Exception as e:
+                # Never drop an update because the dedup table is unavailable
+                logger.error(f"Shared dedup check failed for update {update_id}: {e}")
+        return True
+
+    def mark_processed(self, update_id: int):
+        """Records a successfully processed update. Blocks on the database when the shared table is on."""
+        self._remember(update_id)
+        self.release(update_id)
+        if self.use_shared_table:
+            try:
+                self._record_in_shared_table(update_id)
+            except Exception as e:
+                logger.error(f"Failed to record update {update_id} in the shared dedup table: {e}")
+
+    def release(self, update_id: int):
+        """Forgets an in-flight update that was not processed, so a redelivery runs it."""
+        with self._lock:
+            self._in_flight.discard(update_id)
+
+    def record_duplicate(self, update_id: int):
+        with self._lock:
+            self.duplicates_dropped += 1
+        logger.info(f"Dropped duplicate update {update_id} (total dropped: {self.duplicates_dropped}).")
+
+    def purge_shared_table(self, older_than_hours: int = DEDUP_RETENTION_HOURS) -> int:
+        if not self.use_shared_table:
+            return 0
+        cutoff = datetime.datetime.now(timezone.utc) - datetime.timedelta(hours=older_than_hours)
+        db_session = SessionLocal()
+        try:
+            purged = db_session.execute(delete(ProcessedUpdate).where(ProcessedUpdate.processed_at < cutoff)).rowcount
+            db_session.commit()
+            return purged
+        finally:
+            db_session.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "duplicates_dropped": self.duplicates_dropped,
+            "shared_table_hits": self.shared_table_hits,
+            "ring_size": len(self._ring),
+            "in_flight": len(self._in_flight),
+            "shared_table_enabled": self.use_shared_table,
+        }
+
+# Process-wide instance used in front of ptb_application.process_update
+update_deduplicator = UpdateDeduplicator()
@@ -0,0 +1,211 @@
+import json
+import logging
+import datetime
+from datetime import timezone
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import update, delete, exists, or_, and_, func
+from models import QueuedUpdate, PartitionLease, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+CLAIM_BATCH_SIZE = 50
+MAX_UPDATE_ATTEMPTS = 3
+VISIBILITY_TIMEOUT_SECONDS = 300 # Claimed updates not finished within this window are handed out again
+PARTITION_LEASE_SECONDS = 30 # A partition whose worker stops renewing its lease is handed out again after this long
+
+def extract_chat_id(update_json: dict):
+    """Returns the chat (or user) id an update belongs to, used to keep per-chat ordering."""
+    for key in ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member", "chat_member", "chat_join_request"):
+        payload = update_json.get(key)
+        if payload and payload.get("chat"):
+            return payload["chat"]["id"]
+    callback_query = update_json.get("callback_query")
+    if callback_query:
+        if callback_query.get("message") and callback_query["message"].get("chat"):
+            return callback_query["message"]["chat"]["id"]
+        return callback_query["from"]["id"]
+    for payload in update_json.values():
+        if isinstance(payload, dict) and payload.get("from"):
+            return payload["from"]["id"]
+    return None
+
+class UpdateQueueService:
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def enqueue(self, update_json: dict) -> bool:
+        """
+        Appends a raw Telegram update to the durable queue.
+        Returns False if an update with the same update_id is already queued.
+        """
+        stmt = dialect_insert(QueuedUpdate, self.db_session.get_bind()).values(
+            update_id=update_json["update_id"],
+            chat_id=extract_chat_id(update_json),
+            payload=json.dumps(update_json),
+            status="pending",
+            attempts=0,
+            created_at=datetime.datetime.now(timezone.utc)
+        ).on_conflict_do_nothing(index_elements=["update_id"])
+        result = self.db_session.execute(stmt)
+        self.db_session.commit()
+        return result.rowcount == 1
+
+    def claim_batch(self, worker_id: str, batch_size: int = CLAIM_BATCH_SIZE, partition: tuple[int, int] = None) -> list[tuple[int, dict]]:
+        """
+        Claims up to batch_size pending updates for a worker.
+        Only the oldest unfinished update of each chat is eligible, so a batch never holds two
+        updates for the same chat and per-chat order is preserved across workers.
+        partition=(index, count) restricts the worker to chats where abs(chat_id) % count == index,
+        which keeps each chat's conversation state in one process. Hold the partition's lease
+        (acquire_partition) while claiming from it.
+        Uses FOR UPDATE SKIP LOCKED on Postgres; the conditional UPDATE keeps SQLite safe too.
+        """
+        earlier = aliased(QueuedUpdate)
+        has_earlier_unfinished = exists().where(
+            earlier.chat_id == QueuedUpdate.chat_id,
+            earlier.id < QueuedUpdate.id,
+            earlier.status.in_(("pending", "processing"))
+        )
+        candidates = self.db_session.query(QueuedUpdate.id).filter(
+            QueuedUpdate.status == "pending",
+            or_(QueuedUpdate.chat_id == None, ~has_earlier_unfinished)
+        )
+        if partition is not None:
+            index, count = partition
+            if index == 0:
+                candidates = candidates.filter(or_(QueuedUpdate.chat_id == None, func.abs(QueuedUpdate.chat_id) % count == 0))
+            else:
+                candidates = candidates.filter(func.abs(QueuedUpdate.chat_id) % count == index)
+        candidates = candidates.order_by(QueuedUpdate.id).limit(batch_size)
+
+        if self.db_session.get_bind().dialect.name == "postgresql":
+            candidates = candidates.with_for_update(skip_locked=True)
+
+        candidate_ids = [row.id for row in candidates.all()]
+        if not candidate_ids:
+            self.db_session.commit()
+            return []
+
+        claimed = self.db_session.execute(
+            update(QueuedUpdate)
+            .where(QueuedUpdate.id.in_(candidate_ids), QueuedUpdate.status == "pending")
+            .values(
+                status="processing",
+                worker_id=worker_id,
+                claimed_at=datetime.datetime.now(timezone.utc),
+                attempts=QueuedUpdate.attempts + 1
+            )
+            .returning(QueuedUpdate.id, QueuedUpdate.payload)
+            .execution_options(synchronize_session=False)
+        ).all()
+        self.db_session.commit()
+        return sorted((row.id, json.loads(row.payload)) for row in claimed)
+
+    def acquire_partition(self, worker_id: str, partition: tuple[int, int], lease_seconds: int = PARTITION_LEASE_SECONDS) -> bool:
+        """
+        Takes the lease on a chat partition. Returns False while another worker holds it, or while any
+        worker with a different partition count is live, since its chats would overlap with ours.
+        """
+        index, count = partition
+        now = datetime.datetime.now(timezone.utc)
+        self.db_session.execute(delete(PartitionLease).where(PartitionLease.expires_at < now))
+        conflicting = or_(
+            PartitionLease.partition_count != count,
+            and_(PartitionLease.partition_index == index, PartitionLease.worker_id != worker_id)
+        )
+        if self.db_session.query(PartitionLease.partition_index).filter(conflicting).first():
+            self.db_session.commit()
+            return False
+        inserted = self.db_session.execute(
+            dialect_insert(PartitionLease, self.db_session.get_bind()).values(
+                partition_index=index,
+                partition_count=count,
+                worker_id=worker_id,
+                expires_at=now + datetime.timedelta(seconds=lease_seconds)
+            ).on_conflict_do_nothing(index_elements=["partition_index"])
+        ).rowcount
+        self.db_session.commit()
+        if not inserted:
+            return False
+        # Two workers with different partition counts can pass the check above at the same time; both back off
+        if self.db_session.query(PartitionLease.partition_index).filter(PartitionLease.partition_count != count).first():
+            self.release_partition(worker_id)
+            return False
+        return True
+
+    def renew_partition(self, worker_id: str, partition: tuple[int, int], lease_seconds: int = PARTITION_LEASE_SECONDS) -> bool:
+        """Extends this worker's lease. Returns False if the lease expired and may belong to another worker now."""
+        index, count = partition
+        now = datetime.datetime.now(timezone.utc)
+        renewed = self.db_session.execute(
+            update(PartitionLease)
+            .where(
+                PartitionLease.partition_index == index,
+                PartitionLease.partition_count == count,
+                PartitionLease.worker_id == worker_id,
+                PartitionLease.expires_at >= now
+            )
+            .values(expires_at=now + datetime.timedelta(seconds=lease_seconds))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db_session.commit()
+        return renewed == 1
+
+    def release_partition(self, worker_id: str):
+        self.db_session.execute(
+            delete(PartitionLease)
+            .where(PartitionLease.worker_id == worker_id)
+            .execution_options(synchronize_session=False)
+        )
+        self.db_session.commit()
+
+    def mark_done(self, queue_ids: list[int]):
+        if not queue_ids:
+            return
+        self.db_session.execute(
+            update(QueuedUpdate)
+            .where(QueuedUpdate.id.in_(queue_ids))
+            .values(status="done", last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+        self.db_session.commit()
+
+    def mark_failed(self, queue_id: int, error: str):
+        """Returns the update to the queue for another attempt, or parks it as failed after MAX_UPDATE_ATTEMPTS."""
+        queued = self.db_session.query(QueuedUpdate).filter(QueuedUpdate.id == queue_id).first()
+        if not queued:
+            return
+        queued.status = "failed" if queued.attempts >= MAX_UPDATE_ATTEMPTS else "pending"
+        queued.last_error = error
+        self.db_session.add(queued)
+        self.db_session.commit()
+        if queued.status == "failed":
+            logger.error(f"Update {queued.update_id} failed {queued.attempts} times and was parked: {error}")
+
+    def release_stale_claims(self, timeout_seconds: int = VISIBILITY_TIMEOUT_SECONDS) -> int:
+        """Hands updates claimed by crashed workers back to the queue."""
+        cutoff = datetime.datetime.now(timezone.utc) - datetime.timedelta(seconds=timeout_seconds)
+        released = self.db_session.execute(
+            update(QueuedUpdate)
+            .where(QueuedUpdate.status == "processing", QueuedUpdate.claimed_at < cutoff)
+            .values(status="pending", worker_id=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db_session.commit()
+        if released:
+            logger.warning(f"Released {released} stale update claim(s) back to the queue.")
+        return released
+
+    def purge_done(self, older_than_hours: int = 24) -> int:
+        """Deletes processed updates once they are outside Telegram's redelivery window."""
+        cutoff = datetime.datetime.now(timezone.utc) - datetime.timedelta(hours=older_than_hours)
+        purged = self.db_session.execute(
+            delete(QueuedUpdate)
+            .where(QueuedUpdate.status == "done", QueuedUpdate.created_at < cutoff)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db_session.commit()
+        return purged
+
+    def get_queue_depth(self) -> int:
+        return self.db_session.query(QueuedUpdate).filter(QueuedUpdate.status.in_(("pending", "processing"))).count()
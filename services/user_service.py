@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from models import User, SessionLocal
+from services.identity_service import invalidate_identity
 import datetime
 from datetime import timezone # Import timezone
 # Removed: from services import ReferralService # Moved inside function to break circular import
@@ -39,6 +40,7 @@ class UserService:
             self.db_session.add(user)
             self.db_session.commit()
             self.db_session.refresh(user)
+            invalidate_identity(telegram_id) # Drops a cached "not started yet" lookup
 
             # Create referral record AFTER user is created
             if referral_id and referral_id != telegram_id: # Prevent self-referral
@@ -58,5 +60,6 @@ class UserService:
     def update_user(self, user: User) -> User:
         self.db_session.add(user)
         self.db_session.commit()
+        invalidate_identity(user.telegram_id)
         self.db_session.refresh(user)
         return user
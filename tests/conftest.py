@@ -0,0 +1,52 @@
+import os
+import tempfile
+import pytest
+
+# models.base builds its engine from DATABASE_URL at import time, so point it at a throwaway SQLite file first.
+# Always overridden: the fixtures drop every table, so they must never run against a configured database.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+# Modules such as services.ocr_service refuse to import without credentials; tests never call out, so placeholders do.
+os.environ.setdefault("GEMINI_API_KEY", "test-gemini-key")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test-token")
+
+@pytest.fixture
+def db_session():
+    """A session on a freshly created schema, with the process-local caches emptied."""
+    from models import Base, SessionLocal
+    from models.base import engine
+    from services.category_cache import category_cache
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    category_cache._defaults = None
+    category_cache.custom.clear()
+    category_cache.keyboards.clear()
+    session = SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def profile(db_session):
+    """A free user with one profile and the default categories."""
+    from models import User, Profile, Category
+    user = User(telegram_id=1001, first_name="Test")
+    db_session.add(user)
+    db_session.flush()
+    profile = Profile(user_id=user.telegram_id, name="Personal", profile_type="personal", currency="NGN")
+    db_session.add(profile)
+    db_session.add_all([Category(name=name, profile_id=None) for name in ("Food", "Transport", "Other")])
+    db_session.flush()
+    user.current_profile_id = profile.id
+    db_session.commit()
+    return profile
+
+@pytest.fixture
+def count_statements():
+    """Records every SQL statement sent to the database while the fixture is active."""
+    from sqlalchemy import event
+    from models.base import engine
+    statements = []
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", _record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", _record)
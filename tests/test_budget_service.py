@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from models import Budget, BudgetDefinition
+from services.expense_service import ExpenseService
+
+def test_bulk_save_counts_each_expense_once_in_new_overall_window(db_session, profile):
+    definition = BudgetDefinition(profile_id=profile.id, category_id=None, amount=10000, period="monthly")
+    db_session.add(definition)
+    db_session.commit()
+
+    entries = [
+        {"amount": 1200, "description": "lunch", "category": "Food"},
+        {"amount": 300, "description": "bus", "category": "Transport"},
+        {"amount": 500, "description": "dinner", "category": "Food"},
+    ]
+    expense_service = ExpenseService(db_session)
+    assert expense_service.add_expenses_bulk(profile.id, entries) == 3
+
+    budget = db_session.query(Budget).filter(Budget.definition_id == definition.id).one()
+    db_session.refresh(budget)
+    assert budget.spent_amount == 2000
+    assert expense_service.budget_alerts == []
+
+def test_bulk_save_increments_existing_windows_by_their_own_share(db_session, profile):
+    food = next(category for category in ExpenseService(db_session).get_categories(profile.id) if category.name == "Food")
+    overall = BudgetDefinition(profile_id=profile.id, category_id=None, amount=10000, period="monthly")
+    food_budget = BudgetDefinition(profile_id=profile.id, category_id=food.id, amount=1000, period="monthly")
+    db_session.add_all([overall, food_budget])
+    db_session.commit()
+    ExpenseService(db_session).add_expense(profile.id, 100, "snack", category_id=food.id) # Creates both windows
+
+    expense_service = ExpenseService(db_session)
+    expense_service.add_expenses_bulk(profile.id, [
+        {"amount": 850, "description": "groceries", "category": "Food"},
+        {"amount": 300, "description": "bus", "category": "Transport"},
+    ])
+
+    budgets = {budget.definition_id: budget for budget in db_session.query(Budget).populate_existing().all()}
+    assert budgets[overall.id].spent_amount == 1250
+    assert budgets[food_budget.id].spent_amount == 950
+    assert [alert["threshold"] for alert in expense_service.budget_alerts] == [90]
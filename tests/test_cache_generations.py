@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from services.cache_generations import CacheGenerationWatch, bump_cache_generations, IDENTITY_CACHE, SUMMARY_CACHE
+from services.identity_service import identity_cache
+
+def test_bump_from_another_process_clears_the_local_cache(db_session):
+    watch = CacheGenerationWatch(interval=0)
+    watch.check(db_session) # First check only records the current generations
+    identity_cache.set(1001, "cached identity")
+
+    bump_cache_generations(db_session, IDENTITY_CACHE) # As a job in another process would
+    db_session.commit()
+    watch.check(db_session)
+
+    assert identity_cache.get(1001) is None
+    assert watch.clears == 1
+
+def test_unchanged_generations_leave_the_cache_alone(db_session):
+    bump_cache_generations(db_session, SUMMARY_CACHE)
+    db_session.commit()
+    watch = CacheGenerationWatch(interval=0)
+    watch.check(db_session)
+    identity_cache.set(1001, "cached identity")
+
+    watch.check(db_session)
+
+    assert identity_cache.get(1001) == "cached identity"
+    identity_cache.clear()
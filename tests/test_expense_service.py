@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from models import SessionLocal, WriteSessionLocal
+from services.category_cache import category_cache
+from services.expense_service import ExpenseService
+
+def _save_from_category_keyboard(session_factory, profile_id, category_id, count_statements):
+    """What select_category does once the draft is in hand: look up the category, then write the expense."""
+    db_session = session_factory()
+    try:
+        count_statements.clear()
+        category = category_cache.find(db_session, profile_id, category_id)
+        expense = ExpenseService(db_session).add_expense(profile_id, 1500, "lunch", category.id)
+        saved = (expense.id is not None, expense.amount, expense.category_id)
+        return saved, list(count_statements)
+    finally:
+        db_session.close()
+
+def test_expense_save_reads_nothing_back_after_commit(db_session, profile, count_statements):
+    profile_id = profile.id
+    # The category keyboard shown before the save has already loaded the categories
+    food = next(category for category in category_cache.get_categories(db_session, profile_id) if category.name == "Food")
+
+    saved, statements = _save_from_category_keyboard(WriteSessionLocal, profile_id, food.id, count_statements)
+
+    assert saved == (True, 1500, food.id)
+    # INSERT ... RETURNING, the monthly usage counter upsert and the budget definitions lookup
+    assert len(statements) == 3, statements
+    assert statements[0].lstrip().upper().startswith("INSERT INTO EXPENSES")
+
+def test_default_session_refreshes_the_written_expense_after_commit(db_session, profile, count_statements):
+    profile_id = profile.id
+    food = next(category for category in category_cache.get_categories(db_session, profile_id) if category.name == "Food")
+
+    _, statements = _save_from_category_keyboard(SessionLocal, profile_id, food.id, count_statements)
+
+    # Same writes plus the SELECT that reloads the expired expense
+    assert len(statements) == 4, statements
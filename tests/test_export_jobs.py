@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("telegram")
+
+from jobs.export_jobs import ExportJob, ExportJobManager
+
+def _job(user_id: int) -> ExportJob:
+    return ExportJob(user_id=user_id, chat_id=user_id, message_id=1, profile_id=1, profile_name="Personal", fmt="csv", label="All Time")
+
+def test_per_user_limit_holds_across_processes(db_session):
+    # Two managers stand in for two worker processes sharing the database
+    first_process, second_process = ExportJobManager(max_per_user=1), ExportJobManager(max_per_user=1)
+    running = _job(1001)
+
+    assert first_process._claim(running)
+    assert not second_process._claim(_job(1001))
+    assert second_process._claim(_job(1002))
+    assert second_process.active_jobs_for(1001) == [running.job_id]
+
+    first_process._release(running)
+    assert second_process._claim(_job(1001))
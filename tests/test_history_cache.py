@@ -0,0 +1,36 @@
+import datetime
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("numpy")
+
+from models import Expense
+from services.history_cache import HistoryCache
+
+WINDOW = (datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc), datetime.datetime(2100, 1, 1, tzinfo=datetime.timezone.utc))
+
+def _commit_expense(db_session, profile_id: int):
+    expense = Expense(profile_id=profile_id, amount=500, description="lunch", date=datetime.datetime.now(datetime.timezone.utc))
+    db_session.add(expense)
+    db_session.commit()
+    return (expense.date, expense.amount, expense.category_id)
+
+def test_write_is_appended_to_a_history_loaded_before_it(db_session, profile):
+    cache = HistoryCache(enabled=True)
+    history = cache.get(db_session, profile.id)
+
+    version = cache.begin_write(profile.id)
+    cache.record_expenses(profile.id, [_commit_expense(db_session, profile.id)], version)
+
+    assert cache.get(db_session, profile.id) is history
+    assert history.totals(*WINDOW)["num_expense_entries"] == 1
+
+def test_history_loaded_after_the_commit_does_not_get_the_rows_twice(db_session, profile):
+    cache = HistoryCache(enabled=True)
+
+    version = cache.begin_write(profile.id)
+    row = _commit_expense(db_session, profile.id)
+    cache.get(db_session, profile.id) # A reader loads between the commit and record_expenses
+    cache.record_expenses(profile.id, [row], version)
+
+    assert cache.get(db_session, profile.id).totals(*WINDOW)["num_expense_entries"] == 1
@@ -0,0 +1,24 @@
+import io
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from models import Expense
+from services.expense_service import FREE_MONTHLY_EXPENSE_LIMIT
+from services.import_service import ImportService, import_csv_file
+
+def _csv(rows: int, month: str = "2024-03") -> io.BytesIO:
+    lines = ["Date,Amount,Description"] + [f"{month}-{1 + i % 28:02d},{100 + i},item {i}" for i in range(rows)]
+    return io.BytesIO("\n".join(lines).encode("utf-8"))
+
+def test_file_that_fails_partway_saves_nothing(db_session, profile):
+    rows = _csv(2500).getvalue() + b"\n2024-03-05,100,caf\xe9\n" # A Latin-1 byte after two full batches were written
+    with pytest.raises(UnicodeDecodeError):
+        import_csv_file(profile.id, io.BytesIO(rows), is_pro=True)
+
+    db_session.expire_all()
+    assert db_session.query(Expense).filter(Expense.profile_id == profile.id).count() == 0
+
+def test_pro_import_is_not_limited(db_session, profile):
+    result = ImportService(db_session).import_csv(profile.id, _csv(FREE_MONTHLY_EXPENSE_LIMIT + 10), is_pro=True)
+    assert result.accepted == FREE_MONTHLY_EXPENSE_LIMIT + 10
@@ -0,0 +1,28 @@
+import datetime
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("numpy")
+
+from models import Expense, Insight
+from services.insight_service import InsightService
+from utils.datetime_utils import WAT
+
+def _spend(db_session, profile_id, day, amount, category_id=None):
+    at = datetime.datetime.combine(day, datetime.time(12), tzinfo=WAT).astimezone(datetime.timezone.utc)
+    db_session.add(Expense(profile_id=profile_id, amount=amount, description="spend", category_id=category_id, date=at))
+
+def test_rerunning_a_day_does_not_duplicate_uncategorized_spikes(db_session, profile):
+    day = datetime.date.today() - datetime.timedelta(days=1)
+    for days_back in range(1, 11):
+        _spend(db_session, profile.id, day - datetime.timedelta(days=days_back), 1000 + days_back)
+    _spend(db_session, profile.id, day, 20000)
+    db_session.commit()
+
+    insight_service = InsightService(db_session)
+    assert insight_service.detect_anomalies(day) == 1
+    assert insight_service.detect_anomalies(day) == 0
+
+    insights = db_session.query(Insight).filter(Insight.profile_id == profile.id).all()
+    assert len(insights) == 1
+    assert insights[0].category_id is None
@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("telegram")
+
+from models import JobRun
+from jobs.job_locks import single_run_job
+
+SLOT_SECONDS = 10 ** 9 # One slot for the whole test run, so a slot boundary can't split the two invocations
+
+def test_concurrent_invocations_in_one_slot_run_the_job_once(db_session):
+    runs = []
+
+    @single_run_job("test_concurrent_job", slot_seconds=SLOT_SECONDS)
+    async def job(context):
+        runs.append(context)
+        await asyncio.sleep(0.05) # Hold the lock while the other invocation tries to take it
+
+    async def run_both():
+        await asyncio.gather(job("first"), job("second"))
+
+    asyncio.run(run_both())
+
+    assert len(runs) == 1
+    assert db_session.query(JobRun).filter(JobRun.job_name == "test_concurrent_job").count() == 1
+
+def test_later_invocation_in_the_same_slot_is_skipped(db_session):
+    runs = []
+
+    @single_run_job("test_sequential_job", slot_seconds=SLOT_SECONDS)
+    async def job(context):
+        runs.append(context)
+
+    asyncio.run(job("first"))
+    asyncio.run(job("second"))
+
+    assert runs == ["first"]
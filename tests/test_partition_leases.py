@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from services import UpdateQueueService
+
+def test_a_partition_has_one_owner_until_its_lease_is_released(db_session):
+    queue_service = UpdateQueueService(db_session)
+
+    assert queue_service.acquire_partition("worker-a", (0, 2))
+    assert not queue_service.acquire_partition("worker-b", (0, 2))
+    assert queue_service.acquire_partition("worker-b", (1, 2))
+    assert queue_service.renew_partition("worker-a", (0, 2))
+
+    queue_service.release_partition("worker-a")
+    assert not queue_service.renew_partition("worker-a", (0, 2))
+    assert queue_service.acquire_partition("worker-c", (0, 2))
+
+def test_expired_lease_is_handed_to_another_worker(db_session):
+    queue_service = UpdateQueueService(db_session)
+
+    assert queue_service.acquire_partition("worker-a", (0, 2), lease_seconds=-1)
+    assert queue_service.acquire_partition("worker-b", (0, 2))
+    assert not queue_service.renew_partition("worker-a", (0, 2))
+
+def test_no_partition_is_handed_out_while_a_different_partition_count_is_live(db_session):
+    queue_service = UpdateQueueService(db_session)
+
+    assert queue_service.acquire_partition("worker-a", (0, 2))
+    # abs(chat_id) % 3 == 1 overlaps both partitions of the two-way split
+    assert not queue_service.acquire_partition("worker-b", (1, 3))
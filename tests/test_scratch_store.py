@@ -0,0 +1,18 @@
+from utils.scratch_store import scratch_set, scratch_get, sweep_scratch_store
+
+def test_sweep_reports_which_users_lost_entries():
+    all_user_data = {1: {}, 2: {}, 3: {}}
+    scratch_set(all_user_data[1], "expense_draft", {"amount": 100}, ttl=-1)
+    scratch_set(all_user_data[1], "budget_draft", {"period": "monthly"}, ttl=-1)
+    scratch_set(all_user_data[2], "expense_draft", {"amount": 200}, ttl=600)
+
+    evicted_by_user = sweep_scratch_store(all_user_data)
+
+    assert evicted_by_user == {1: 2}
+    assert scratch_get(all_user_data[1], "expense_draft") is None
+    assert scratch_get(all_user_data[2], "expense_draft") == {"amount": 200}
+
+def test_sweep_with_nothing_expired_returns_no_users():
+    all_user_data = {1: {}}
+    scratch_set(all_user_data[1], "expense_draft", {"amount": 100})
+    assert sweep_scratch_store(all_user_data) == {}
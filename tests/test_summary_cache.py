@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from services.summary_cache import SummaryCache, SUMMARY_GENERATIONS_PER_ENTRY
+
+def test_generations_stay_bounded():
+    cache = SummaryCache(maxsize=2)
+    for profile_id in range(10 * cache.max_generations):
+        cache.invalidate(profile_id)
+    assert len(cache._generations) <= cache.max_generations == 2 * SUMMARY_GENERATIONS_PER_ENTRY
+
+def test_starting_over_never_serves_a_summary_from_before_a_write():
+    cache = SummaryCache(maxsize=2)
+    stale_key = cache._key(1, "daily")
+    cache._results.set(stale_key, {"total_expenses": 100})
+    cache.invalidate(1)
+    for profile_id in range(2, cache.max_generations + 2):
+        cache.invalidate(profile_id) # Forces a start-over, which resets profile 1's generation
+
+    assert cache._key(1, "daily") != stale_key
+    assert cache._results.get(cache._key(1, "daily")) is None
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from services import UpdateDeduplicator
+
+def test_update_is_dropped_while_in_flight_and_after_it_was_processed(db_session):
+    deduplicator = UpdateDeduplicator(use_shared_table=True)
+
+    assert deduplicator.begin(1)
+    assert not deduplicator.begin(1)
+    deduplicator.mark_processed(1)
+    assert not deduplicator.begin(1)
+    # Another process only has the shared table to go on
+    assert not UpdateDeduplicator(use_shared_table=True).begin(1)
+
+def test_failed_update_can_be_delivered_again(db_session):
+    deduplicator = UpdateDeduplicator(use_shared_table=True)
+
+    assert deduplicator.begin(2)
+    deduplicator.release(2)
+    assert deduplicator.begin(2)
+    assert UpdateDeduplicator(use_shared_table=True).begin(2)
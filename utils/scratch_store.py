@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_KEY = '_scratch' # Lives inside user_data so it is persisted with it
+SCRATCH_TTL_SECONDS = int(os.getenv("SCRATCH_TTL_SECONDS", "1800")) # Entries older than this are evicted
+SCRATCH_MAX_BYTES_PER_USER = int(os.getenv("SCRATCH_MAX_BYTES_PER_USER", "262144")) # Oldest entries are evicted past this size
+
+# Footprint gauge, refreshed by sweep_scratch_store
+_scratch_stats = {"users": 0, "entries": 0, "bytes": 0, "evicted_total": 0}
+
+def _entries(user_data: dict) -> dict:
+    return user_data.setdefault(SCRATCH_KEY, {})
+
+def _value_size(value) -> int:
+    return len(json.dumps(value, default=str))
+
+def scratch_set(user_data: dict, key: str, value, ttl: int = SCRATCH_TTL_SECONDS) -> bool:
+    """
+    Stores a temporary per-user value. Values must be JSON-serializable so they survive persistence.
+    Returns False if the value alone exceeds the per-user cap.
+    """
+    size = _value_size(value)
+    if size > SCRATCH_MAX_BYTES_PER_USER:
+        logger.warning(f"Scratch value '{key}' is {size} bytes, over the {SCRATCH_MAX_BYTES_PER_USER} byte cap; not stored.")
+        return False
+
+    entries = _entries(user_data)
+    now = time.time()
+    entries[key] = {"value": value, "expires_at": now + ttl, "size": size, "stored_at": now}
+
+    # Evict the oldest entries until the user is back under the cap
+    total = sum(entry["size"] for entry in entries.values())
+    for old_key in sorted(entries, key=lambda k: entries[k]["stored_at"]):
+        if total <= SCRATCH_MAX_BYTES_PER_USER:
+            break
+        if old_key == key:
+            continue
+        total -= entries.pop(old_key)["size"]
+        _scratch_stats["evicted_total"] += 1
+    return True
+
+def scratch_get(user_data: dict, key: str, default=None):
+    entries = user_data.get(SCRATCH_KEY)
+    if not entries or key not in entries:
+        return default
+    if entries[key]["expires_at"] < time.time():
+        del entries[key]
+        _scratch_stats["evicted_total"] += 1
+        return default
+    return entries[key]["value"]
+
+def scratch_pop(user_data: dict, key: str, default=None):
+    value = scratch_get(user_data, key, default)
+    entries = user_data.get(SCRATCH_KEY)
+    if entries:
+        entries.pop(key, None)
+    return value
+
+def scratch_clear(user_data: dict, *keys: str):
+    """Drops the given scratch keys, or every scratch entry if no keys are given. Called when a conversation ends."""
+    entries = user_data.get(SCRATCH_KEY)
+    if not entries:
+        return
+    if not keys:
+        entries.clear()
+        return
+    for key in keys:
+        entries.pop(key, None)
+
+def sweep_scratch_store(all_user_data) -> dict:
+    """
+    Evicts expired entries for every user and refreshes the footprint gauge.
+    Returns {user_id: number evicted} for the users that lost entries.
+    """
+    now = time.time()
+    evicted_by_user = {}
+    users = entries_count = total_bytes = 0
+    for user_id, user_data in all_user_data.items():
+        entries = user_data.get(SCRATCH_KEY)
+        if not entries:
+            continue
+        expired = [k for k, entry in entries.items() if entry["expires_at"] < now]
+        for key in expired:
+            del entries[key]
+        if expired:
+            evicted_by_user[user_id] = len(expired)
+        if entries:
+            users += 1
+            entries_count += len(entries)
+            total_bytes += sum(entry["size"] for entry in entries.values())
+
+    _scratch_stats.update(users=users, entries=entries_count, bytes=total_bytes)
+    _scratch_stats["evicted_total"] += sum(evicted_by_user.values())
+    return evicted_by_user
+
+def get_scratch_stats() -> dict:
+    return dict(_scratch_stats)
@@ -4,7 +4,8 @@ import io
 import os
 import numpy as np
 from PIL import Image, ImageFilter
-from matplotlib.patches import Patch # Import Patch for custom legend
+from matplotlib.patches import Patch, Rectangle # Patch for custom legends, Rectangle to outline heatmap cells
+from matplotlib.figure import Figure
 
 class VisualsService:
     def __init__(self):
@@ -190,6 +191,64 @@ class VisualsService:
         gc.collect()
         return img_byte_arr.getvalue()
     
+    def generate_trend_chart(self, dates: list, amounts, title: str, currency_symbol: str = "₦", rolling_days: int = 7):
+        """
+        Line chart of daily spending with a rolling average. Built on a standalone Figure rather
+        than pyplot, so it is safe to render in a worker thread.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        fig = Figure(figsize=(10, 4))
+        ax = fig.subplots()
+        if not amounts.size or not amounts.any():
+            ax.text(0.5, 0.5, "No data available", horizontalalignment='center', verticalalignment='center', transform=ax.transAxes, fontsize=14)
+            ax.set_axis_off()
+        else:
+            x_pos = np.arange(amounts.size)
+            ax.plot(x_pos, amounts, marker='o', markersize=3, linewidth=1.5, label='Daily spending')
+            ax.fill_between(x_pos, amounts, alpha=0.15)
+            if amounts.size >= rolling_days:
+                rolling = np.convolve(amounts, np.ones(rolling_days) / rolling_days, mode='valid')
+                ax.plot(x_pos[rolling_days - 1:], rolling, linestyle='--', linewidth=2, label=f'{rolling_days}-day average')
+            tick_step = max(1, amounts.size // 10)
+            ax.set_xticks(x_pos[::tick_step])
+            ax.set_xticklabels([day.strftime('%d %b') for day in dates[::tick_step]], rotation=45, ha='right')
+            ax.set_ylabel(f'Amount ({currency_symbol})')
+            ax.grid(axis='y', alpha=0.3)
+            ax.legend()
+        ax.set_title(title)
+        fig.tight_layout()
+        img_byte_arr = io.BytesIO()
+        fig.savefig(img_byte_arr, format='png', bbox_inches='tight')
+        return img_byte_arr.getvalue()
+
+    def generate_heatmap(self, grid, title: str, currency_symbol: str = "₦"):
+        """
+        Weekday by hour heatmap of a 7x24 grid (row 0 = Monday). Built on a standalone Figure, so it is
+        safe to render in a worker thread.
+        """
+        grid = np.asarray(grid, dtype=np.float64)
+        fig = Figure(figsize=(12, 4.5))
+        ax = fig.subplots()
+        if not grid.any():
+            ax.text(0.5, 0.5, "No data available", horizontalalignment='center', verticalalignment='center', transform=ax.transAxes, fontsize=14)
+            ax.set_axis_off()
+        else:
+            image = ax.imshow(grid, aspect='auto', cmap='YlOrRd', interpolation='nearest')
+            ax.set_yticks(np.arange(7))
+            ax.set_yticklabels(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
+            ax.set_xticks(np.arange(24))
+            ax.set_xticklabels([f'{hour:02d}' for hour in range(24)])
+            ax.set_xlabel('Hour of day (WAT)')
+            colorbar = fig.colorbar(image, ax=ax)
+            colorbar.set_label(f'Amount spent ({currency_symbol})')
+            peak_day, peak_hour = np.unravel_index(np.argmax(grid), grid.shape)
+            ax.add_patch(Rectangle((peak_hour - 0.5, peak_day - 0.5), 1, 1, fill=False, edgecolor='black', linewidth=2))
+        ax.set_title(title)
+        fig.tight_layout()
+        img_byte_arr = io.BytesIO()
+        fig.savefig(img_byte_arr, format='png', bbox_inches='tight')
+        return img_byte_arr.getvalue()
+
     def blur_image(self, image_bytes: bytes, radius: int = 10) -> bytes:
         img = Image.open(io.BytesIO(image_bytes))
         blurred_img = img.filter(ImageFilter.GaussianBlur(radius))
@@ -0,0 +1,221 @@
+import os
+import sys
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import contextvars
+import multiprocessing
+import time
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+from models import SessionLocal
+from services import UpdateQueueService
+from services.update_queue_service import CLAIM_BATCH_SIZE, PARTITION_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+os.environ.setdefault("UPDATE_INGRESS_MODE", "queue") # Workers only ever serve the queue; main_webhook reads this when imported
+
+POLL_INTERVAL_SECONDS = 0.5 # How long an idle worker waits before polling the queue again
+MAINTENANCE_INTERVAL_SECONDS = 60 # How often stale claims are released and old rows purged
+LEASE_RENEW_INTERVAL_SECONDS = PARTITION_LEASE_SECONDS / 3 # Renewing well inside the lease survives a missed renewal
+
+# Errors raised by handlers for the update the current task is processing
+_handler_errors: contextvars.ContextVar = contextvars.ContextVar("handler_errors")
+
+async def record_handler_error(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """
+    PTB passes handler exceptions to error handlers instead of raising them from process_update.
+    Keep them for the queued update so the worker can retry or park it.
+    """
+    errors = _handler_errors.get(None)
+    if errors is not None:
+        errors.append(context.error)
+    logger.error("Handler raised while processing an update.", exc_info=context.error)
+
+async def process_queued_update(application: Application, update_json: dict):
+    update = Update.de_json(update_json, application.bot)
+    errors = []
+    _handler_errors.set(errors) # gather runs each update in its own task, so each gets its own list
+    await application.process_update(update)
+    if errors:
+        raise errors[0]
+
+def _call_queue_service(method_name: str, *args):
+    """Runs one UpdateQueueService call on its own session; used from threads so the event loop keeps going."""
+    db_session = SessionLocal()
+    try:
+        return getattr(UpdateQueueService(db_session), method_name)(*args)
+    finally:
+        db_session.close()
+
+async def _wait_for_partition_lease(worker_id: str, partition: tuple[int, int], stop_event: asyncio.Event) -> bool:
+    """
+    Waits until this worker holds its partition's lease. During a restart or a rolling deploy the previous
+    owner keeps the lease until it has flushed its persisted state, so the state loaded afterwards is current.
+    """
+    while not stop_event.is_set():
+        try:
+            if await asyncio.to_thread(_call_queue_service, "acquire_partition", worker_id, partition):
+                return True
+        except Exception as e:
+            logger.error(f"Worker {worker_id} could not take the lease on partition {partition}: {e}")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=LEASE_RENEW_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+    return False
+
+async def _keep_partition_lease(worker_id: str, partition: tuple[int, int], lease_lost: asyncio.Event):
+    """Renews the partition lease in the background, so long batches don't let it lapse."""
+    last_renewed = time.monotonic()
+    while True:
+        await asyncio.sleep(LEASE_RENEW_INTERVAL_SECONDS)
+        try:
+            if not await asyncio.to_thread(_call_queue_service, "renew_partition", worker_id, partition):
+                break
+            last_renewed = time.monotonic()
+        except Exception as e:
+            logger.error(f"Worker {worker_id} could not renew the lease on partition {partition}: {e}")
+            if time.monotonic() - last_renewed >= PARTITION_LEASE_SECONDS:
+                break
+    logger.error(f"Worker {worker_id} lost the lease on partition {partition}.")
+    lease_lost.set()
+
+async def run_worker(worker_id: str, batch_size: int, partition: tuple[int, int] = None):
+    """
+    Claims updates from the update queue in batches and runs them through the PTB handlers.
+    The worker only sees its own partition of chats and holds that partition's lease in the database,
+    so in-progress conversations and user_data always live in exactly one process, across hosts too.
+    """
+    from main_webhook import build_ptb_application # Imported here so each spawned process builds its own Application
+
+    telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not telegram_bot_token:
+        raise ValueError("TELEGRAM_BOT_TOKEN is not set.")
+    partition = partition or (0, 1)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # Persisted state is loaded by initialize(), so take the lease first
+    if not await _wait_for_partition_lease(worker_id, partition, stop_event):
+        return
+    lease_lost = asyncio.Event()
+    try:
+        application = build_ptb_application(telegram_bot_token)
+        application.add_error_handler(record_handler_error)
+        await application.initialize()
+        await application.start()
+        lease_keeper = asyncio.create_task(_keep_partition_lease(worker_id, partition, lease_lost))
+        logger.info(f"Update worker {worker_id} started on partition {partition}.")
+
+        last_maintenance = 0.0
+        try:
+            while not stop_event.is_set() and not lease_lost.is_set():
+                db_session = SessionLocal()
+                queue_service = UpdateQueueService(db_session)
+                try:
+                    if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL_SECONDS:
+                        queue_service.release_stale_claims()
+                        queue_service.purge_done()
+                        last_maintenance = time.monotonic()
+
+                    claimed = queue_service.claim_batch(worker_id, batch_size, partition)
+                    if not claimed:
+                        db_session.close()
+                        try:
+                            await asyncio.wait_for(stop_event.wait(), timeout=POLL_INTERVAL_SECONDS)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+
+                    # A batch holds at most one update per chat, so the whole batch can run concurrently
+                    results = await asyncio.gather(
+                        *(process_queued_update(application, update_json) for _, update_json in claimed),
+                        return_exceptions=True
+                    )
+
+                    done_ids = []
+                    for (queue_id, update_json), result in zip(claimed, results):
+                        if isinstance(result, Exception):
+                            logger.error(f"Worker {worker_id} failed to process update {update_json.get('update_id')}: {result}")
+                            queue_service.mark_failed(queue_id, repr(result))
+                        else:
+                            done_ids.append(queue_id)
+                    queue_service.mark_done(done_ids)
+                finally:
+                    db_session.close()
+        finally:
+            lease_keeper.cancel()
+            if lease_lost.is_set() and application.persistence:
+                application.persistence.discard_writes() # The chats may have a new owner; don't overwrite its state
+            await application.stop()
+            await application.shutdown()
+            logger.info(f"Update worker {worker_id} stopped.")
+    finally:
+        # Released only after shutdown has flushed persisted state, so the next owner loads it
+        await asyncio.to_thread(_call_queue_service, "release_partition", worker_id)
+
+    if lease_lost.is_set():
+        raise RuntimeError(f"Worker {worker_id} lost the lease on partition {partition}.") # Exits so the process is restarted
+
+def _worker_main(worker_id: str, batch_size: int, partition: tuple[int, int] = None):
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    asyncio.run(run_worker(worker_id, batch_size, partition))
+
+def _start_worker_process(hostname: str, index: int, count: int, batch_size: int) -> multiprocessing.Process:
+    process = multiprocessing.Process(
+        target=_worker_main,
+        args=(f"{hostname}-{os.getpid()}-{index}", batch_size, (index, count)),
+        name=f"update-worker-{index}"
+    )
+    process.start()
+    return process
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process queued Telegram updates (UPDATE_INGRESS_MODE=queue).")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("UPDATE_WORKER_PROCESSES", "2")))
+    parser.add_argument("--batch-size", type=int, default=CLAIM_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    # Prepare the schema once, before any worker loads its persisted state from bot_state
+    from main_webhook import prepare_database
+    prepare_database()
+
+    hostname = socket.gethostname()
+    if args.processes <= 1:
+        _worker_main(f"{hostname}-{os.getpid()}-0", args.batch_size)
+        return
+
+    # Each process owns one partition of chats (see UpdateQueueService.acquire_partition); a partition must always have a live worker
+    processes = [_start_worker_process(hostname, index, args.processes, args.batch_size) for index in range(args.processes)]
+    stopping = False
+
+    def _terminate(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+    while not stopping:
+        for index, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                logger.warning(f"Update worker {index} exited with code {process.exitcode}; restarting it.")
+                processes[index] = _start_worker_process(hostname, index, args.processes, args.batch_size)
+        time.sleep(1)
+    for process in processes:
+        process.join()
+
+# To run the update workers: python worker.py --processes 4
+if __name__ == "__main__":
+    main(sys.argv[1:])